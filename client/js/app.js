@@ -6,6 +6,18 @@ const App = (() => {
     let currentScreen = 'enrollment';
     let studentData = null;
     let activeSession = null;
+    let activeSessions = [];  // every running session, from /api/session/active
+    let pendingCheckIn = null;  // sent but not yet answered, for a retry when told to wait
+    let activeEtag = null;  // ETag of the last /api/session/active response
+
+    // The lecturer's QR opens this page as /?qr=<token>. The token rotates,
+    // so a check-in needs a fresh scan; "<session id>.<window>.<signature>"
+    // also says which session was scanned.
+    let scannedToken = new URLSearchParams(location.search).get('qr') || '';
+
+    function scannedSessionId() {
+        return parseInt(scannedToken.split('.')[0], 10);
+    }
 
     // ─── DOM Helpers ───
     function $(sel) { return document.querySelector(sel); }
@@ -91,25 +103,54 @@ const App = (() => {
     }
 
     // ─── Check for Active Session ───
+    // Session start/end is pushed over the socket; this is the fallback for
+    // when the socket is down. Conditional requests make repeat polls a 304.
     async function checkForActiveSession() {
         try {
-            const res = await fetch('/api/session/active');
-            const data = await res.json();
+            const headers = activeEtag ? { 'If-None-Match': activeEtag } : {};
+            const res = await fetch('/api/session/active', { headers });
+            if (res.status === 304) return;
 
-            if (data.active && data.session) {
-                activeSession = data.session;
-                updateSessionDisplay(activeSession);
-                $('#btn-checkin').disabled = false;
-            } else {
-                activeSession = null;
-                updateSessionDisplay(null);
-                $('#btn-checkin').disabled = true;
-            }
+            activeEtag = res.headers.get('ETag');
+            const data = await res.json();
+            activeSessions = data.sessions || (data.active ? [data.session] : []);
+            setActiveSession(chooseSession());
         } catch (err) {
             console.warn('Could not check session:', err);
         }
     }
 
+    // Several courses can run at once. The student picks one (or opens the
+    // app with ?course=CSC301) and the choice is remembered.
+    let preferredCourse = new URLSearchParams(location.search).get('course')
+        || localStorage.getItem('preferred_course') || '';
+
+    function chooseSession() {
+        return activeSessions.find(s => s.id === scannedSessionId())
+            || activeSessions.find(s => s.course_code === preferredCourse)
+            || activeSessions.find(s => activeSession && s.id === activeSession.id)
+            || (activeSessions.length === 1 ? activeSessions[0] : null);
+    }
+
+    function pickCourse(courseCode) {
+        preferredCourse = courseCode;
+        localStorage.setItem('preferred_course', courseCode);
+        setActiveSession(chooseSession());
+    }
+
+    function setActiveSession(session) {
+        if (activeSession && (!session || session.id !== activeSession.id)) {
+            SocketManager.emit('leave_session', { session_id: activeSession.id });
+        }
+        if (session && (!activeSession || session.id !== activeSession.id)) {
+            SocketManager.emit('join_session', { session_id: session.id });
+        }
+
+        activeSession = session;
+        updateSessionDisplay(activeSession);
+        $('#btn-checkin').disabled = !activeSession;
+    }
+
     function updateSessionDisplay(session) {
         const banner = $('#session-info');
         if (session) {
@@ -118,6 +159,17 @@ const App = (() => {
         <div class="session-status">📡 Session active • ${session.attendance_count || 0} checked in</div>
       `;
             banner.style.display = 'block';
+        } else if (activeSessions.length > 1) {
+            banner.innerHTML = `
+        <div class="session-status">Choose your class</div>
+        ${activeSessions.map(s => `
+          <button class="btn btn-secondary btn-sm" data-course="${s.course_code}">${s.course_code}</button>
+        `).join('')}
+      `;
+            banner.querySelectorAll('[data-course]').forEach(btn => {
+                btn.addEventListener('click', () => pickCourse(btn.dataset.course));
+            });
+            banner.style.display = 'block';
         } else {
             banner.innerHTML = `
         <div class="session-status">No active session</div>
@@ -131,15 +183,101 @@ const App = (() => {
             showAlert('No active session or not enrolled.', 'warning');
             return;
         }
+        if (scannedSessionId() !== activeSession.id) {
+            showAlert(`Scan the QR code for ${activeSession.course_code} to check in.`, 'warning');
+            return;
+        }
 
         const btn = $('#btn-checkin');
         btn.disabled = true;
 
-        // Use WebSocket for real-time check-in
-        SocketManager.emit('check_in', {
+        // The key lets the server recognise this check-in if it is sent again
+        const checkIn = {
+            idempotency_key: DeviceUUID.generateUUID(),
             student_id: studentData.student_id,
             device_uuid: DeviceUUID.get(),
-            session_token: activeSession.session_token
+            session_token: scannedToken,
+            captured_at: new Date().toISOString()
+        };
+
+        pendingCheckIn = checkIn;
+        sendCheckIn(checkIn);
+    }
+
+    // Use WebSocket for real-time check-in; without one, HTTP, which the
+    // service worker queues for later if the network is down
+    function sendCheckIn(checkIn) {
+        if (SocketManager.connected()) {
+            SocketManager.emit('check_in', checkIn);
+        } else {
+            checkInOverHttp(checkIn);
+        }
+    }
+
+    async function checkInOverHttp(checkIn) {
+        try {
+            const res = await fetch('/api/check-in', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(checkIn)
+            });
+            const data = await res.json();
+            if (res.status === 202) {
+                showAlert(data.message, 'warning');
+                markCheckedIn('⏳', 'Queued');
+            } else {
+                showCheckInResult(res.ok ? { success: true, message: data.message } : data);
+            }
+        } catch (err) {
+            showAlert('Network error. Make sure you are connected to the server.', 'error');
+            $('#btn-checkin').disabled = false;
+        }
+    }
+
+    function showCheckInResult(data) {
+        if (data.success) {
+            pendingCheckIn = null;
+            showAlert(data.message, 'success');
+            markCheckedIn('✅', 'Checked In');
+        } else if (data.retry_after != null && pendingCheckIn) {
+            // Turned away under load: send the same check-in (same key) again when told
+            const checkIn = pendingCheckIn;
+            showAlert(`${data.error}. Retrying in ${Math.ceil(data.retry_after)}s...`, 'warning');
+            setTimeout(() => sendCheckIn(checkIn), data.retry_after * 1000);
+        } else {
+            pendingCheckIn = null;
+            showAlert(data.error, 'error');
+            $('#btn-checkin').disabled = false;
+        }
+    }
+
+    function markCheckedIn(icon, label) {
+        const btn = $('#btn-checkin');
+        btn.disabled = true;
+        btn.querySelector('.icon').textContent = icon;
+        btn.querySelector('.label').textContent = label;
+    }
+
+    // ─── Offline Queue ───
+    // Ask the service worker to send check-ins it queued while offline
+    function flushQueuedCheckIns() {
+        if (navigator.serviceWorker && navigator.serviceWorker.controller) {
+            navigator.serviceWorker.controller.postMessage({ type: 'flush-check-ins' });
+        }
+    }
+
+    function handleQueuedResults(results) {
+        results.forEach(result => {
+            if (result.status === 200 || result.status === 201) {
+                showCheckInResult({
+                    success: true,
+                    message: `Queued check-in recorded as ${result.attendance.status}`
+                });
+            } else if (result.status === 409) {
+                showCheckInResult({ success: true, message: 'Already checked in for this session' });
+            } else {
+                showAlert(`Queued check-in not recorded: ${result.error}`, 'error');
+            }
         });
     }
 
@@ -147,35 +285,43 @@ const App = (() => {
     function setupSocketListeners() {
         SocketManager.on('connectionChange', (connected) => {
             updateStatus(connected);
+            if (connected && activeSession) {
+                // Rooms do not survive a reconnect
+                SocketManager.emit('join_session', { session_id: activeSession.id });
+            }
             if (connected && currentScreen === 'checkin') {
                 checkForActiveSession();
             }
+            if (connected) {
+                flushQueuedCheckIns();
+            }
         });
 
-        SocketManager.on('check_in_response', (data) => {
-            const btn = $('#btn-checkin');
-            if (data.success) {
-                showAlert(data.message, 'success');
-                btn.disabled = true;
-                btn.querySelector('.icon').textContent = '✅';
-                btn.querySelector('.label').textContent = 'Checked In';
-            } else {
-                showAlert(data.error, 'error');
-                btn.disabled = false;
-            }
+        SocketManager.on('check_in_response', showCheckInResult);
+
+        // Our server worker missed broadcasts, maybe a session start or end: ask again
+        SocketManager.on('resync', () => {
+            if (currentScreen === 'checkin') checkForActiveSession();
         });
 
-        SocketManager.on('session_update', (data) => {
-            if (data.action === 'started') {
-                activeSession = data.session;
-                updateSessionDisplay(activeSession);
-                $('#btn-checkin').disabled = false;
+        SocketManager.on('session_started', (data) => {
+            activeEtag = null;
+            // The poll may already have it (or the event came twice): one card per session
+            activeSessions = activeSessions.filter(s => s.id !== data.session.id).concat(data.session);
+            setActiveSession(chooseSession());
+            if (activeSession && activeSession.id === data.session.id) {
                 showAlert(`Session started for ${data.session.course_code}`, 'info');
-            } else if (data.action === 'ended') {
-                activeSession = null;
-                updateSessionDisplay(null);
-                $('#btn-checkin').disabled = true;
+            }
+        });
+
+        SocketManager.on('session_ended', (data) => {
+            activeEtag = null;
+            activeSessions = activeSessions.filter(s => s.id !== data.session.id);
+            if (activeSession && data.session.id === activeSession.id) {
+                setActiveSession(null);
                 showAlert('Session ended', 'info');
+            } else if (!activeSession) {
+                updateSessionDisplay(null);
             }
         });
 
@@ -212,8 +358,22 @@ const App = (() => {
             showScreen('enrollment');
         });
 
-        // Poll for active session every 10s
-        setInterval(checkForActiveSession, 10000);
+        // Fallback poll in case a push was missed; usually answered with a 304
+        setInterval(checkForActiveSession, 30000);
+
+        // Cache the app shell so the next visit loads without the network,
+        // and queue check-ins made while offline
+        if ('serviceWorker' in navigator) {
+            navigator.serviceWorker.register('/sw.js').catch(err => {
+                console.warn('Service worker not registered:', err);
+            });
+            navigator.serviceWorker.addEventListener('message', (event) => {
+                if (event.data && event.data.type === 'check_in_results') {
+                    handleQueuedResults(event.data.results);
+                }
+            });
+            window.addEventListener('online', flushQueuedCheckIns);
+        }
     }
 
     return { init };
@@ -5,6 +5,8 @@ const LecturerApp = (() => {
     let isAuthenticated = false;
     let activeSession = null;
     let attendanceRecords = [];
+    let changeSeq = 0;  // highest change number seen for the active session
+    let qrTimer = null;
 
     function $(sel) { return document.querySelector(sel); }
     function $$(sel) { return document.querySelectorAll(sel); }
@@ -52,9 +54,6 @@ const LecturerApp = (() => {
                 isAuthenticated = true;
                 showScreen('dashboard');
                 loadDashboard();
-
-                // Join lecturer room for real-time updates
-                SocketManager.emit('join_lecturer', {});
             } else {
                 showAlert(data.error || 'Login failed', 'error');
             }
@@ -66,12 +65,18 @@ const LecturerApp = (() => {
     // ─── Dashboard ───
     async function loadDashboard() {
         await checkActiveSession();
+        // Join the lecturer room for real-time updates
+        joinLecturerRoom();
         await loadStudents();
     }
 
+    // With several sessions running, ?course=CSC301 pins the dashboard to one
+    const pinnedCourse = new URLSearchParams(location.search).get('course') || '';
+
     async function checkActiveSession() {
         try {
-            const res = await fetch('/api/session/active');
+            const query = pinnedCourse ? `?course_code=${encodeURIComponent(pinnedCourse)}` : '';
+            const res = await fetch(`/api/session/active${query}`);
             const data = await res.json();
 
             if (data.active) {
@@ -88,6 +93,12 @@ const LecturerApp = (() => {
         }
     }
 
+    // Follow the active session's course only, or every course when idle
+    function joinLecturerRoom() {
+        const courseCode = activeSession ? activeSession.course_code : pinnedCourse;
+        SocketManager.emit('join_lecturer', courseCode ? { course_code: courseCode } : {});
+    }
+
     function updateSessionUI(active) {
         if (active && activeSession) {
             $('#session-display').innerHTML = `
@@ -130,14 +141,9 @@ const LecturerApp = (() => {
             if (res.ok) {
                 activeSession = data.session;
                 updateSessionUI(true);
+                joinLecturerRoom();
                 loadQR();
                 showAlert(`Session started for ${courseCode}`, 'success');
-
-                // Broadcast to all connected clients
-                SocketManager.emit('session_update', {
-                    action: 'started',
-                    session: activeSession
-                });
             } else {
                 showAlert(data.error, 'error');
             }
@@ -160,15 +166,13 @@ const LecturerApp = (() => {
             if (res.ok) {
                 showAlert(`Session ended. ${activeSession.attendance_count || 0} attendance records.`, 'success');
 
-                SocketManager.emit('session_update', {
-                    action: 'ended',
-                    session: data.session
-                });
-
                 activeSession = null;
                 updateSessionUI(false);
+                joinLecturerRoom();
+                clearTimeout(qrTimer);
                 $('#qr-display').innerHTML = '';
                 attendanceRecords = [];
+            changeSeq = 0;
                 renderAttendanceTable();
             } else {
                 showAlert(data.error, 'error');
@@ -179,7 +183,21 @@ const LecturerApp = (() => {
     }
 
     // ─── QR Code ───
+    // The server pushes each new QR as its token rotates (qr_update); the
+    // timer only fetches one if a push has not arrived shortly after expiry.
+    function renderQR(data) {
+        $('#qr-display').innerHTML = `
+          <img src="${data.qr_code}" alt="Session QR Code" />
+          <p style="margin-top: 8px; font-size: 0.8rem; color: var(--text-muted);">
+            Scan with a phone camera to check in
+          </p>
+        `;
+        clearTimeout(qrTimer);
+        qrTimer = setTimeout(loadQR, data.expires_in * 1000 + 2000);
+    }
+
     async function loadQR() {
+        clearTimeout(qrTimer);
         if (!activeSession) return;
 
         try {
@@ -187,12 +205,7 @@ const LecturerApp = (() => {
             const data = await res.json();
 
             if (res.ok) {
-                $('#qr-display').innerHTML = `
-          <img src="${data.qr_code}" alt="Session QR Code" />
-          <p style="margin-top: 8px; font-size: 0.8rem; color: var(--text-muted);">
-            Token: ${data.session_token.substring(0, 12)}...
-          </p>
-        `;
+                renderQR(data);
             }
         } catch (err) {
             console.warn('Could not load QR:', err);
@@ -207,6 +220,7 @@ const LecturerApp = (() => {
 
             if (res.ok) {
                 attendanceRecords = data.attendance;
+                changeSeq = data.seq;
                 renderAttendanceTable();
                 updateStats(data);
             }
@@ -287,22 +301,80 @@ const LecturerApp = (() => {
     }
 
     // ─── WebSocket Listeners ───
-    function setupSocketListeners() {
-        SocketManager.on('connectionChange', updateConnectionStatus);
+    function applyAttendanceBatch(batch) {
+        if (!activeSession || batch.session_id !== activeSession.id) return;
+
+        // New check-ins are added, overridden ones replaced, absent ones dropped.
+        // Batches can arrive out of order: an older change never replaces a newer one.
+        const removed = new Set(batch.removed || []);
+        const byId = new Map(attendanceRecords.map(r => [r.id, r]));
+        batch.records.forEach(r => {
+            const held = byId.get(r.id);
+            if (!held || !(held.seq > r.seq)) byId.set(r.id, Object.assign(held || {}, r));
+        });
+        attendanceRecords = [...byId.values()].filter(r => !removed.has(r.id));
+        changeSeq = Math.max(changeSeq, batch.seq);
+        activeSession.attendance_count = batch.count;
+
+        renderAttendanceTable();
+        updateSessionUI(true);
+        updateStats({
+            attendance: attendanceRecords,
+            total_present: attendanceRecords.filter(r => r.status === 'present').length,
+            total_late: attendanceRecords.filter(r => r.status === 'late').length,
+        });
+    }
 
-        SocketManager.on('attendance_update', (data) => {
-            if (activeSession && data.session.id === activeSession.id) {
-                attendanceRecords.push(data.attendance);
-                activeSession.attendance_count = attendanceRecords.length;
-                renderAttendanceTable();
-                updateSessionUI(true);
-                updateStats({
-                    attendance: attendanceRecords,
-                    total_present: attendanceRecords.filter(r => r.status === 'present').length,
-                    total_late: attendanceRecords.filter(r => r.status === 'late').length,
-                });
+    function setupSocketListeners() {
+        SocketManager.on('connectionChange', (connected) => {
+            updateConnectionStatus(connected);
+            if (connected && isAuthenticated) {
+                // Rooms do not survive a reconnect: rejoin, then fetch only what we missed
+                joinLecturerRoom();
+                if (activeSession) {
+                    SocketManager.emit('attendance_catch_up', {
+                        session_id: activeSession.id,
+                        since: changeSeq
+                    });
+                }
             }
         });
+
+        SocketManager.on('attendance_batch', applyAttendanceBatch);
+
+        // This worker missed broadcasts from another one: reload (rare)
+        SocketManager.on('resync', async () => {
+            if (!isAuthenticated) return;
+            await checkActiveSession();
+            joinLecturerRoom();
+        });
+
+        SocketManager.on('qr_update', (data) => {
+            if (activeSession && data.session_id === activeSession.id) renderQR(data);
+        });
+
+        // Sessions can also be started or ended from the session controller
+        SocketManager.on('session_started', (data) => {
+            if (!isAuthenticated || activeSession) return;
+            if (pinnedCourse && data.session.course_code !== pinnedCourse) return;
+            activeSession = data.session;
+            updateSessionUI(true);
+            joinLecturerRoom();
+            loadAttendance(activeSession.id);
+            loadQR();
+        });
+
+        SocketManager.on('session_ended', (data) => {
+            if (!activeSession || data.session.id !== activeSession.id) return;
+            activeSession = null;
+            updateSessionUI(false);
+            joinLecturerRoom();
+            clearTimeout(qrTimer);
+            $('#qr-display').innerHTML = '';
+            attendanceRecords = [];
+            changeSeq = 0;
+            renderAttendanceTable();
+        });
     }
 
     // ─── Init ───
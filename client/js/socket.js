@@ -1,5 +1,8 @@
 /**
  * WebSocket connection manager using Socket.IO.
+ *
+ * With wire.js loaded, the connection asks for the compact wire format and
+ * every handler gets its event decoded back to the usual object.
  */
 const SocketManager = (() => {
     let socket = null;
@@ -10,10 +13,12 @@ const SocketManager = (() => {
         if (socket && isConnected) return;
 
         socket = io(serverUrl || window.location.origin, {
-            transports: ['websocket', 'polling'],
+            // No long-polling: with several workers its requests can land on different ones
+            transports: ['websocket'],
             reconnection: true,
             reconnectionDelay: 1000,
             reconnectionAttempts: Infinity,
+            query: typeof Wire !== 'undefined' ? { wire: 'compact' } : {},
         });
 
         socket.on('connect', () => {
@@ -44,7 +49,9 @@ const SocketManager = (() => {
 
     function on(event, callback) {
         if (socket) {
-            socket.on(event, callback);
+            socket.on(event, typeof Wire !== 'undefined'
+                ? data => callback(Wire.decode(event, data))
+                : callback);
         }
         // Also store in listeners for late binding
         if (!listeners[event]) listeners[event] = [];
@@ -0,0 +1,115 @@
+/**
+ * Compact wire format for check-in traffic (server: services/wire.py).
+ *
+ * SocketManager connects with ?wire=compact when this file is loaded. The
+ * server then sends check_in_response and attendance_batch with short
+ * field codes, integer statuses and epoch-second timestamps (the batch as
+ * MessagePack), and session_attendance_count as [session_id, count].
+ * Wire.decode() turns them back into the same objects the JSON format
+ * delivers, so the app code never sees the difference.
+ */
+const Wire = (() => {
+    const FIELD_NAMES = {
+        i: 'id', s: 'session_id', d: 'removed', c: 'count', r: 'records',
+        u: 'student_id', m: 'student_matric', n: 'student_name',
+        t: 'timestamp', x: 'status', a: 'attendance',
+        ok: 'success', g: 'message', e: 'error', w: 'retry_after', q: 'seq'
+    };
+    const STATUS_CODES = ['present', 'late', 'flagged', 'absent'];
+    const TIMESTAMP_FIELDS = ['timestamp'];
+    const COMPACT_EVENTS = ['check_in_response'];
+    const utf8 = new TextDecoder();
+
+    // ─── MessagePack (the subset the server sends) ───
+    function unpack(buffer) {
+        const view = new DataView(buffer);
+        let offset = 0;
+
+        function str(length) {
+            const text = utf8.decode(new Uint8Array(buffer, offset, length));
+            offset += length;
+            return text;
+        }
+        function array(length) {
+            const items = [];
+            for (let i = 0; i < length; i++) items.push(read());
+            return items;
+        }
+        function map(length) {
+            const result = {};
+            for (let i = 0; i < length; i++) {
+                const key = read();
+                result[key] = read();
+            }
+            return result;
+        }
+        function next(size, get) {
+            const value = get.call(view, offset);
+            offset += size;
+            return value;
+        }
+
+        function read() {
+            const byte = view.getUint8(offset++);
+            if (byte < 0x80) return byte;
+            if (byte >= 0xe0) return byte - 0x100;
+            if (byte >= 0xa0 && byte <= 0xbf) return str(byte & 0x1f);
+            if (byte >= 0x90 && byte <= 0x9f) return array(byte & 0x0f);
+            if (byte >= 0x80 && byte <= 0x8f) return map(byte & 0x0f);
+            switch (byte) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xcb: return next(8, view.getFloat64);
+                case 0xcc: return next(1, view.getUint8);
+                case 0xcd: return next(2, view.getUint16);
+                case 0xce: return next(4, view.getUint32);
+                case 0xcf: return Number(next(8, view.getBigUint64));
+                case 0xd0: return next(1, view.getInt8);
+                case 0xd1: return next(2, view.getInt16);
+                case 0xd2: return next(4, view.getInt32);
+                case 0xd3: return Number(next(8, view.getBigInt64));
+                case 0xd9: return str(next(1, view.getUint8));
+                case 0xda: return str(next(2, view.getUint16));
+                case 0xdb: return str(next(4, view.getUint32));
+                case 0xdc: return array(next(2, view.getUint16));
+                case 0xdd: return array(next(4, view.getUint32));
+                case 0xde: return map(next(2, view.getUint16));
+                case 0xdf: return map(next(4, view.getUint32));
+            }
+            throw new Error(`Unsupported MessagePack type 0x${byte.toString(16)}`);
+        }
+
+        return read();
+    }
+
+    // ─── Field codes back to names ───
+    function expand(value, key) {
+        if (Array.isArray(value)) return value.map(item => expand(item));
+        if (value && typeof value === 'object') {
+            const result = {};
+            Object.keys(value).forEach(code => {
+                const name = FIELD_NAMES[code] || code;
+                result[name] = expand(value[code], name);
+            });
+            return result;
+        }
+        if (key === 'status' && typeof value === 'number') return STATUS_CODES[value];
+        if (TIMESTAMP_FIELDS.includes(key) && typeof value === 'number') {
+            // Naive UTC, like the server's isoformat()
+            return new Date(value * 1000).toISOString().slice(0, 19);
+        }
+        return value;
+    }
+
+    function decode(event, data) {
+        if (data instanceof ArrayBuffer) return expand(unpack(data));
+        if (COMPACT_EVENTS.includes(event)) return expand(data);
+        if (event === 'session_attendance_count' && Array.isArray(data)) {
+            return { session_id: data[0], count: data[1] };
+        }
+        return data;
+    }
+
+    return { decode, unpack, expand };
+})();
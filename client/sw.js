@@ -1,15 +1,18 @@
 /**
  * Service Worker for offline caching of the PWA shell.
+ *
+ * The server prepends ASSET_VERSION and ASSETS (the app shell, with
+ * content-hashed file names) when it serves this file, so any change to
+ * the client's files installs a fresh cache and drops the old one.
+ *
+ * Check-ins that cannot reach the server are kept in IndexedDB and sent
+ * together to /api/check-in/batch once the connection is back, so a Wi-Fi
+ * dropout costs one request per phone rather than a storm of retries.
  */
-const CACHE_NAME = 'attendance-v1';
-const ASSETS = [
-    '/',
-    '/css/style.css',
-    '/js/app.js',
-    '/js/uuid.js',
-    '/js/socket.js',
-    '/manifest.json',
-];
+const CACHE_NAME = `attendance-${ASSET_VERSION}`;
+
+// Fingerprinted files (/css/style.<hash>.css) never change under their name
+const FINGERPRINTED = /\/(css|js)\/[^/]+\.[0-9a-f]{12}\.\w+$/;
 
 // Install — cache app shell
 self.addEventListener('install', (event) => {
@@ -31,20 +34,133 @@ self.addEventListener('activate', (event) => {
     );
 });
 
-// Fetch — network first, fallback to cache
+// Fetch — fingerprinted files from the cache; everything else network
+// first (a 304 when unchanged), falling back to the cache when offline
 self.addEventListener('fetch', (event) => {
+    const url = new URL(event.request.url);
+    if (url.pathname === '/api/check-in' && event.request.method === 'POST') {
+        event.respondWith(checkInOrQueue(event.request));
+        return;
+    }
+
     // Skip API calls and WebSocket requests
     if (event.request.url.includes('/api/') || event.request.url.includes('/socket.io/')) {
         return;
     }
 
+    if (FINGERPRINTED.test(url.pathname)) {
+        event.respondWith(
+            caches.match(event.request).then(cached => cached || fetchAndCache(event.request))
+        );
+        return;
+    }
+
+    // A scanned QR opens /?qr=<token>: serve the cached page for it, and do
+    // not store a copy per token
     event.respondWith(
-        fetch(event.request)
-            .then(response => {
-                const clone = response.clone();
-                caches.open(CACHE_NAME).then(cache => cache.put(event.request, clone));
-                return response;
-            })
-            .catch(() => caches.match(event.request))
+        fetchAndCache(event.request)
+            .catch(() => caches.match(event.request, { ignoreSearch: true }))
     );
 });
+
+function fetchAndCache(request) {
+    return fetch(request).then(response => {
+        if (response.ok && request.method === 'GET' && !new URL(request.url).search) {
+            const clone = response.clone();
+            caches.open(CACHE_NAME).then(cache => cache.put(request, clone));
+        }
+        return response;
+    });
+}
+
+// ─── Offline check-in queue ───
+const QUEUE_DB = 'attendance-queue';
+const QUEUE_STORE = 'check_ins';
+const BATCH_SIZE = 50;  // the server's CHECKIN_BATCH_MAX
+let flushing = null;
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(QUEUE_DB, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(QUEUE_STORE, { keyPath: 'idempotency_key' });
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function withQueue(mode, work) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(QUEUE_STORE, mode);
+        const result = work(tx.objectStore(QUEUE_STORE));
+        tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+// Send the check-in; if the network fails, queue it and answer 202
+async function checkInOrQueue(request) {
+    const checkIn = await request.clone().json();
+    try {
+        return await fetch(request);
+    } catch (err) {
+        if (!checkIn.idempotency_key) throw err;
+        checkIn.captured_at = checkIn.captured_at || new Date().toISOString();
+        await withQueue('readwrite', store => store.put(checkIn));
+        if (self.registration.sync) {
+            self.registration.sync.register('flush-check-ins').catch(() => {});
+        }
+        return new Response(JSON.stringify({
+            queued: true,
+            message: 'No connection. Check-in saved and will be sent automatically.'
+        }), { status: 202, headers: { 'Content-Type': 'application/json' } });
+    }
+}
+
+function flushQueue() {
+    if (!flushing) {
+        flushing = sendQueued().finally(() => { flushing = null; });
+    }
+    return flushing;
+}
+
+async function sendQueued() {
+    const queued = await withQueue('readonly', store => store.getAll());
+    for (let i = 0; i < queued.length; i += BATCH_SIZE) {
+        const res = await fetch('/api/check-in/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ check_ins: queued.slice(i, i + BATCH_SIZE) })
+        });
+        if (!res.ok) {
+            // Turned away under load (429/503): everything stays queued; come back when told
+            const retryAfter = Number(res.headers.get('Retry-After'));
+            if (retryAfter) setTimeout(flushQueue, retryAfter * 1000);
+            return;
+        }
+
+        // Server errors stay queued for the next attempt; everything else is final
+        const { results } = await res.json();
+        const done = results.filter(result => result.status < 500);
+        await withQueue('readwrite', store => {
+            done.forEach(result => store.delete(result.idempotency_key));
+        });
+        const clients = await self.clients.matchAll();
+        clients.forEach(client => client.postMessage({ type: 'check_in_results', results: done }));
+    }
+}
+
+// Background Sync where the browser has it; otherwise the page asks
+self.addEventListener('sync', (event) => {
+    if (event.tag === 'flush-check-ins') {
+        event.waitUntil(flushQueue());
+    }
+});
+
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'flush-check-ins') {
+        event.waitUntil(flushQueue().catch(() => {}));
+    }
+});
@@ -2,19 +2,27 @@
 Offline LAN-Based Attendance System — Main Server Application
 
 This is the entry point for the Flask + Socket.IO server.
-Run with: python app.py
+Run with: python app.py            (one process; --debug for the debugger)
+      or: python serve.py          (production: one worker per CPU core)
 """
 import sys
 import os
 
+# Eventlet must patch the standard library before anything else is imported,
+# so the background writer's threads and queues cooperate with the event loop
+if not os.environ.get('TESTING'):
+    import eventlet
+    eventlet.monkey_patch()
+
 # Add server directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_socketio import SocketIO
 from flask_cors import CORS
 from config import Config
 from database import init_db
+from services.cluster import cluster
 
 # Initialize Flask app
 app = Flask(__name__, static_folder=None)
@@ -23,85 +31,145 @@ app.config.from_object(Config)
 # Enable CORS for LAN access
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-# Initialize Socket.IO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+# Initialize Socket.IO. Production workers share emits and rooms over a
+# local message queue, so a broadcast reaches clients on every worker.
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet',
+                    client_manager=cluster.client_manager(), transports=cluster.transports())
+cluster.start(socketio)
 
 # Initialize database
 init_db(app)
 
+# Per-route and per-event latency histograms, served at /api/metrics
+from services.metrics import metrics
+metrics.init_app(app, socketio)
+
 # Register route blueprints
 from routes.enrollment import enrollment_bp
 from routes.sessions import sessions_bp
 from routes.attendance import attendance_bp
 from routes.lecturer import lecturer_bp
+from routes.metrics import metrics_bp
 
 app.register_blueprint(enrollment_bp)
 app.register_blueprint(sessions_bp)
 app.register_blueprint(attendance_bp)
 app.register_blueprint(lecturer_bp)
+app.register_blueprint(metrics_bp)
 
 # Register WebSocket events
 from sockets.events import register_socket_events
 register_socket_events(socketio)
 
+# Pre-render and push the rotating session QR
+from services.qr_rotator import qr_rotator
+qr_rotator.start(socketio, app)
+
+# Singleton services run in one process only (worker 0 in production mode)
+if cluster.is_primary:
+    # Upload the sync queue to the cloud between sessions
+    from services.sync_worker import sync_worker
+    sync_worker.start(socketio, app)
+
+    # Start/end sessions from the microcontroller on the serial port
+    from services.serial_bridge import serial_bridge
+    serial_bridge.start(socketio, app)
+
 # ─── Serve the PWA client ───────────────────────────────
 
+# Gzipped and fingerprinted in memory once at startup (see static_assets.py)
 CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client')
+from services.static_assets import static_assets
+static_assets.load(CLIENT_DIR)
 
 
 @app.route('/')
 def serve_student_page():
     """Serve the student PWA client."""
-    return send_from_directory(CLIENT_DIR, 'index.html')
+    return static_assets.response('index.html')
 
 
 @app.route('/lecturer')
 def serve_lecturer_page():
     """Serve the lecturer dashboard."""
-    return send_from_directory(CLIENT_DIR, 'lecturer.html')
+    return static_assets.response('lecturer.html')
 
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
-    return send_from_directory(os.path.join(CLIENT_DIR, 'css'), filename)
+    return static_assets.response(f'css/{filename}')
 
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
-    return send_from_directory(os.path.join(CLIENT_DIR, 'js'), filename)
+    return static_assets.response(f'js/{filename}')
 
 
 @app.route('/manifest.json')
 def serve_manifest():
-    return send_from_directory(CLIENT_DIR, 'manifest.json')
+    return static_assets.response('manifest.json')
 
 
 @app.route('/sw.js')
 def serve_sw():
-    return send_from_directory(CLIENT_DIR, 'sw.js')
+    return static_assets.response('sw.js')
 
 
 # ─── Health check ───────────────────────────────────────
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint."""
-    return {'status': 'ok', 'service': 'offline-attendance-server'}, 200
+    """Health check endpoint, with the check-in writer's running totals."""
+    from services.writer import checkin_writer
+    return {
+        'status': 'ok',
+        'service': 'offline-attendance-server',
+        'checkin_writer': checkin_writer.snapshot()
+    }, 200
 
 
 # ─── Run ────────────────────────────────────────────────
 
-if __name__ == '__main__':
+def lan_ip():
+    """This machine's address on the classroom network, for URLs and QR links."""
     import socket
-
-    # Get the LAN IP address for display
-    hostname = socket.gethostname()
     try:
-        local_ip = socket.gethostbyname(hostname)
+        return socket.gethostbyname(socket.gethostname())
     except socket.gaierror:
-        local_ip = '127.0.0.1'
+        return '127.0.0.1'
+
+
+def set_checkin_url(port):
+    """Point the QR at this server's student app unless QR_CHECKIN_URL is set."""
+    if not app.config['QR_CHECKIN_URL']:
+        app.config['QR_CHECKIN_URL'] = f"http://{lan_ip()}:{port}/"
+
+
+def serve_worker(host, port):
+    """
+    Serve as one production worker (started by serve.py). Every worker
+    listens on the same port with SO_REUSEPORT and the kernel spreads
+    incoming connections between them.
+    """
+    import eventlet.wsgi
+    set_checkin_url(port)
+    listener = eventlet.listen((host, port), reuse_port=True)
+    print(f"[SERVE] Worker {Config.WORKER_INDEX} (pid {os.getpid()}) listening on {host}:{port}")
+    eventlet.wsgi.server(listener, app, log_output=False)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the attendance server in one process.")
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--debug', action='store_true',
+                        help="enable the Werkzeug debugger (never in front of a class)")
+    args = parser.parse_args()
 
-    port = 5000
+    local_ip = lan_ip()
+    port = args.port
+    set_checkin_url(port)
 
     print("=" * 60)
     print("  Offline LAN-Based Attendance System")
@@ -113,4 +181,4 @@ if __name__ == '__main__':
     print(f"  Local network:    Share the IP above with students")
     print("=" * 60)
 
-    socketio.run(app, host='0.0.0.0', port=port, debug=True)
+    socketio.run(app, host='0.0.0.0', port=port, debug=args.debug)
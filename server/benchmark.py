@@ -0,0 +1,523 @@
+"""
+Check-in load benchmark.
+
+Seeds a class of students, opens a session, and has every student check in
+at once — over HTTP (/api/check-in) and over Socket.IO (the `check_in`
+event) — then reports throughput, latency percentiles, error rates, the
+check-in writer's SQLite lock waits, and the Socket.IO bytes each check-in
+costs: its reply, and its share of the lecturer dashboard's broadcasts.
+
+By default a server is started on a scratch database and stopped afterwards;
+pass --url to load an already running server instead (each run enrolls its
+own students, so runs never collide). --workers N starts the production
+launcher (serve.py) with N worker processes instead of a single process.
+
+    python benchmark.py --students 1000 --concurrency 200
+    python benchmark.py --workers 4
+    python benchmark.py --output results/main.json
+    python benchmark.py --compare results/main.json
+    python benchmark.py --wire compact   # socket clients use the compact format
+
+Results are written as JSON with the same keys every run, so two files can
+be compared with --compare (or any JSON diff).
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import simple_websocket
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SERVER_DIR)
+
+from services.wire import expand, unpackb
+
+# Metrics compared by --compare, and whether a higher value is better
+COMPARED = [
+    ('throughput', True),
+    ('p50_ms', False),
+    ('p95_ms', False),
+    ('p99_ms', False),
+    ('error_rate', False),
+    ('lock_wait_ms', False),
+    ('reply_bytes', False),
+    ('broadcast_bytes', False),
+]
+
+
+# ─── Clients ────────────────────────────────────────────
+
+class HTTPClient:
+    """One keep-alive HTTP connection, like one phone's browser."""
+
+    def __init__(self, base_url):
+        url = urllib.parse.urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        self.conn.connect()
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        payload = json.dumps(body) if body is not None else None
+        self.conn.request(method, path, body=payload, headers=headers)
+        response = self.conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+
+    def check_in(self, payload):
+        status, _ = self.request('POST', '/api/check-in', payload)
+        return status
+
+    def close(self):
+        self.conn.close()
+
+
+class SocketClient:
+    """
+    Minimal Socket.IO client (Engine.IO v4), enough to emit `check_in` and
+    wait for `check_in_response`. Like the browser client, it connects
+    straight over a WebSocket, which also works against several workers.
+    `received` counts the bytes of every frame it has read.
+    """
+
+    def __init__(self, base_url, wire='json'):
+        url = urllib.parse.urlsplit(base_url)
+        scheme = 'wss' if url.scheme == 'https' else 'ws'
+        self.ws = simple_websocket.Client.connect(
+            f"{scheme}://{url.netloc}/socket.io/?EIO=4&transport=websocket&wire={wire}"
+        )
+        self.wire = wire
+        self.received = 0
+        self.reply_bytes = 0          # check_in_response frames only
+        self._receive_packet('0')     # Engine.IO open
+        self.ws.send('40')            # connect to the default namespace
+        self._receive_packet('40')
+
+    def _receive_frame(self, timeout=60):
+        frame = self.ws.receive(timeout=timeout)
+        if frame is not None:
+            self.received += len(frame) if isinstance(frame, bytes) else len(frame.encode())
+        return frame
+
+    def _receive_packet(self, prefix, timeout=60):
+        while True:
+            packet = self._receive_frame(timeout)
+            if packet is None:
+                raise TimeoutError('No reply from server')
+            if packet == '2':         # Engine.IO ping
+                self.ws.send('3')
+            elif packet.startswith(prefix):
+                return packet[len(prefix):]
+
+    def emit(self, event, data):
+        self.ws.send('42' + json.dumps([event, data]))
+
+    def receive_event(self, timeout=60):
+        """The next event as (name, data); compact binary events are decoded."""
+        while True:
+            packet = self._receive_packet('4', timeout)
+            if packet.startswith('2'):
+                name, data = json.loads(packet[1:])
+                return name, expand(data) if self.wire == 'compact' else data
+            if packet.startswith('5'):
+                # A binary event: its header, then the attachment in the next frame
+                name, _ = json.loads(packet.partition('-')[2])
+                return name, expand(unpackb(self._receive_frame(timeout)))
+
+    def wait_for(self, event):
+        while True:
+            name, data = self.receive_event()
+            if name == event:
+                return data
+
+    def check_in(self, payload):
+        before = self.received
+        self.emit('check_in', payload)
+        response = self.wait_for('check_in_response')
+        self.reply_bytes += self.received - before
+        # Socket replies carry an error message rather than a status code
+        return 201 if response.get('success') else response.get('error', 'error')
+
+    def close(self):
+        try:
+            self.ws.close()
+        except simple_websocket.ConnectionClosed:
+            pass
+
+
+class DashboardListener:
+    """A lecturer dashboard following one course, counting what it is sent."""
+
+    def __init__(self, base_url, course_code, wire='json'):
+        self.client = SocketClient(base_url, wire)
+        self.client.emit('join_lecturer', {'course_code': course_code})
+        self.client.wait_for('joined_lecturer')
+        self.records = 0
+        self.bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            before = self.client.received
+            try:
+                name, data = self.client.receive_event(timeout=0.5)
+            except (TimeoutError, simple_websocket.ConnectionClosed):
+                continue
+            if name == 'attendance_batch':
+                self.records += len(data['records'])
+                self.bytes += self.client.received - before
+
+    def stop(self, expected_records, timeout=5):
+        """Wait for the last batches (they are sent every BROADCAST_INTERVAL_MS)."""
+        deadline = time.time() + timeout
+        while self.records < expected_records and time.time() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        self._thread.join()
+        self.client.close()
+
+
+# ─── Server ─────────────────────────────────────────────
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, workdir, workers=0):
+    """
+    Run the server on a scratch database in `workdir`: app.py's single
+    process, or serve.py with `workers` processes. Returns (process, base_url).
+    """
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    env.pop('TESTING', None)
+    env.setdefault('SERIAL_PORT', '')
+    # Every simulated phone connects from 127.0.0.1: limit per device only
+    env.setdefault('ADMISSION_ADDRESS_RATE', '0')
+    if workers:
+        command = [sys.executable, 'serve.py', '--host', '127.0.0.1',
+                   '--port', str(port), '--workers', str(workers)]
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.socketio.run(app.app, host='127.0.0.1', port={port}, "
+                   f"log_output=False)"]
+    process = subprocess.Popen(
+        command,
+        cwd=SERVER_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Benchmark server exited (is port {port} in use?)")
+        try:
+            client = HTTPClient(base_url)
+            client.request('GET', '/api/health')
+            client.close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('Benchmark server did not start')
+
+
+def writer_stats(base_url):
+    client = HTTPClient(base_url)
+    _, health = client.request('GET', '/api/health')
+    client.close()
+    return health.get('checkin_writer', {})
+
+
+# ─── Load generation ────────────────────────────────────
+
+def run_workers(concurrency, jobs, make_client, work):
+    """
+    Split jobs across `concurrency` workers, each with its own connection.
+    All connections are opened first, then released together.
+    Returns (list of (latency_seconds, status), wall_seconds).
+    """
+    slices = [jobs[i::concurrency] for i in range(concurrency)]
+    slices = [s for s in slices if s]
+    # Open connections in parallel, so none sits idle long enough to miss a ping
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        clients = list(pool.map(lambda _: make_client(), slices))
+    results = []
+    results_lock = threading.Lock()
+    barrier = threading.Barrier(len(slices) + 1)
+
+    def worker(client, items):
+        own = []
+        barrier.wait()
+        for item in items:
+            started = time.perf_counter()
+            try:
+                status = work(client, item)
+            except Exception:
+                status = 'exception'
+            own.append((time.perf_counter() - started, status))
+        with results_lock:
+            results.extend(own)
+
+    threads = [
+        threading.Thread(target=worker, args=(client, items), daemon=True)
+        for client, items in zip(clients, slices)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    for client in clients:
+        client.close()
+    return results, wall
+
+
+def seed_students(base_url, run_id, count, concurrency):
+    students = [{
+        'student_id': f"BENCH/{run_id}/{i:05d}",
+        'name': f"Bench Student {i}",
+        'device_uuid': f"bench-{run_id}-{i}"
+    } for i in range(count)]
+
+    results, _ = run_workers(
+        concurrency, students, lambda: HTTPClient(base_url),
+        lambda client, student: client.request('POST', '/api/enroll', student)[0]
+    )
+    failed = sum(1 for _, status in results if status != 201)
+    if failed:
+        raise RuntimeError(f"{failed} of {count} enrollments failed")
+    return students
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def rounded(value, digits=2):
+    """round(), passing None (no successful requests to measure) through."""
+    return None if value is None else round(value, digits)
+
+
+def summarise(results, wall, before, after):
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    errors = {}
+    for _, status in results:
+        if status != 201:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    ok = len(results) - sum(errors.values())
+
+    def delta(key):
+        return after.get(key, 0) - before.get(key, 0)
+
+    batches = delta('batches')
+    return {
+        'requests': len(results),
+        'ok': ok,
+        'errors': errors,
+        'error_rate': round(1 - ok / len(results), 4) if results else 0,
+        'wall_s': round(wall, 3),
+        'throughput': round(ok / wall, 1) if wall else 0,
+        'p50_ms': rounded(percentile(latencies, 0.50)),
+        'p95_ms': rounded(percentile(latencies, 0.95)),
+        'p99_ms': rounded(percentile(latencies, 0.99)),
+        'max_ms': rounded(latencies[-1] if latencies else None),
+        'writer_batches': batches,
+        'mean_batch_size': round(delta('records') / batches, 1) if batches else 0,
+        'commit_ms': round(delta('commit_seconds') * 1000, 1),
+        'lock_wait_ms': round(delta('lock_wait_seconds') * 1000, 1),
+        'lock_errors': delta('lock_errors'),
+    }
+
+
+def burst(base_url, transport, run_id, students, concurrency, wire='json'):
+    """
+    Open a session and check every student in at once over one transport,
+    with a dashboard following the course.
+    """
+    admin = HTTPClient(base_url)
+    course_code = f"BENCH-{run_id}-{transport}"
+    status, body = admin.request('POST', '/api/session/start', {'course_code': course_code})
+    if status != 201:
+        raise RuntimeError(f"Could not start session: {body}")
+    # Phones check in with the QR's rotating token, which stays valid for the
+    # grace window after it rotates: long enough for one burst
+    status, body = admin.request('GET', f"/api/session/qr?course_code={course_code}")
+    if status != 200:
+        raise RuntimeError(f"Could not fetch the session QR: {body}")
+    token = body['qr_token']
+
+    jobs = [{
+        'student_id': s['student_id'],
+        'device_uuid': s['device_uuid'],
+        'session_token': token
+    } for s in students]
+    clients = []
+
+    def make_client():
+        client = HTTPClient(base_url) if transport == 'http' else SocketClient(base_url, wire)
+        clients.append(client)
+        return client
+
+    dashboard = DashboardListener(base_url, course_code, wire)
+    before = writer_stats(base_url)
+    results, wall = run_workers(
+        concurrency, jobs, make_client, lambda client, job: client.check_in(job)
+    )
+    after = writer_stats(base_url)
+    summary = summarise(results, wall, before, after)
+    dashboard.stop(summary['ok'])
+
+    # Socket.IO payload bytes (WebSocket frame headers not included)
+    summary['reply_bytes'] = round(
+        sum(client.reply_bytes for client in clients) / len(results), 1
+    ) if transport == 'socket' and results else None
+    summary['broadcast_bytes'] = round(
+        dashboard.bytes / dashboard.records, 1
+    ) if dashboard.records else None
+
+    admin.request('POST', '/api/session/end', {'course_code': course_code})
+    admin.close()
+    return summary
+
+
+# ─── Reporting ──────────────────────────────────────────
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    params = report['params']
+    print(f"Check-in benchmark: {params['students']} students, "
+          f"concurrency {params['concurrency']}, workers {params.get('workers') or 1}, "
+          f"wire {params.get('wire', 'json')}, rev {report['revision']}")
+    header = f"{'transport':<10}{'ok/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}" \
+             f"{'errors':>9}{'batch':>8}{'lock ms':>9}"
+    print(header)
+    print('-' * len(header))
+    for transport, r in report['results'].items():
+        # None: no request completed, so there are no latencies
+        p50, p95, p99 = ('-' if r[key] is None else r[key]
+                         for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+        print(f"{transport:<10}{r['throughput']:>9}{p50:>9}{p95:>9}"
+              f"{p99:>9}{r['error_rate']:>9.2%}{r['mean_batch_size']:>8}"
+              f"{r['lock_wait_ms']:>9}")
+        if r['errors']:
+            print(f"{'':<10}errors by status: {r['errors']}")
+        print(f"{'':<10}bytes per check-in: reply {r.get('reply_bytes') or '-'}, "
+              f"dashboard broadcast {r.get('broadcast_bytes') or '-'}")
+
+
+def print_comparison(report, baseline):
+    print(f"\nCompared with {baseline.get('revision')} ({baseline.get('timestamp')}):")
+    if baseline.get('params') != report['params']:
+        print(f"  note: baseline ran with different parameters {baseline.get('params')}")
+    for transport, r in report['results'].items():
+        old = baseline.get('results', {}).get(transport)
+        if not old:
+            continue
+        for metric, higher_is_better in COMPARED:
+            before, now = old.get(metric), r.get(metric)
+            if before is None or now is None:
+                continue
+            change = (now - before) / before * 100 if before else 0
+            worse = change < 0 if higher_is_better else change > 0
+            flag = '  <-- regression' if worse and abs(change) >= 10 else ''
+            print(f"  {transport:<8}{metric:<14}{before:>10} -> {now:<10} "
+                  f"({change:+.0f}%){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--students', type=int, default=500, help='class size (default 500)')
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help='simultaneous connections (default 100)')
+    parser.add_argument('--transport', choices=['http', 'socket', 'both'], default='both')
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    parser.add_argument('--port', type=int, help='port for the scratch server (default: any free port)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='run the scratch server as serve.py with this many workers '
+                             '(writer stats then cover one worker only)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--wire', choices=['json', 'compact'], default='json',
+                        help='Socket.IO wire format for the socket clients and dashboard')
+    args = parser.parse_args()
+
+    process = None
+    scratch = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        # Removed when the run ends, however it ends
+        scratch = tempfile.TemporaryDirectory(prefix='attendance-bench-')
+        process, base_url = start_server(args.port or free_port(), scratch.name, args.workers)
+
+    try:
+        run_id = secrets.token_hex(3)
+        students = seed_students(base_url, run_id, args.students, args.concurrency)
+        transports = ['http', 'socket'] if args.transport == 'both' else [args.transport]
+        results = {
+            transport: burst(base_url, transport, run_id, students, args.concurrency, args.wire)
+            for transport in transports
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if scratch is not None:
+            scratch.cleanup()
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'params': {
+            'students': args.students,
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'url': args.url,
+            'wire': args.wire,
+        },
+        'results': results,
+    }
+    print_report(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
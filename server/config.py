@@ -9,24 +9,85 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 class Config:
     """Base configuration."""
     SECRET_KEY = os.environ.get('SECRET_KEY', 'offline-attendance-dev-key-change-in-production')
-    SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(BASE_DIR, 'attendance.db')}"
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', f"sqlite:///{os.path.join(BASE_DIR, 'attendance.db')}"
+    )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLITE_BUSY_TIMEOUT_MS = 5000  # how long a writer waits for another process's lock
 
     # Session settings
     SESSION_TOKEN_LENGTH = 32
     QR_REFRESH_INTERVAL = 30  # seconds
+    QR_GRACE_WINDOWS = 1      # previous windows whose QR tokens are still accepted
+    QR_REQUIRE_ROTATING_TOKEN = True  # reject check-ins that use the static session token
+    # Student app URL the QR opens, with the token appended as ?qr=...; empty
+    # means http://<LAN IP>:<port>/, filled in when the server starts
+    QR_CHECKIN_URL = os.environ.get('QR_CHECKIN_URL', '')
+    QR_IMAGE_FORMAT = 'svg'   # 'svg' (no PNG encoding) or 'png'
 
     # Serial bridge settings (Arduino)
     SERIAL_PORT = os.environ.get('SERIAL_PORT', 'COM3')  # Windows default; Linux: /dev/ttyACM0
     SERIAL_BAUD_RATE = 9600
+    SERIAL_POLL_MS = 20           # how often the non-blocking port is read
+    SERIAL_RETRY_INTERVAL = 5     # seconds between attempts to (re)open the port
+    SERIAL_MAX_LINE = 256         # longer lines are dropped as noise
 
     # Cloud sync settings (Supabase)
     SUPABASE_URL = os.environ.get('SUPABASE_URL', '')
     SUPABASE_KEY = os.environ.get('SUPABASE_KEY', '')
     SYNC_CHECK_INTERVAL = 60  # seconds
 
+    # Sync worker: batched, gzip-compressed uploads to a REST endpoint
+    SYNC_ENDPOINT = os.environ.get('SYNC_ENDPOINT', '')  # empty disables the worker
+    SYNC_BATCH_SIZE = 500     # queue entries per upload
+    SYNC_TIMEOUT = 30         # seconds per upload
+    SYNC_BACKOFF_BASE = 5     # seconds; doubles after each consecutive failure
+    SYNC_BACKOFF_MAX = 900    # seconds
+    SYNC_RETENTION_DAYS = 30  # synced queue entries older than this are deleted
+
     # HMAC secret for signed payloads
     HMAC_SECRET = os.environ.get('HMAC_SECRET', 'hmac-dev-secret-change-in-production')
 
     # Late threshold (minutes after session start)
     LATE_THRESHOLD_MINUTES = 15
+
+    # Check-in validation cache (entries held in memory)
+    CACHE_MAX_SESSIONS = 64
+    CACHE_MAX_STUDENTS = 20000
+
+    # Group-commit writer: accepted check-ins are committed together
+    CHECKIN_BATCH_SIZE = 100        # commit as soon as this many are waiting
+    CHECKIN_BATCH_INTERVAL_MS = 5   # ...or after this long, whichever comes first
+    CHECKIN_WRITE_TIMEOUT = 10      # seconds a request waits for its commit
+
+    # Offline check-ins, queued on the phone and sent to /api/check-in/batch
+    CHECKIN_BATCH_MAX = 50            # records per request
+
+    # Admission control on check-in and enrollment (services/admission.py)
+    ADMISSION_DEVICE_RATE = 1.0     # requests per second per device_uuid, after a burst of...
+    ADMISSION_DEVICE_BURST = 10
+    # Per client address; 0 disables (e.g. when every phone arrives through one NAT)
+    ADMISSION_ADDRESS_RATE = float(os.environ.get('ADMISSION_ADDRESS_RATE', 20))
+    ADMISSION_ADDRESS_BURST = 60
+    ADMISSION_MAX_CLIENTS = 20000   # buckets kept; the least recently seen are dropped
+    ADMISSION_MAX_IN_FLIGHT = 800   # requests handled at once (eventlet serves 1024); more get a 503
+    ADMISSION_MAX_QUEUE_DEPTH = 2000  # shed with a 503 while the writer has this many waiting
+    ADMISSION_RETRY_AFTER = 2       # seconds; a 503's Retry-After is spread over 1-2x this
+
+    # Bulk roster import (POST /api/students/import, manage.py import-roster)
+    ROSTER_IMPORT_CHUNK = 1000   # students per transaction
+    ROSTER_REPORT_LIMIT = 1000   # conflicts listed in the report (all are counted)
+
+    # Live dashboard updates are gathered and sent in one batch per window
+    BROADCAST_INTERVAL_MS = 250
+
+    # SQL profiling: statements slower than this are logged with their call site
+    SLOW_QUERY_MS = 50
+    QUERY_BUDGET_STRICT = False  # raise, instead of logging, when a view exceeds @query_budget
+
+    # Production mode (serve.py): worker processes share the port and talk
+    # over Unix sockets in IPC_DIR. serve.py sets these for each worker.
+    WORKERS = int(os.environ.get('WORKERS', 0))  # 0: one per CPU core
+    WORKER_INDEX = int(os.environ.get('WORKER_INDEX', 0))  # worker 0 runs the background services
+    IPC_DIR = os.environ.get('IPC_DIR', '')       # empty: single process
+    CLUSTER_RESYNC_INTERVAL = 2   # seconds before a worker notices it missed a change
@@ -18,9 +18,231 @@ def init_db(app):
             cursor = dbapi_connection.cursor()
             cursor.execute("PRAGMA journal_mode=WAL")
             cursor.execute("PRAGMA synchronous=NORMAL")
+            # Production workers are separate processes sharing one file
+            cursor.execute(f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}")
             cursor.close()
 
+        # Count and time statements per request; log slow ones
+        from services.query_profiler import query_profiler
+        query_profiler.init_app(app, db.engine)
+
         # Import models so they're registered
         import models  # noqa: F401
+        fresh = not db.inspect(db.engine).has_table('sessions')
         db.create_all()
+        if fresh:
+            # create_all() built the current schema; nothing to migrate
+            set_schema_version(len(MIGRATIONS))
+        else:
+            run_migrations()
         print("[DB] Database initialized with WAL mode")
+
+
+# ─── Schema Migrations ─────────────────────────────────
+#
+# create_all() only creates missing tables, so every column or index added
+# to an existing table needs a migration here as well as in models.py.
+# The schema version lives in SQLite's PRAGMA user_version; migration N
+# upgrades version N-1 to N. Append new migrations, never reorder them,
+# and keep each one safe to re-run in case it was interrupted.
+
+def get_schema_version():
+    from sqlalchemy import text
+
+    with db.engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def set_schema_version(version):
+    from sqlalchemy import text
+
+    with db.engine.begin() as conn:
+        conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+
+def run_migrations():
+    """Apply every migration newer than the database's schema version."""
+    from sqlalchemy import text
+
+    version = get_schema_version()
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with db.engine.begin() as conn:
+            migration(conn)
+            conn.execute(text(f"PRAGMA user_version = {number}"))
+        print(f"[DB] Applied migration {number}: {migration.__name__}")
+
+
+def add_attendance_unique(conn):
+    """
+    One attendance record per student per session. Existing duplicates are
+    removed first, keeping the earliest record.
+    """
+    from sqlalchemy import text
+
+    conn.execute(text(
+        "DELETE FROM attendance WHERE id NOT IN ("
+        "SELECT MIN(id) FROM attendance GROUP BY student_id, session_id)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_student_session "
+        "ON attendance (student_id, session_id)"
+    ))
+
+
+def add_session_counter(conn):
+    """sessions.attendance_count, backfilled from the attendance table."""
+    from sqlalchemy import text
+
+    columns = [row[1] for row in conn.execute(text("PRAGMA table_info(sessions)"))]
+    if 'attendance_count' in columns:
+        return
+
+    conn.execute(text(
+        "ALTER TABLE sessions ADD COLUMN attendance_count INTEGER NOT NULL DEFAULT 0"
+    ))
+    conn.execute(text(
+        "UPDATE sessions SET attendance_count = ("
+        "SELECT COUNT(*) FROM attendance WHERE attendance.session_id = sessions.id)"
+    ))
+
+
+def add_sync_queue_indexes(conn):
+    """
+    Partial indexes for the sync queue. Duplicate pending entries for the
+    same record are coalesced first (keeping the earliest), since the
+    pending index is unique.
+    """
+    from sqlalchemy import text
+
+    conn.execute(text(
+        "DELETE FROM sync_queue WHERE status = 'pending' AND id NOT IN ("
+        "SELECT MIN(id) FROM sync_queue WHERE status = 'pending' "
+        "GROUP BY table_name, record_id)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_sync_queue_pending "
+        "ON sync_queue (table_name, record_id) WHERE status = 'pending'"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sync_queue_pending "
+        "ON sync_queue (id) WHERE status = 'pending'"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sync_queue_synced "
+        "ON sync_queue (synced_at) WHERE status = 'synced'"
+    ))
+
+
+def add_secondary_indexes(conn):
+    """Indexes for the session roster, student history and session lookups."""
+    from sqlalchemy import text
+
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_attendance_session_id "
+        "ON attendance (session_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_attendance_student_timestamp "
+        "ON attendance (student_id, timestamp)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sessions_course_active "
+        "ON sessions (course_code, is_active)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sessions_start_time "
+        "ON sessions (start_time)"
+    ))
+
+
+def add_attendance_idempotency_key(conn):
+    """attendance.idempotency_key, unique where set, for batch check-in replays."""
+    from sqlalchemy import text
+
+    columns = [row[1] for row in conn.execute(text("PRAGMA table_info(attendance)"))]
+    if 'idempotency_key' not in columns:
+        conn.execute(text("ALTER TABLE attendance ADD COLUMN idempotency_key VARCHAR(64)"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_idempotency_key "
+        "ON attendance (idempotency_key) WHERE idempotency_key IS NOT NULL"
+    ))
+
+
+def add_sessions_course_start_index(conn):
+    """A course's sessions in start-time order, for attendance exports."""
+    from sqlalchemy import text
+
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sessions_course_start "
+        "ON sessions (course_code, start_time)"
+    ))
+
+
+def backfill_course_summaries(conn):
+    """
+    course_summaries (created by create_all), filled from the attendance
+    table. From here on every attendance write keeps it up to date.
+    """
+    from sqlalchemy import text
+
+    conn.execute(text("DELETE FROM course_summaries"))
+    conn.execute(text(
+        "INSERT INTO course_summaries "
+        "(course_code, student_id, present, late, flagged, last_seen) "
+        "SELECT s.course_code, a.student_id, "
+        "SUM(a.status = 'present'), SUM(a.status = 'late'), SUM(a.status = 'flagged'), "
+        "MAX(a.timestamp) "
+        "FROM attendance a JOIN sessions s ON s.id = a.session_id "
+        "GROUP BY s.course_code, a.student_id"
+    ))
+
+
+def add_sessions_course_active_unique(conn):
+    """
+    At most one active session per course. Where a course has several
+    (two workers raced), all but the newest are ended first.
+    """
+    from sqlalchemy import text
+
+    conn.execute(text(
+        "UPDATE sessions SET is_active = 0, end_time = COALESCE(end_time, CURRENT_TIMESTAMP) "
+        "WHERE is_active AND id NOT IN ("
+        "SELECT MAX(id) FROM sessions WHERE is_active GROUP BY course_code)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_sessions_course_active "
+        "ON sessions (course_code) WHERE is_active"
+    ))
+
+
+def add_attendance_change_seq(conn):
+    """
+    sessions.change_seq and attendance.change_seq, for dashboards that
+    resume from their last change number. Existing records keep 0 (older
+    than any dashboard); attendance_removals is created by create_all().
+    """
+    from sqlalchemy import text
+
+    for table in ('sessions', 'attendance'):
+        columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
+        if 'change_seq' not in columns:
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0"
+            ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_attendance_session_change "
+        "ON attendance (session_id, change_seq)"
+    ))
+
+
+MIGRATIONS = [
+    add_attendance_unique,
+    add_session_counter,
+    add_sync_queue_indexes,
+    add_secondary_indexes,
+    add_attendance_idempotency_key,
+    add_sessions_course_start_index,
+    backfill_course_summaries,
+    add_sessions_course_active_unique,
+    add_attendance_change_seq,
+]
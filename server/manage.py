@@ -0,0 +1,117 @@
+"""
+Maintenance commands, run on the Pi with the server stopped or running:
+
+    python manage.py import-roster students.csv
+    python manage.py export-attendance --course CSC101 --from 2026-01-10 -o csc101.csv
+    python manage.py rebuild-summary
+
+Commands use the database directly with a bare Flask app, so none of the
+server's background services (QR rotation, sync, serial bridge) start.
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from config import Config
+from database import init_db
+
+# Conflicts printed by import-roster; the rest are counted
+SHOW_CONFLICTS = 20
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    return app
+
+
+def import_roster_command(args):
+    from services.roster import RosterImportError, import_roster
+    try:
+        with open(args.path, encoding='utf-8-sig', newline='') as f:
+            result = import_roster(f)
+    except (OSError, RosterImportError) as e:
+        print(f"Import failed: {e}")
+        return 1
+
+    print(f"{result['imported']} of {result['rows']} students enrolled in {result['seconds']}s, "
+          f"{result['conflicts']} conflict(s)")
+    for conflict in result['report'][:SHOW_CONFLICTS]:
+        print(f"  line {conflict['line']}: {conflict['student_id'] or '-'}: {conflict['reason']}")
+    if result['conflicts'] > SHOW_CONFLICTS:
+        print(f"  ... and {result['conflicts'] - SHOW_CONFLICTS} more")
+    return 0
+
+
+def export_attendance_command(args):
+    from services.export import ExportError, attendance_query, iter_csv, parse_date
+    try:
+        since = parse_date(args.since)
+        until = parse_date(args.until, end=True)
+    except ExportError as e:
+        print(f"Export failed: {e}")
+        return 1
+
+    query = attendance_query(args.session, args.course, since, until)
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        rows = -1  # not counting the header
+        for chunk in iter_csv(query):
+            out.write(chunk)
+            rows += chunk.count('\r\n')
+    finally:
+        if args.output:
+            out.close()
+    if args.output:
+        print(f"{rows} attendance records written to {args.output}")
+    return 0
+
+
+def rebuild_summary_command(args):
+    from models import CourseSummary
+    started = time.perf_counter()
+    differences = CourseSummary.rebuild()
+    rows = CourseSummary.query.count()
+    print(f"Course summaries rebuilt: {rows} rows in {time.perf_counter() - started:.2f}s, "
+          f"{differences} differed from the attendance records")
+    return 1 if differences and args.check else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance server maintenance commands.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    roster = commands.add_parser('import-roster', help="enroll students from a CSV roster")
+    roster.add_argument('path', help="CSV with student_id,name[,device_uuid,pin] columns")
+    roster.set_defaults(run=import_roster_command)
+
+    export = commands.add_parser('export-attendance', help="write attendance records as CSV")
+    export.add_argument('--session', type=int, help="one session id")
+    export.add_argument('--course', help="a course code, e.g. CSC101")
+    export.add_argument('--from', dest='since', help="sessions started on or after (YYYY-MM-DD)")
+    export.add_argument('--to', dest='until', help="sessions started on or before (YYYY-MM-DD)")
+    export.add_argument('-o', '--output', help="CSV file to write (default: stdout)")
+    export.set_defaults(run=export_attendance_command)
+
+    rebuild = commands.add_parser('rebuild-summary',
+                                  help="recompute per-course attendance totals from the records")
+    rebuild.add_argument('--check', action='store_true',
+                         help="exit with status 1 if the stored totals were out of step")
+    rebuild.set_defaults(run=rebuild_summary_command)
+
+    args = parser.parse_args()
+    # Startup messages go to stderr so an export to stdout is clean CSV
+    with contextlib.redirect_stdout(sys.stderr):
+        app = create_app()
+    with app.app_context():
+        return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
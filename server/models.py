@@ -5,6 +5,8 @@ Local database tables:
 - Student: enrolled students with device binding
 - Session: attendance sessions (controlled by Arduino/lecturer)
 - Attendance: individual check-in records
+- AttendanceRemoval: attendance records deleted from a session, for dashboard catch-up
+- CourseSummary: per-course attendance totals per student, kept in step with Attendance
 - SyncQueue: tracks records pending cloud sync
 """
 from datetime import datetime
@@ -40,6 +42,17 @@ class Student(db.Model):
 class Session(db.Model):
     """An attendance session, typically one per class period."""
     __tablename__ = 'sessions'
+    __table_args__ = (
+        # Active session for a course
+        db.Index('ix_sessions_course_active', 'course_code', 'is_active'),
+        # ...of which there is at most one
+        db.Index('uq_sessions_course_active', 'course_code',
+                 unique=True, sqlite_where=db.text('is_active')),
+        # Session history, newest first
+        db.Index('ix_sessions_start_time', 'start_time'),
+        # A course's sessions in order, so exports stream without a sort
+        db.Index('ix_sessions_course_start', 'course_code', 'start_time'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     course_code = db.Column(db.String(20), nullable=False)
@@ -47,31 +60,112 @@ class Session(db.Model):
     start_time = db.Column(db.DateTime, default=datetime.utcnow)
     end_time = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
+    # Maintained in the same transaction as every attendance insert/delete,
+    # so reading the count never loads the attendance rows
+    attendance_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Last change number handed out to this session's attendance (see next_changes)
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     attendances = db.relationship('Attendance', backref='session', lazy=True)
 
-    def to_dict(self):
-        return {
+    @classmethod
+    def next_changes(cls, session_id, count=1):
+        """
+        Reserve `count` change numbers for a session's attendance in the
+        caller's transaction, and return the first. Numbers only grow, and
+        SQLite commits one writer at a time, so a dashboard that has seen
+        number N has seen every change below it.
+        """
+        from sqlalchemy import update
+
+        last = db.session.execute(
+            update(cls).where(cls.id == session_id)
+            .values(change_seq=cls.change_seq + count)
+            .returning(cls.change_seq)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        return last - count + 1
+
+    def to_dict(self, include_token=True):
+        data = {
             'id': self.id,
             'course_code': self.course_code,
             'session_token': self.session_token,
             'start_time': self.start_time.isoformat() if self.start_time else None,
             'end_time': self.end_time.isoformat() if self.end_time else None,
             'is_active': self.is_active,
-            'attendance_count': len(self.attendances)
+            'attendance_count': self.attendance_count or 0
         }
+        if not include_token:
+            # Students check in with the rotating QR token, never this one
+            del data['session_token']
+        return data
 
 
 class Attendance(db.Model):
     """A single attendance check-in record."""
     __tablename__ = 'attendance'
+    __table_args__ = (
+        # One attendance record per student per session, enforced by SQLite
+        db.Index('uq_attendance_student_session', 'student_id', 'session_id', unique=True),
+        # Session rosters and counts
+        db.Index('ix_attendance_session_id', 'session_id'),
+        # A student's history, newest first
+        db.Index('ix_attendance_student_timestamp', 'student_id', 'timestamp'),
+        # Replays of a queued offline check-in find their original record
+        db.Index('uq_attendance_idempotency_key', 'idempotency_key',
+                 unique=True, sqlite_where=db.text('idempotency_key IS NOT NULL')),
+        # A session's changes since a dashboard's last change number
+        db.Index('ix_attendance_session_change', 'session_id', 'change_seq'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
     session_id = db.Column(db.Integer, db.ForeignKey('sessions.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='present')  # present / late / flagged
+    idempotency_key = db.Column(db.String(64), nullable=True)  # client-chosen, per check-in
+    # Session.next_changes() number of the insert or last status change
+    change_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @classmethod
+    def listing(cls, *criterion):
+        """
+        Query for attendance rows joined to their student, selecting only the
+        columns listing_row_to_dict needs. One query, however many rows.
+        """
+        return db.session.query(
+            cls.id,
+            cls.student_id,
+            Student.student_id.label('student_matric'),
+            Student.name.label('student_name'),
+            cls.session_id,
+            cls.timestamp,
+            cls.status,
+            cls.change_seq
+        ).join(Student, cls.student_id == Student.id).filter(*criterion)
+
+    @staticmethod
+    def listing_row_to_dict(row):
+        """Same shape as to_dict(), for rows returned by listing()."""
+        return {
+            'id': row.id,
+            'student_id': row.student_id,
+            'student_matric': row.student_matric,
+            'student_name': row.student_name,
+            'session_id': row.session_id,
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+            'status': row.status,
+            'seq': row.change_seq
+        }
+
+    @classmethod
+    def status_totals(cls, *criterion):
+        """Count of matching rows per status, e.g. {'present': 40, 'late': 3}."""
+        rows = db.session.query(cls.status, db.func.count(cls.id))\
+            .filter(*criterion).group_by(cls.status).all()
+        return {status: count for status, count in rows}
 
     def to_dict(self):
         return {
@@ -81,21 +175,207 @@ class Attendance(db.Model):
             'student_name': self.student.name if self.student else None,
             'session_id': self.session_id,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-            'status': self.status
+            'status': self.status,
+            'seq': self.change_seq
+        }
+
+
+class AttendanceRemoval(db.Model):
+    """
+    An attendance record deleted from a session (marked absent), kept so a
+    reconnecting dashboard learns of the deletion along with every other
+    change since its last change number.
+    """
+    __tablename__ = 'attendance_removals'
+    __table_args__ = (
+        db.Index('ix_attendance_removals_session_change', 'session_id', 'change_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('sessions.id'), nullable=False)
+    attendance_id = db.Column(db.Integer, nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False)
+
+    @classmethod
+    def record(cls, session_id, attendance_id):
+        """Log a deletion in the caller's transaction. Returns its change number."""
+        change_seq = Session.next_changes(session_id)
+        db.session.add(cls(session_id=session_id, attendance_id=attendance_id, change_seq=change_seq))
+        return change_seq
+
+
+class CourseSummary(db.Model):
+    """
+    A student's attendance totals for one course. Every write to the
+    attendance table updates the matching row in the same transaction, so a
+    course report reads one row per student instead of every check-in.
+    `python manage.py rebuild-summary` recomputes the table from attendance.
+    """
+    __tablename__ = 'course_summaries'
+
+    STATUSES = ('present', 'late', 'flagged')
+
+    course_code = db.Column(db.String(20), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), primary_key=True)
+    present = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    late = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    flagged = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_seen = db.Column(db.DateTime, nullable=True)  # latest check-in timestamp
+
+    @classmethod
+    def record(cls, check_ins):
+        """
+        Count new attendance records, in the caller's transaction.
+        `check_ins` is a list of (course_code, student_pk, status, timestamp).
+        """
+        from sqlalchemy.dialects.sqlite import insert
+
+        if not check_ins:
+            return
+        stmt = insert(cls)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['course_code', 'student_id'],
+            set_={
+                'present': cls.present + excluded.present,
+                'late': cls.late + excluded.late,
+                'flagged': cls.flagged + excluded.flagged,
+                # SQLite's two-argument max(); stored timestamps sort as text
+                'last_seen': db.func.max(
+                    db.func.coalesce(cls.last_seen, excluded.last_seen), excluded.last_seen
+                ),
+            }
+        )
+        db.session.execute(stmt, [
+            dict({status: int(status == state) for status in cls.STATUSES},
+                 course_code=course_code, student_id=student_pk, last_seen=timestamp)
+            for course_code, student_pk, state, timestamp in check_ins
+        ])
+
+    @classmethod
+    def change_status(cls, course_code, student_pk, old_status, new_status):
+        """Move one record from one status to another, in the caller's transaction."""
+        values = {}
+        if old_status in cls.STATUSES:
+            values[old_status] = getattr(cls, old_status) - 1
+        if new_status in cls.STATUSES:
+            values[new_status] = getattr(cls, new_status) + 1
+        if old_status == new_status or not values:
+            return
+        db.session.query(cls).filter_by(course_code=course_code, student_id=student_pk)\
+            .update(values, synchronize_session=False)
+
+    @classmethod
+    def remove(cls, course_code, student_pk, status):
+        """
+        Uncount a deleted attendance record, in the caller's transaction
+        (after the delete is flushed, so last_seen falls back to the
+        student's previous check-in for the course).
+        """
+        previous = db.session.query(db.func.max(Attendance.timestamp))\
+            .join(Session, Attendance.session_id == Session.id)\
+            .filter(Attendance.student_id == student_pk, Session.course_code == course_code)\
+            .scalar_subquery()
+        summary = db.session.query(cls).filter_by(course_code=course_code, student_id=student_pk)
+        values = {'last_seen': previous}
+        if status in cls.STATUSES:
+            values[status] = getattr(cls, status) - 1
+        summary.update(values, synchronize_session=False)
+        summary.filter(cls.present + cls.late + cls.flagged <= 0).delete(synchronize_session=False)
+
+    @classmethod
+    def totals_query(cls):
+        """Every (course, student) total computed from the attendance table."""
+        return db.session.query(
+            Session.course_code,
+            Attendance.student_id,
+            *[db.func.sum(db.case((Attendance.status == status, 1), else_=0))
+              for status in cls.STATUSES],
+            db.func.max(Attendance.timestamp),
+        ).join(Session, Attendance.session_id == Session.id)\
+            .group_by(Session.course_code, Attendance.student_id)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute the whole table from the attendance records and replace it.
+        Returns how many (course, student) rows were wrong or missing before.
+        """
+        fresh = {(row[0], row[1]): tuple(row[2:]) for row in cls.totals_query()}
+        stored = {
+            (row.course_code, row.student_id): (row.present, row.late, row.flagged, row.last_seen)
+            for row in db.session.query(cls)
+        }
+        differences = sum(1 for key in fresh.keys() | stored.keys() if fresh.get(key) != stored.get(key))
+
+        db.session.query(cls).delete(synchronize_session=False)
+        if fresh:
+            db.session.execute(db.insert(cls), [
+                dict(zip(cls.STATUSES, totals[:3]), course_code=course_code,
+                     student_id=student_pk, last_seen=totals[3])
+                for (course_code, student_pk), totals in fresh.items()
+            ])
+        db.session.commit()
+        return differences
+
+    def to_dict(self):
+        return {
+            'course_code': self.course_code,
+            'student_id': self.student_id,
+            'present': self.present,
+            'late': self.late,
+            'flagged': self.flagged,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None
         }
 
 
 class SyncQueue(db.Model):
     """Tracks records that need to be synced to the cloud."""
     __tablename__ = 'sync_queue'
+    __table_args__ = (
+        # At most one pending entry per record; repeat changes coalesce into it
+        db.Index(
+            'uq_sync_queue_pending', 'table_name', 'record_id',
+            unique=True, sqlite_where=db.text("status = 'pending'")
+        ),
+        # Pending scans in queue order read only pending rows
+        db.Index('ix_sync_queue_pending', 'id', sqlite_where=db.text("status = 'pending'")),
+        # Compaction finds old synced rows without scanning the table
+        db.Index('ix_sync_queue_synced', 'synced_at', sqlite_where=db.text("status = 'synced'")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     table_name = db.Column(db.String(50), nullable=False)
     record_id = db.Column(db.Integer, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending / synced / failed
+    # Last time the record was queued: re-queuing a pending record refreshes it
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     synced_at = db.Column(db.DateTime, nullable=True)
 
+    @classmethod
+    def enqueue(cls, table_name, record_ids):
+        """
+        Queue records for cloud sync in the caller's transaction. A record
+        that is already pending keeps its single entry, with created_at
+        refreshed so a sync upload already in flight does not mark the
+        newer change as synced.
+        """
+        from sqlalchemy.dialects.sqlite import insert
+
+        if not record_ids:
+            return
+        now = datetime.utcnow()
+        stmt = insert(cls).on_conflict_do_update(
+            index_elements=['table_name', 'record_id'],
+            index_where=db.text("status = 'pending'"),
+            set_={'created_at': now}
+        )
+        db.session.execute(stmt, [
+            {'table_name': table_name, 'record_id': record_id,
+             'status': 'pending', 'created_at': now}
+            for record_id in record_ids
+        ])
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -1,15 +1,25 @@
 """
 Attendance routes: check-in, validation pipeline, manual overrides.
 """
-from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from sqlalchemy.exc import IntegrityError
 from database import db
-from models import Student, Session, Attendance, SyncQueue
+from models import Student, Session, Attendance, AttendanceRemoval, CourseSummary, SyncQueue
+from services.admission import admission_control
+from services.broadcaster import broadcaster
+from services.cache import validation_cache
+from services.checkin import CheckInError, check_in as process_check_in, check_in_batch
+from services.export import (
+    ExportError, attendance_query, export_filename, iter_csv, parse_date, parse_session_id
+)
+from services.query_profiler import query_budget
 
 attendance_bp = Blueprint('attendance', __name__)
 
 
 @attendance_bp.route('/api/check-in', methods=['POST'])
+@admission_control('check_in')
+@query_budget(3)
 def check_in():
     """
     Student submits attendance for the active session.
@@ -18,9 +28,13 @@ def check_in():
     {
         "student_id": "CSC/2023/001",
         "device_uuid": "abc-123-def-456",
-        "session_token": "xyz789..."
+        "session_token": "xyz789...",
+        "idempotency_key": "..."  (optional; lets a queued retry find this record)
     }
     
+    Rate-limited per device and address, and shed under load, with a 429
+    or 503 and a Retry-After header (services/admission.py).
+
     Validation pipeline:
     1. Session active?
     2. Token valid?
@@ -35,94 +49,127 @@ def check_in():
     student_id = data.get('student_id', '').strip()
     device_uuid = data.get('device_uuid', '').strip()
     session_token = data.get('session_token', '').strip()
+    idempotency_key = (data.get('idempotency_key') or '').strip() or None
 
     if not student_id or not device_uuid or not session_token:
         return jsonify({'error': 'student_id, device_uuid, and session_token are required'}), 400
 
-    # Step 1: Find the session and check if it's active
-    session = Session.query.filter_by(session_token=session_token).first()
-    if not session:
-        return jsonify({'error': 'Invalid session token'}), 404
-
-    if not session.is_active:
-        return jsonify({'error': 'Session has ended'}), 403
+    try:
+        attendance = process_check_in(student_id, device_uuid, session_token, idempotency_key)
+    except CheckInError as e:
+        body = {'error': e.message}
+        if e.attendance:
+            body['attendance'] = e.attendance.to_dict()
+        return jsonify(body), e.status_code
 
-    # Step 2: Token is valid (already validated by finding the session above)
+    return jsonify({
+        'message': f"Attendance recorded as {attendance['status']}",
+        'attendance': attendance
+    }), 201
 
-    # Step 3: Find the student and verify device binding
-    student = Student.query.filter_by(student_id=student_id).first()
-    if not student:
-        return jsonify({'error': 'Student not enrolled. Please enroll first.'}), 404
 
-    if student.device_uuid != device_uuid:
-        return jsonify({
-            'error': 'Device mismatch. This device is not registered to your account.'
-        }), 403
+@attendance_bp.route('/api/check-in/batch', methods=['POST'])
+@admission_control('check_in_batch')
+@query_budget(5)
+def check_in_batch_route():
+    """
+    Check-ins queued on a phone while it was offline, sent together.
 
-    if not student.is_active:
-        return jsonify({'error': 'Student account is deactivated'}), 403
+    Expects JSON:
+    {
+        "check_ins": [
+            {
+                "idempotency_key": "5b2c...",   (unique per check-in, chosen by the phone)
+                "student_id": "CSC/2023/001",
+                "device_uuid": "abc-123-def-456",
+                "session_token": "xyz789...",
+                "captured_at": "2026-03-02T09:14:05.120Z"
+            },
+            ...
+        ]
+    }
 
-    # Step 4: Check for duplicate submission
-    existing = Attendance.query.filter_by(
-        student_id=student.id,
-        session_id=session.id
-    ).first()
+    Responds 200 with one result per check-in, in order:
+    {"results": [{"idempotency_key": ..., "status": 201, "attendance": {...}}, ...]}
+    A status of 201 or 200 (already recorded under this key) means done.
+    Check-ins are timed and validated when they arrive; captured_at is
+    only echoed back with the result.
+    """
+    data = request.get_json(silent=True)
+    check_ins = data.get('check_ins') if isinstance(data, dict) else None
 
-    if existing:
-        return jsonify({
-            'error': 'Already checked in for this session',
-            'attendance': existing.to_dict()
-        }), 409
-
-    # All checks passed — determine status (present vs late)
-    late_threshold = current_app.config.get('LATE_THRESHOLD_MINUTES', 15)
-    now = datetime.utcnow()
-    status = 'present'
-
-    if session.start_time:
-        minutes_since_start = (now - session.start_time).total_seconds() / 60
-        if minutes_since_start > late_threshold:
-            status = 'late'
-
-    # Record attendance
-    attendance = Attendance(
-        student_id=student.id,
-        session_id=session.id,
-        status=status
-    )
+    if not isinstance(check_ins, list) or not check_ins:
+        return jsonify({'error': 'check_ins must be a non-empty list'}), 400
 
-    db.session.add(attendance)
-    db.session.commit()
+    limit = current_app.config.get('CHECKIN_BATCH_MAX', 50)
+    if len(check_ins) > limit:
+        return jsonify({'error': f'At most {limit} check-ins per batch'}), 413
 
-    # Queue for cloud sync
-    sync_entry = SyncQueue(table_name='attendance', record_id=attendance.id)
-    db.session.add(sync_entry)
-    db.session.commit()
+    records = []
+    for item in check_ins:
+        item = item if isinstance(item, dict) else {}
+        record = {
+            field: str(item.get(field) or '').strip()
+            for field in ('idempotency_key', 'student_id', 'device_uuid', 'session_token')
+        }
+        record['captured_at'] = item.get('captured_at')
+        records.append(record)
 
-    return jsonify({
-        'message': f'Attendance recorded as {status}',
-        'attendance': attendance.to_dict()
-    }), 201
+    return jsonify({'results': check_in_batch(records)}), 200
 
 
 @attendance_bp.route('/api/attendance/<int:session_id>', methods=['GET'])
+@query_budget(3)
 def get_session_attendance(session_id):
     """Get all attendance records for a specific session."""
     session = Session.query.get(session_id)
     if not session:
         return jsonify({'error': 'Session not found'}), 404
 
-    records = Attendance.query.filter_by(session_id=session_id).all()
+    records = Attendance.listing(Attendance.session_id == session_id)\
+        .order_by(Attendance.id).all()
+    totals = Attendance.status_totals(Attendance.session_id == session_id)
 
     return jsonify({
         'session': session.to_dict(),
-        'attendance': [r.to_dict() for r in records],
-        'total_present': sum(1 for r in records if r.status == 'present'),
-        'total_late': sum(1 for r in records if r.status == 'late'),
-        'total_flagged': sum(1 for r in records if r.status == 'flagged'),
+        # Read before the records, so a dashboard resuming from here sees
+        # anything that changed in between again rather than never
+        'seq': session.change_seq,
+        'attendance': [Attendance.listing_row_to_dict(r) for r in records],
+        'total_present': totals.get('present', 0),
+        'total_late': totals.get('late', 0),
+        'total_flagged': totals.get('flagged', 0),
     }), 200
 
 
+@attendance_bp.route('/api/attendance/export', methods=['GET'])
+def export_attendance():
+    """
+    Download attendance as CSV, streamed row by row.
+
+    Query parameters (all optional, combined with AND):
+        session_id  one session
+        course      a course code, e.g. CSC101
+        from, to    sessions started in this range (YYYY-MM-DD or ISO 8601;
+                    a bare `to` date includes that day)
+    """
+    course_code = request.args.get('course', '').strip() or None
+    try:
+        session_id = parse_session_id(request.args.get('session_id', '').strip())
+        since = parse_date(request.args.get('from'))
+        until = parse_date(request.args.get('to'), end=True)
+    except ExportError as e:
+        return jsonify({'error': e.message}), e.status_code
+
+    query = attendance_query(session_id, course_code, since, until)
+    filename = export_filename(session_id, course_code)
+    return Response(
+        stream_with_context(iter_csv(query)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
 @attendance_bp.route('/api/attendance/override', methods=['POST'])
 def manual_override():
     """
@@ -165,35 +212,58 @@ def manual_override():
     ).first()
 
     if status == 'absent' and existing:
-        # Remove the attendance record
+        # Remove the attendance record; the sync worker reports it as deleted
+        SyncQueue.enqueue('attendance', [existing.id])
         db.session.delete(existing)
+        session.attendance_count = Session.attendance_count - 1
+        db.session.flush()
+        CourseSummary.remove(session.course_code, student.id, existing.status)
+        change_seq = AttendanceRemoval.record(session.id, existing.id)
         db.session.commit()
+        validation_cache.invalidate_roster(session.id)
+        broadcaster.publish_removal(existing.id, session.id, session.course_code, change_seq)
         return jsonify({'message': 'Attendance record removed (marked absent)'}), 200
 
     if existing:
         # Update existing record
+        CourseSummary.change_status(session.course_code, student.id, existing.status, status)
         existing.status = status
+        existing.change_seq = Session.next_changes(session.id)
+        SyncQueue.enqueue('attendance', [existing.id])
         db.session.commit()
+        validation_cache.invalidate_roster(session.id)
+        record = existing.to_dict()
+        broadcaster.publish(record, session.course_code)
         return jsonify({
             'message': f'Attendance updated to {status}',
-            'attendance': existing.to_dict()
+            'attendance': record
         }), 200
     else:
         # Create new record (manual entry)
         attendance = Attendance(
             student_id=student.id,
             session_id=session_id,
-            status=status
+            status=status,
+            change_seq=Session.next_changes(session.id)
         )
         db.session.add(attendance)
-        db.session.commit()
-
-        # Queue for cloud sync
-        sync_entry = SyncQueue(table_name='attendance', record_id=attendance.id)
-        db.session.add(sync_entry)
-        db.session.commit()
+        session.attendance_count = Session.attendance_count + 1
+        db.session.flush()
+        CourseSummary.record([(session.course_code, student.id, status, attendance.timestamp)])
+
+        # Queue for cloud sync in the same transaction
+        SyncQueue.enqueue('attendance', [attendance.id])
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A check-in landed between the lookup above and this insert
+            db.session.rollback()
+            return jsonify({'error': 'Attendance was recorded concurrently, please retry'}), 409
+        validation_cache.invalidate_roster(session.id)
+        record = attendance.to_dict()
+        broadcaster.publish(record, session.course_code)
 
         return jsonify({
             'message': f'Attendance manually recorded as {status}',
-            'attendance': attendance.to_dict()
+            'attendance': record
         }), 201
@@ -1,15 +1,21 @@
 """
-Enrollment routes: student registration and device UUID binding.
+Enrollment routes: student registration, device UUID binding and bulk
+roster import.
 """
+import io
 from flask import Blueprint, request, jsonify
 from database import db
 from models import Student, SyncQueue
+from services.admission import admission_control
+from services.cache import validation_cache
+from services.roster import RosterImportError, import_roster
 from utils.security import hash_pin
 
 enrollment_bp = Blueprint('enrollment', __name__)
 
 
 @enrollment_bp.route('/api/enroll', methods=['POST'])
+@admission_control('enroll')
 def enroll_student():
     """
     Register a new student and bind their device.
@@ -66,12 +72,12 @@ def enroll_student():
     )
 
     db.session.add(student)
-    db.session.commit()
+    db.session.flush()
 
-    # Queue for cloud sync
-    sync_entry = SyncQueue(table_name='students', record_id=student.id)
-    db.session.add(sync_entry)
+    # Queue for cloud sync in the same transaction
+    SyncQueue.enqueue('students', [student.id])
     db.session.commit()
+    validation_cache.invalidate_student(student.student_id)
 
     return jsonify({
         'message': 'Enrollment successful',
@@ -80,6 +86,7 @@ def enroll_student():
 
 
 @enrollment_bp.route('/api/re-enroll', methods=['POST'])
+@admission_control('re_enroll')
 def request_re_enrollment():
     """
     Request a device change for an existing student.
@@ -114,12 +121,11 @@ def request_re_enrollment():
     # For now, we store the request. In a full system, this would go to an approval queue.
     # For the MVP, we just update directly (lecturer can supervise in person).
     student.device_uuid = new_device_uuid
-    db.session.commit()
 
-    # Queue for cloud sync
-    sync_entry = SyncQueue(table_name='students', record_id=student.id)
-    db.session.add(sync_entry)
+    # Queue for cloud sync in the same transaction
+    SyncQueue.enqueue('students', [student.id])
     db.session.commit()
+    validation_cache.invalidate_student(student.student_id)
 
     return jsonify({
         'message': 'Device re-enrollment successful',
@@ -138,3 +144,32 @@ def enrollment_status(student_id):
         'enrolled': True,
         'student': student.to_dict()
     }), 200
+
+
+@enrollment_bp.route('/api/students/import', methods=['POST'])
+def import_students():
+    """
+    Enroll a class from a CSV roster (see services/roster.py for the format).
+
+    Send the file as the request body (Content-Type: text/csv) or as the
+    `file` field of a multipart form. The body is read as a stream, so a
+    large roster is never held in memory. Returns the import report:
+    {"rows", "imported", "conflicts", "report": [{"line", "student_id", "reason"}], "seconds"}
+    """
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        stream = upload.stream
+    else:
+        stream = request.stream
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    try:
+        result = import_roster(lines)
+    except RosterImportError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Roster must be UTF-8 encoded CSV'}), 400
+
+    return jsonify(result), 200
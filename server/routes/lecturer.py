@@ -3,7 +3,8 @@ Lecturer routes: authentication, course management, student listing.
 """
 from flask import Blueprint, request, jsonify, session
 from database import db
-from models import Student
+from models import CourseSummary, Session, Student
+from services.query_profiler import query_budget
 
 lecturer_bp = Blueprint('lecturer', __name__)
 
@@ -43,6 +44,7 @@ def lecturer_logout():
 
 
 @lecturer_bp.route('/api/students', methods=['GET'])
+@query_budget(1)
 def list_students():
     """Get all enrolled students."""
     students = Student.query.order_by(Student.student_id).all()
@@ -63,21 +65,69 @@ def get_student(student_id):
 
 
 @lecturer_bp.route('/api/students/<student_id>/attendance', methods=['GET'])
+@query_budget(3)
 def student_attendance_history(student_id):
     """Get attendance history for a specific student."""
-    from models import Attendance, Session as AttSession
+    from models import Attendance
 
     student = Student.query.filter_by(student_id=student_id).first()
     if not student:
         return jsonify({'error': 'Student not found'}), 404
 
-    records = Attendance.query.filter_by(student_id=student.id)\
+    records = Attendance.listing(Attendance.student_id == student.id)\
         .order_by(Attendance.timestamp.desc()).all()
+    totals = Attendance.status_totals(Attendance.student_id == student.id)
 
     return jsonify({
         'student': student.to_dict(),
-        'attendance': [r.to_dict() for r in records],
+        'attendance': [Attendance.listing_row_to_dict(r) for r in records],
         'total_sessions_attended': len(records),
-        'present_count': sum(1 for r in records if r.status == 'present'),
-        'late_count': sum(1 for r in records if r.status == 'late'),
+        'present_count': totals.get('present', 0),
+        'late_count': totals.get('late', 0),
+    }), 200
+
+
+@lecturer_bp.route('/api/courses/<course_code>/summary', methods=['GET'])
+@query_budget(2)
+def course_summary(course_code):
+    """
+    Per-student attendance for a course: counts by status, attendance rate
+    over the course's sessions, and when each student last checked in.
+    Read from the course_summaries table, one row per student.
+    """
+    sessions_held = db.session.query(db.func.count(Session.id))\
+        .filter(Session.course_code == course_code).scalar()
+    if not sessions_held:
+        return jsonify({'error': 'No sessions found for this course'}), 404
+
+    rows = db.session.query(
+        Student.student_id,
+        Student.name,
+        CourseSummary.present,
+        CourseSummary.late,
+        CourseSummary.flagged,
+        CourseSummary.last_seen,
+    ).join(Student, CourseSummary.student_id == Student.id)\
+        .filter(CourseSummary.course_code == course_code)\
+        .order_by(Student.student_id).all()
+
+    students = []
+    for matric, name, present, late, flagged, last_seen in rows:
+        attended = present + late + flagged
+        students.append({
+            'student_id': matric,
+            'name': name,
+            'present': present,
+            'late': late,
+            'flagged': flagged,
+            'attended': attended,
+            'rate': round(attended / sessions_held, 3),
+            'last_seen': last_seen.isoformat() if last_seen else None
+        })
+
+    return jsonify({
+        'course_code': course_code,
+        'sessions': sessions_held,
+        'students': students,
+        'total': len(students)
     }), 200
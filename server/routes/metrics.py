@@ -0,0 +1,13 @@
+"""
+Metrics route: Prometheus-style text for scraping during class.
+"""
+from flask import Blueprint, Response
+from services.metrics import metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Current counters, gauges and latency histograms in the text exposition format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
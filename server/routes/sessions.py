@@ -1,17 +1,27 @@
 """
 Session routes: start/stop attendance sessions, QR code generation.
 """
-from datetime import datetime
-from flask import Blueprint, request, jsonify
-from database import db
+from flask import Blueprint, request, jsonify, make_response, current_app
 from models import Session
-from utils.security import generate_session_token
-from utils.qr import generate_qr_base64
+from services.qr_rotator import qr_payload
+from services import sessions as session_control
+from services.registry import active_sessions
+from services.sessions import SessionError
+from services.query_profiler import query_budget
+from utils.security import current_window
 
 sessions_bp = Blueprint('sessions', __name__)
 
 
+def _session_error_response(e):
+    body = {'error': e.message}
+    if e.session is not None:
+        body['session'] = e.session.to_dict()
+    return jsonify(body), e.status_code
+
+
 @sessions_bp.route('/api/session/start', methods=['POST'])
+@query_budget(4)
 def start_session():
     """
     Start a new attendance session.
@@ -26,31 +36,10 @@ def start_session():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
-    course_code = data.get('course_code', '').strip()
-    if not course_code:
-        return jsonify({'error': 'course_code is required'}), 400
-
-    # Check if there's already an active session for this course
-    active_session = Session.query.filter_by(
-        course_code=course_code, is_active=True
-    ).first()
-
-    if active_session:
-        return jsonify({
-            'error': 'An active session already exists for this course',
-            'session': active_session.to_dict()
-        }), 409
-
-    # Create new session
-    token = generate_session_token()
-    session = Session(
-        course_code=course_code,
-        session_token=token,
-        is_active=True
-    )
-
-    db.session.add(session)
-    db.session.commit()
+    try:
+        session = session_control.start_session(data.get('course_code', '').strip())
+    except SessionError as e:
+        return _session_error_response(e)
 
     return jsonify({
         'message': 'Session started',
@@ -59,6 +48,7 @@ def start_session():
 
 
 @sessions_bp.route('/api/session/end', methods=['POST'])
+@query_budget(4)
 def end_session():
     """
     End an active attendance session.
@@ -77,27 +67,13 @@ def end_session():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
-    session_id = data.get('session_id')
-    course_code = data.get('course_code', '').strip()
-
-    if session_id:
-        session = Session.query.get(session_id)
-    elif course_code:
-        session = Session.query.filter_by(
-            course_code=course_code, is_active=True
-        ).first()
-    else:
-        return jsonify({'error': 'session_id or course_code is required'}), 400
-
-    if not session:
-        return jsonify({'error': 'Session not found'}), 404
-
-    if not session.is_active:
-        return jsonify({'error': 'Session is already ended'}), 400
-
-    session.is_active = False
-    session.end_time = datetime.utcnow()
-    db.session.commit()
+    try:
+        session = session_control.end_session(
+            session_id=data.get('session_id'),
+            course_code=data.get('course_code', '').strip()
+        )
+    except SessionError as e:
+        return _session_error_response(e)
 
     return jsonify({
         'message': 'Session ended',
@@ -106,52 +82,77 @@ def end_session():
 
 
 @sessions_bp.route('/api/session/active', methods=['GET'])
+@query_budget(1)
 def get_active_session():
-    """Get the currently active session, optionally filtered by course code."""
+    """
+    Get the active session for a course, or every active session.
+
+    With ?course_code= the response holds that course's session (or none).
+    Without it, 'sessions' lists all active sessions, oldest first, and
+    'session' is the oldest, for clients that follow a single session.
+
+    Answered from the active-session registry, so it costs no query once the
+    registry is loaded. Supports conditional requests: clients that send
+    back the ETag get a 304 until a session starts or ends. Live attendance
+    counts are pushed over the socket (session_attendance_count), not
+    re-polled here.
+    """
+    etag = active_sessions.etag()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
     course_code = request.args.get('course_code', '').strip()
 
     if course_code:
-        session = Session.query.filter_by(
-            course_code=course_code, is_active=True
-        ).first()
+        session = active_sessions.for_course(course_code)
+        response = jsonify({
+            'active': session is not None,
+            'session': active_sessions.to_dict(session) if session else None
+        })
     else:
-        session = Session.query.filter_by(is_active=True).first()
-
-    if not session:
-        return jsonify({'active': False, 'session': None}), 200
+        sessions = [active_sessions.to_dict(s) for s in active_sessions.all()]
+        response = jsonify({
+            'active': bool(sessions),
+            'session': sessions[0] if sessions else None,
+            'sessions': sessions
+        })
 
-    return jsonify({
-        'active': True,
-        'session': session.to_dict()
-    }), 200
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response, 200
 
 
 @sessions_bp.route('/api/session/qr', methods=['GET'])
+@query_budget(1)
 def get_session_qr():
-    """Generate a QR code for the active session's token."""
+    """Generate a QR code for the active session's current rotating token."""
     course_code = request.args.get('course_code', '').strip()
 
     if course_code:
-        session = Session.query.filter_by(
-            course_code=course_code, is_active=True
-        ).first()
+        session = active_sessions.for_course(course_code)
     else:
-        session = Session.query.filter_by(is_active=True).first()
+        sessions = active_sessions.all()
+        session = sessions[0] if sessions else None
 
     if not session:
         return jsonify({'error': 'No active session'}), 404
 
-    qr_data = f"{session.session_token}"
-    qr_image = generate_qr_base64(qr_data)
+    # The QR carries a token that rotates every QR_REFRESH_INTERVAL seconds;
+    # rendered images are cached, so repeat requests in a window are cheap
+    interval = current_app.config['QR_REFRESH_INTERVAL']
+    image_format = request.args.get('format', current_app.config['QR_IMAGE_FORMAT'])
+    if image_format not in ('png', 'svg'):
+        return jsonify({'error': 'format must be png or svg'}), 400
 
-    return jsonify({
-        'session_token': session.session_token,
-        'course_code': session.course_code,
-        'qr_code': qr_image
-    }), 200
+    return jsonify(
+        qr_payload(session, current_window(interval), interval, image_format)
+    ), 200
 
 
 @sessions_bp.route('/api/sessions/history', methods=['GET'])
+@query_budget(1)
 def session_history():
     """Get session history, optionally filtered by course code."""
     course_code = request.args.get('course_code', '').strip()
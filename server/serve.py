@@ -0,0 +1,126 @@
+"""
+Production launcher: runs the server as several worker processes.
+
+    python serve.py                  # one worker per CPU core, port 5000
+    python serve.py --workers 4 --port 8000
+
+Every worker is a full copy of app.py listening on the same port with
+SO_REUSEPORT, so check-ins are handled by all cores at once. Socket.IO
+broadcasts, cache invalidations and active-session changes are shared
+between workers through Unix sockets in a private temporary directory
+(see services/cluster.py); nothing but the Pi itself is needed. The
+kernel does not keep a client on one worker, so Socket.IO accepts
+WebSocket connections only (no long-polling fallback). Worker 0
+also runs the singleton services: QR rotation, cloud sync and the serial
+bridge.
+
+A worker that dies is restarted. Ctrl+C or SIGTERM stops them all.
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from config import Config
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+RESTART_DELAY = 1        # seconds before a crashed worker is restarted
+READY_TIMEOUT = 60       # seconds worker 0 gets to create/migrate the database
+
+WORKER_CODE = "import app; app.serve_worker({host!r}, {port})"
+
+
+def default_workers():
+    return Config.WORKERS or os.cpu_count() or 1
+
+
+class Supervisor:
+    """Starts the workers, restarts crashed ones, and stops them together."""
+
+    def __init__(self, workers, host, port):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.ipc_dir = tempfile.mkdtemp(prefix='attendance-ipc-')
+        self.processes = {}   # worker index -> Popen
+        self.stopping = False
+
+    def spawn(self, index):
+        env = dict(os.environ,
+                   WORKER_INDEX=str(index),
+                   IPC_DIR=self.ipc_dir)
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, '-c', WORKER_CODE.format(host=self.host, port=self.port)],
+            cwd=SERVER_DIR, env=env
+        )
+
+    def wait_until_listening(self, process):
+        """Wait for worker 0, so only one process creates or migrates the schema."""
+        address = '127.0.0.1' if self.host in ('0.0.0.0', '') else self.host
+        deadline = time.time() + READY_TIMEOUT
+        while time.time() < deadline:
+            if process.poll() is not None:
+                return False
+            try:
+                socket.create_connection((address, self.port), timeout=1).close()
+                return True
+            except OSError:
+                time.sleep(0.2)
+        return False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            self.spawn(0)
+            if not self.wait_until_listening(self.processes[0]):
+                print("[SERVE] Worker 0 did not start; see its output above")
+                return 1
+            for index in range(1, self.workers):
+                self.spawn(index)
+            print(f"[SERVE] {self.workers} worker(s) on port {self.port}")
+
+            while not self.stopping:
+                for index, process in list(self.processes.items()):
+                    if process.poll() is not None and not self.stopping:
+                        print(f"[SERVE] Worker {index} exited with {process.returncode}; restarting")
+                        time.sleep(RESTART_DELAY)
+                        self.spawn(index)
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        return 0
+
+    def stop(self):
+        if self.stopping:
+            return
+        self.stopping = True
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(self.ipc_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the attendance server with several workers.")
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help="worker processes (default: WORKERS or one per CPU core)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+    return Supervisor(max(1, args.workers), args.host, args.port).run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
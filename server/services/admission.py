@@ -0,0 +1,180 @@
+"""
+Admission control for check-in and enrollment.
+
+Every check-in (HTTP, batch or the `check_in` socket event) and every
+enrollment passes through admission.admit() before any validation or
+database work. Rejections are fast, cost no query, and tell the client
+when to come back:
+
+1. Shedding (503): the check-in writer has ADMISSION_MAX_QUEUE_DEPTH or
+   more records waiting, so anything new would only time out behind them.
+2. Concurrency cap (503): ADMISSION_MAX_IN_FLIGHT requests are already
+   being handled.
+3. Rate limits (429): a token bucket per device_uuid and one per client
+   address. A phone stuck in a retry loop, or a script, runs its own
+   bucket dry and leaves everyone else's alone.
+
+The Retry-After hint for a 503 is spread over a few seconds, so phones
+that were shed together do not all come back together.
+
+Limits are held per process: in production mode each worker keeps its
+own buckets and its own in-flight count. Rejections and the current
+in-flight count are reported at /api/metrics.
+"""
+import functools
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import current_app, jsonify, request
+from services.metrics import admission_admitted, admission_rejected
+
+
+class AdmissionRejected(Exception):
+    """A request turned away before any work was done on it."""
+
+    def __init__(self, message, status_code, retry_after, reason):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+    def retry_after_seconds(self):
+        """For response bodies: tenths of a second, never 0 (clients treat 0 as no retry)."""
+        return max(0.1, round(self.retry_after, 1))
+
+    def retry_after_header(self):
+        """Whole seconds, as the Retry-After header requires."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBuckets:
+    """One token bucket per client key, least recently seen dropped first."""
+
+    def __init__(self):
+        self._buckets = OrderedDict()   # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, max_keys, now=None):
+        """
+        Take one token from a key's bucket. Returns 0 if it was granted,
+        otherwise the seconds until the bucket has a token again.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                while len(self._buckets) > max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """Decides, in microseconds, whether a request may be handled now."""
+
+    def __init__(self):
+        self.devices = TokenBuckets()
+        self.addresses = TokenBuckets()
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, endpoint, device_uuid=None, address=None):
+        """
+        Hold an in-flight slot for the body of the with block, or raise
+        AdmissionRejected if the request is to be turned away.
+        """
+        config = current_app.config
+        try:
+            self._check_load(config)
+            self._check_rate(config, device_uuid, address)
+        except AdmissionRejected as e:
+            admission_rejected.inc(endpoint, e.reason)
+            raise
+
+        with self._lock:
+            if self.in_flight >= config.get('ADMISSION_MAX_IN_FLIGHT', 800):
+                admission_rejected.inc(endpoint, 'concurrency')
+                raise AdmissionRejected(
+                    'Server busy, try again shortly', 503, self._backoff(config), 'concurrency'
+                )
+            self.in_flight += 1
+        admission_admitted.inc(endpoint)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _check_load(self, config):
+        from services.writer import checkin_writer
+
+        if checkin_writer.queue_depth() >= config.get('ADMISSION_MAX_QUEUE_DEPTH', 2000):
+            raise AdmissionRejected(
+                'Server busy, try again shortly', 503, self._backoff(config), 'queue_depth'
+            )
+
+    def _check_rate(self, config, device_uuid, address):
+        max_keys = config.get('ADMISSION_MAX_CLIENTS', 20000)
+        limits = (
+            (self.devices, device_uuid, 'device_rate',
+             config.get('ADMISSION_DEVICE_RATE', 1.0), config.get('ADMISSION_DEVICE_BURST', 10)),
+            (self.addresses, address, 'address_rate',
+             config.get('ADMISSION_ADDRESS_RATE', 20.0), config.get('ADMISSION_ADDRESS_BURST', 60)),
+        )
+        for buckets, key, reason, rate, burst in limits:
+            if not key or rate <= 0:
+                continue
+            wait = buckets.take(key, rate, burst, max_keys)
+            if wait:
+                raise AdmissionRejected('Too many requests, slow down', 429, wait, reason)
+
+    def _backoff(self, config):
+        base = config.get('ADMISSION_RETRY_AFTER', 2)
+        return base * (1 + random.random())
+
+
+admission = AdmissionController()
+
+
+def _device_of(data):
+    """The device a check-in or enrollment body speaks for, if it names one."""
+    if not isinstance(data, dict):
+        return None
+    device = data.get('device_uuid') or data.get('new_device_uuid')
+    check_ins = data.get('check_ins')
+    if not device and isinstance(check_ins, list) and check_ins and isinstance(check_ins[0], dict):
+        device = check_ins[0].get('device_uuid')
+    return (str(device).strip() or None) if device else None
+
+
+def admission_control(endpoint):
+    """Run a view only if admission lets the request in; 429/503 otherwise."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            device_uuid = _device_of(request.get_json(silent=True))
+            try:
+                with admission.admit(endpoint, device_uuid, request.remote_addr):
+                    return view(*args, **kwargs)
+            except AdmissionRejected as e:
+                response = jsonify({'error': e.message, 'retry_after': e.retry_after_seconds()})
+                response.headers['Retry-After'] = e.retry_after_header()
+                return response, e.status_code
+        return wrapper
+    return decorator
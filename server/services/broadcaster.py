@@ -0,0 +1,171 @@
+"""
+Coalesced live updates for the lecturer dashboard and session rooms.
+
+Check-ins are gathered for BROADCAST_INTERVAL_MS and then sent as one
+compact `attendance_batch` per session to the lecturer rooms (the
+all-courses room and the session's course room), plus one
+`session_attendance_count` to the session room, instead of an emit and a
+COUNT query per check-in. Clients on the compact wire format get the
+same events through compact rooms (services/wire.py).
+
+A batch carries new check-ins, records whose status a lecturer changed
+(same id, new status) and, under `removed`, the ids of records marked
+absent. Every change has a per-session change number, handed out in the
+database by Session.next_changes(): each record carries its own as `seq`
+and the batch carries the highest. Batches from different workers can
+arrive out of order, so a dashboard keeps a record's newest `seq` and
+remembers the highest it has seen. After a reconnect it sends
+`attendance_catch_up` with that number, and gets back one batch with
+every change since.
+
+Session lifecycle events (`session_started` / `session_ended`) are rare
+and go out immediately through announce().
+"""
+import threading
+from flask import current_app
+from database import db
+from services.registry import active_sessions, lecturer_room, session_room
+from services.wire import emit_to_rooms
+
+LECTURER_ROOM = 'lecturer_dashboard'
+
+
+def compact_record(record):
+    """Strip an attendance dict down to what the dashboard renders."""
+    return {
+        'id': record['id'],
+        'student_matric': record['student_matric'],
+        'student_name': record['student_name'],
+        'timestamp': record['timestamp'],
+        'status': record['status'],
+        'seq': record['seq']
+    }
+
+
+class AttendanceBroadcaster:
+    """Gathers check-ins and emits them in batches."""
+
+    def __init__(self):
+        self.socketio = None
+        self.app = None
+        self.interval = 0.25
+        self._pending = {}   # session id -> {'course', 'records': {id: record}, 'removed': {id: seq}}
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+
+    def init_socketio(self, socketio):
+        self.socketio = socketio
+
+    def announce(self, event, payload):
+        """Push an event straight to every connected client (not batched)."""
+        if self.socketio is not None:
+            self.socketio.emit(event, payload)
+
+    def publish(self, record, course_code):
+        """Queue a new or changed attendance record for the next batch."""
+        self._queue(record['session_id'], course_code, record=record)
+
+    def publish_removal(self, attendance_id, session_id, course_code, change_seq):
+        """Queue the removal of an attendance record (marked absent)."""
+        self._queue(session_id, course_code, removed=(attendance_id, change_seq))
+
+    def _queue(self, session_id, course_code, record=None, removed=None):
+        if self.socketio is None:
+            return
+
+        with self._lock:
+            if self.app is None:
+                self.app = current_app._get_current_object()
+                self.interval = self.app.config.get('BROADCAST_INTERVAL_MS', 250) / 1000
+
+            entry = self._pending.setdefault(session_id, {
+                'course': course_code, 'records': {}, 'removed': {}
+            })
+            if record is not None:
+                entry['records'][record['id']] = compact_record(record)
+                entry['removed'].pop(record['id'], None)
+            else:
+                attendance_id, change_seq = removed
+                entry['records'].pop(attendance_id, None)
+                entry['removed'][attendance_id] = change_seq
+
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+
+        self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.socketio.sleep(self.interval)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flush_scheduled = False
+
+        with self.app.app_context():
+            for session_id, entry in pending.items():
+                self._emit_batch(session_id, entry['course'], entry['records'], entry['removed'])
+
+    def _emit_batch(self, session_id, course_code, records, removed):
+        """Send one session's gathered changes: records and removals by attendance id."""
+        from models import Session
+
+        count = db.session.query(Session.attendance_count)\
+            .filter(Session.id == session_id).scalar() or 0
+        db.session.close()
+        active_sessions.set_count(session_id, count)
+
+        seqs = [r['seq'] for r in records.values()] + list(removed.values())
+        batch = {
+            'session_id': session_id,
+            'count': count,
+            'seq': max(seqs),
+            'records': list(records.values())
+        }
+        if removed:
+            batch['removed'] = sorted(removed)
+        emit_to_rooms(self.socketio, 'attendance_batch', batch,
+                      [LECTURER_ROOM, lecturer_room(course_code)])
+
+        emit_to_rooms(self.socketio, 'session_attendance_count', {
+            'session_id': session_id,
+            'count': count
+        }, [session_room(session_id)])
+
+    def changes_since(self, session_id, since):
+        """
+        Every change to a session's attendance after change number `since`,
+        as a single batch for a reconnecting dashboard: records added or
+        changed, and under `removed` the ids of records deleted. Returns
+        None if the session does not exist.
+        """
+        from models import Attendance, AttendanceRemoval, Session
+
+        session = db.session.get(Session, session_id)
+        if not session:
+            return None
+
+        # Read the removals first: a record deleted and re-added (its id
+        # reused) in between then shows up as a record, not a removal
+        removed = {
+            attendance_id for attendance_id, in db.session.query(AttendanceRemoval.attendance_id)
+            .filter(AttendanceRemoval.session_id == session_id,
+                    AttendanceRemoval.change_seq > since)
+        }
+        rows = Attendance.listing(
+            Attendance.session_id == session_id, Attendance.change_seq > since
+        ).order_by(Attendance.change_seq).all()
+        records = [compact_record(Attendance.listing_row_to_dict(r)) for r in rows]
+
+        batch = {
+            'session_id': session_id,
+            'count': session.attendance_count,
+            'seq': session.change_seq,
+            'records': records
+        }
+        removed -= {r['id'] for r in records}
+        if removed:
+            batch['removed'] = sorted(removed)
+        return batch
+
+
+broadcaster = AttendanceBroadcaster()
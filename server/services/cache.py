@@ -0,0 +1,211 @@
+"""
+In-memory validation cache for the check-in pipeline.
+
+Holds everything a check-in is validated against — sessions by token,
+students by matric number, and the set of students already checked in to
+each session — so a burst of check-ins does not turn into a burst of
+SQLite point lookups. Every write path that changes one of these records
+must invalidate the matching entry; in production mode the invalidation
+is passed on to the other worker processes' caches as well.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+from config import Config
+from database import db
+from services.cluster import cluster
+
+CachedSession = namedtuple(
+    'CachedSession', 'id course_code session_token start_time is_active'
+)
+CachedStudent = namedtuple(
+    'CachedStudent', 'id student_id name device_uuid is_active'
+)
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ValidationCache:
+    """Process-local cache of the records the validation pipeline reads."""
+
+    def __init__(self, max_sessions, max_students):
+        self.sessions = LRUCache(max_sessions)   # session_token -> CachedSession
+        self.session_tokens = LRUCache(max_sessions)  # session id -> session_token
+        self.students = LRUCache(max_students)   # matric number -> CachedStudent
+        self.rosters = LRUCache(max_sessions)    # session id -> set of student ids
+        self._roster_lock = threading.Lock()
+
+    # ─── Lookups (load on miss) ─────────────────────────
+
+    def get_session(self, session_token):
+        """Return the CachedSession for a token, or None if no such session."""
+        cached = self.sessions.get(session_token)
+        if cached is None:
+            from models import Session
+            session = Session.query.filter_by(session_token=session_token).first()
+            if not session:
+                return None
+            cached = self._cache_session(session)
+        return cached
+
+    def get_session_by_id(self, session_id):
+        """Return the CachedSession with this id, or None if no such session."""
+        session_token = self.session_tokens.get(session_id)
+        if session_token is not None:
+            return self.get_session(session_token)
+
+        from models import Session
+        session = db.session.get(Session, session_id)
+        if not session:
+            return None
+        return self._cache_session(session)
+
+    def _cache_session(self, session):
+        cached = CachedSession(
+            id=session.id,
+            course_code=session.course_code,
+            session_token=session.session_token,
+            start_time=session.start_time,
+            is_active=session.is_active,
+        )
+        self.sessions.put(session.session_token, cached)
+        self.session_tokens.put(session.id, session.session_token)
+        return cached
+
+    def get_student(self, student_id):
+        """Return the CachedStudent for a matric number, or None if not enrolled."""
+        cached = self.students.get(student_id)
+        if cached is None:
+            from models import Student
+            student = Student.query.filter_by(student_id=student_id).first()
+            if not student:
+                return None
+            cached = self._cache_student(student)
+        return cached
+
+    def preload_students(self, student_ids):
+        """Load every student not yet cached in one query (for batches)."""
+        missing = {s for s in student_ids if self.students.get(s) is None}
+        if missing:
+            from models import Student
+            for student in Student.query.filter(Student.student_id.in_(missing)):
+                self._cache_student(student)
+
+    def _cache_student(self, student):
+        cached = CachedStudent(
+            id=student.id,
+            student_id=student.student_id,
+            name=student.name,
+            device_uuid=student.device_uuid,
+            is_active=student.is_active,
+        )
+        self.students.put(student.student_id, cached)
+        return cached
+
+    def _roster(self, session_id):
+        """Set of student ids already checked in to a session. Caller holds the lock."""
+        roster = self.rosters.get(session_id)
+        if roster is None:
+            from models import Attendance
+            rows = db.session.query(Attendance.student_id)\
+                .filter_by(session_id=session_id).all()
+            roster = {row[0] for row in rows}
+            self.rosters.put(session_id, roster)
+        return roster
+
+    # ─── Check-in bookkeeping ───────────────────────────
+
+    def claim_check_in(self, session_id, student_pk):
+        """
+        Atomically mark a student as checked in to a session.
+        Returns False if they were already marked, so concurrent duplicate
+        submissions cannot both pass validation.
+        """
+        with self._roster_lock:
+            roster = self._roster(session_id)
+            if student_pk in roster:
+                return False
+            roster.add(student_pk)
+            return True
+
+    def release_check_in(self, session_id, student_pk):
+        """Undo a claim whose write did not go through."""
+        with self._roster_lock:
+            roster = self.rosters.get(session_id)
+            if roster is not None:
+                roster.discard(student_pk)
+
+    # ─── Invalidation ───────────────────────────────────
+
+    def invalidate_student(self, student_id):
+        self.drop('student', student_id)
+        cluster.publish('cache', 'student', student_id)
+
+    def invalidate_session(self, session_token, session_id=None):
+        self.drop('session', session_token, session_id)
+        cluster.publish('cache', 'session', session_token, session_id)
+
+    def invalidate_roster(self, session_id):
+        self.drop('roster', session_id)
+        cluster.publish('cache', 'roster', session_id)
+
+    def clear(self):
+        self.drop('all')
+        cluster.publish('cache', 'all')
+
+    def drop(self, kind, *keys):
+        """Remove entries from this process's cache only."""
+        if kind == 'student':
+            self.students.pop(keys[0])
+        elif kind == 'session':
+            session_token, session_id = keys
+            self.sessions.pop(session_token)
+            if session_id is not None:
+                self.session_tokens.pop(session_id)
+                self.rosters.pop(session_id)
+        elif kind == 'roster':
+            self.rosters.pop(keys[0])
+        elif kind == 'all':
+            self.sessions.clear()
+            self.session_tokens.clear()
+            self.students.clear()
+            self.rosters.clear()
+
+
+validation_cache = ValidationCache(
+    max_sessions=Config.CACHE_MAX_SESSIONS,
+    max_students=Config.CACHE_MAX_STUDENTS,
+)
+cluster.subscribe('cache', validation_cache.drop, lambda: validation_cache.drop('all'))
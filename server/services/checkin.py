@@ -0,0 +1,349 @@
+"""
+Check-in pipeline shared by the HTTP route and the WebSocket handler.
+
+Validation pipeline:
+1. Session active?
+2. Token valid? (a rotating QR token; the static one only if allowed)
+3. Device matches student?
+4. Student not already marked?
+
+Validation runs entirely against the in-memory validation cache; only an
+accepted check-in touches the database. Accepted check-ins are handed to
+the broadcaster for the next live update batch.
+
+check_in_batch() runs the same pipeline for check-ins a phone queued while
+offline. Each carries an idempotency key, so a batch that is sent again
+gets the original results back, and the time it was captured. The capture
+time comes from the phone, so it is only echoed back: tokens, present vs
+late and the recorded timestamp all go by the server's clock when the
+batch arrives.
+"""
+import hmac
+from datetime import datetime, timezone
+from functools import lru_cache
+from urllib.parse import urlencode
+from flask import current_app
+from database import db
+from models import Attendance
+from services.broadcaster import broadcaster
+from services.cache import validation_cache
+from services.writer import DuplicateCheckIn, IdempotencyKeyConflict, WriteTimeout, checkin_writer
+from utils.security import current_window, generate_rotating_token, parse_rotating_token
+
+
+class CheckInError(Exception):
+    """A check-in rejected by the validation pipeline."""
+
+    def __init__(self, message, status_code, attendance=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.attendance = attendance
+
+
+# Tokens for the current window are computed when the QR is rendered, so
+# validating a scanned token is normally a cache hit, not an HMAC
+_rotating_token = lru_cache(maxsize=4096)(generate_rotating_token)
+
+
+def qr_token_for(session, window=None):
+    """The rotating QR token for a session in the given (default: current) window."""
+    config = current_app.config
+    if window is None:
+        window = current_window(config['QR_REFRESH_INTERVAL'])
+    return _rotating_token(session.id, session.session_token, window, config['HMAC_SECRET'])
+
+
+def qr_link(qr_token):
+    """What the QR encodes: the student app URL carrying the token, which a phone camera opens."""
+    base_url = current_app.config.get('QR_CHECKIN_URL')
+    if not base_url:
+        return qr_token
+    return f"{base_url}?{urlencode({'qr': qr_token})}"
+
+
+def resolve_session_token(token):
+    """
+    Map a check-in token to its cached session, or None if it is not valid.
+
+    Accepts a rotating QR token from the current window or one of the
+    QR_GRACE_WINDOWS before it. The session's static token is accepted only
+    when QR_REQUIRE_ROTATING_TOKEN is turned off: it never changes, so a
+    screenshot of it would check anyone in for the whole session. Neither
+    case touches the database once the session is cached.
+    """
+    config = current_app.config
+    parsed = parse_rotating_token(token)
+    if parsed is None:
+        if config.get('QR_REQUIRE_ROTATING_TOKEN'):
+            return None
+        return validation_cache.get_session(token)
+
+    session_id, window = parsed
+    now_window = current_window(config['QR_REFRESH_INTERVAL'])
+    if not now_window - config.get('QR_GRACE_WINDOWS', 1) <= window <= now_window:
+        return None
+
+    session = validation_cache.get_session_by_id(session_id)
+    if not session or not hmac.compare_digest(qr_token_for(session, window), token):
+        return None
+    return session
+
+
+def validate_check_in(student_id, device_uuid, session_token):
+    """
+    Validate a check-in and claim the student's slot in the session.
+    Returns (session, student) as cached records, or raises CheckInError.
+    """
+    session, student = check_credentials(student_id, device_uuid, session_token)
+
+    # Step 4: Check for duplicate submission
+    if not validation_cache.claim_check_in(session.id, student.id):
+        existing = Attendance.query.filter_by(
+            student_id=student.id,
+            session_id=session.id
+        ).first()
+        raise CheckInError('Already checked in for this session', 409, attendance=existing)
+
+    return session, student
+
+
+def check_credentials(student_id, device_uuid, session_token):
+    """Steps 1-3 of the pipeline. Returns (session, student) or raises CheckInError."""
+    # Steps 1 & 2: Find the session, check the token and that it's active
+    session = resolve_session_token(session_token)
+    if not session:
+        raise CheckInError('Invalid session token', 404)
+
+    if not session.is_active:
+        raise CheckInError('Session has ended', 403)
+
+    # Step 3: Find the student and verify device binding
+    student = validation_cache.get_student(student_id)
+    if not student:
+        raise CheckInError('Student not enrolled. Please enroll first.', 404)
+
+    if student.device_uuid != device_uuid:
+        raise CheckInError(
+            'Device mismatch. This device is not registered to your account.', 403
+        )
+
+    if not student.is_active:
+        raise CheckInError('Student account is deactivated', 403)
+
+    return session, student
+
+
+def attendance_status(session, now=None):
+    """Determine present vs late for a check-in at `now`."""
+    late_threshold = current_app.config.get('LATE_THRESHOLD_MINUTES', 15)
+    now = now or datetime.utcnow()
+
+    if session.start_time:
+        minutes_since_start = (now - session.start_time).total_seconds() / 60
+        if minutes_since_start > late_threshold:
+            return 'late'
+    return 'present'
+
+
+KEY_CONFLICT = 'idempotency_key was already used for another check-in'
+
+
+def record_check_in(session, student, idempotency_key=None):
+    """
+    Hand an accepted check-in to the group-commit writer and wait until it
+    is durable. Returns the attendance record as a dict (same shape as
+    Attendance.to_dict), built without reading it back from the database.
+    """
+    now = datetime.utcnow()
+    status = attendance_status(session, now)
+
+    # Give this request's connection back to the pool before waiting, so
+    # a burst of waiting requests cannot starve the writer of connections
+    db.session.close()
+
+    pending = checkin_writer.submit(student.id, session.id, session.course_code, status, now, idempotency_key)
+    try:
+        attendance_id = pending.wait(current_app.config.get('CHECKIN_WRITE_TIMEOUT', 10))
+    except WriteTimeout:
+        # The write may still land, so keep the student's slot claimed
+        raise CheckInError('Server busy, please try again', 503)
+    except DuplicateCheckIn:
+        # Recorded elsewhere (another worker, or a manual override) since the
+        # cache was filled; the unique index caught it
+        existing = Attendance.query.filter_by(
+            student_id=student.id,
+            session_id=session.id
+        ).first()
+        raise CheckInError('Already checked in for this session', 409, attendance=existing)
+    except IdempotencyKeyConflict:
+        # Nothing was recorded for this student, so free the slot for a retry
+        validation_cache.release_check_in(session.id, student.id)
+        raise CheckInError(KEY_CONFLICT, 422)
+    except Exception:
+        validation_cache.release_check_in(session.id, student.id)
+        raise
+
+    return _attendance_dict(attendance_id, session, student, now, status, pending.change_seq)
+
+
+def _attendance_dict(attendance_id, session, student, timestamp, status, change_seq):
+    return {
+        'id': attendance_id,
+        'student_id': student.id,
+        'student_matric': student.student_id,
+        'student_name': student.name,
+        'session_id': session.id,
+        'timestamp': timestamp.isoformat(),
+        'status': status,
+        'seq': change_seq
+    }
+
+
+def check_in(student_id, device_uuid, session_token, idempotency_key=None):
+    """Run the full pipeline. Returns the attendance dict or raises CheckInError."""
+    session, student = validate_check_in(student_id, device_uuid, session_token)
+    attendance = record_check_in(session, student, idempotency_key)
+    broadcaster.publish(attendance, session.course_code)
+    return attendance
+
+
+# ─── Batches of queued check-ins ───────────────────────
+
+MAX_IDEMPOTENCY_KEY = 64   # attendance.idempotency_key column length
+
+
+def capture_time(captured_at):
+    """
+    When the phone says a queued check-in was made, as a naive UTC datetime.
+    Accepts an ISO 8601 string or epoch milliseconds; None if not given.
+    """
+    if captured_at is None:
+        return None
+    try:
+        if isinstance(captured_at, (int, float)) and not isinstance(captured_at, bool):
+            captured = datetime.fromtimestamp(captured_at / 1000, timezone.utc)
+        else:
+            captured = datetime.fromisoformat(str(captured_at).replace('Z', '+00:00'))
+    except (ValueError, OverflowError, OSError):
+        raise CheckInError('Invalid captured_at', 400)
+    if captured.tzinfo is not None:
+        captured = captured.astimezone(timezone.utc).replace(tzinfo=None)
+    return captured
+
+
+def _batch_result(key, status, attendance=None, error=None):
+    result = {'idempotency_key': key, 'status': status}
+    if attendance is not None:
+        result['attendance'] = attendance
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+def check_in_batch(records):
+    """
+    Validate and record a list of queued check-ins, committed together by
+    the group-commit writer. Each record is a dict with idempotency_key,
+    student_id, device_uuid, session_token and captured_at.
+
+    Returns one result per record, in order, with an HTTP-style status:
+    201 recorded now, 200 already recorded under the same idempotency key,
+    409 already checked in by another request, 422 the key is taken by
+    another student's or session's check-in, or the pipeline's error.
+    A 201 result also carries the phone's captured_at, for display only.
+    """
+    now = datetime.utcnow()
+    results = [None] * len(records)
+    accepted = []     # (index, session, student, status, captured)
+    duplicates = []   # (index, student pk, session id)
+
+    keys = [r['idempotency_key'] for r in records if r.get('idempotency_key')]
+    replayed = {}
+    if keys:
+        rows = Attendance.listing(Attendance.idempotency_key.in_(keys))\
+            .add_columns(Attendance.idempotency_key).all()
+        replayed = {row.idempotency_key: Attendance.listing_row_to_dict(row) for row in rows}
+
+    validation_cache.preload_students(r['student_id'] for r in records if r.get('student_id'))
+
+    for index, record in enumerate(records):
+        key = record.get('idempotency_key')
+        if not key or not record.get('student_id') or not record.get('device_uuid') \
+                or not record.get('session_token'):
+            results[index] = _batch_result(
+                key, 400, error='idempotency_key, student_id, device_uuid, and session_token are required'
+            )
+            continue
+        if len(key) > MAX_IDEMPOTENCY_KEY:
+            results[index] = _batch_result(key, 400, error='idempotency_key is too long')
+            continue
+        if key in replayed:
+            results[index] = _batch_result(key, 200, attendance=replayed[key])
+            continue
+
+        try:
+            captured = capture_time(record.get('captured_at'))
+            session, student = check_credentials(
+                record['student_id'], record['device_uuid'], record['session_token']
+            )
+        except CheckInError as e:
+            results[index] = _batch_result(key, e.status_code, error=e.message)
+            continue
+
+        if not validation_cache.claim_check_in(session.id, student.id):
+            duplicates.append((index, student.id, session.id))
+            continue
+        accepted.append((index, session, student, attendance_status(session, now), captured))
+
+    # Queued back to back, the whole batch lands in one writer transaction
+    db.session.close()
+    pending = [
+        checkin_writer.submit(student.id, session.id, session.course_code, status, now,
+                              records[index]['idempotency_key'])
+        for index, session, student, status, captured in accepted
+    ]
+    timeout = current_app.config.get('CHECKIN_WRITE_TIMEOUT', 10)
+    for (index, session, student, status, captured), write in zip(accepted, pending):
+        key = records[index]['idempotency_key']
+        try:
+            attendance_id = write.wait(timeout)
+        except WriteTimeout:
+            results[index] = _batch_result(key, 503, error='Server busy, please try again')
+            continue
+        except DuplicateCheckIn:
+            duplicates.append((index, student.id, session.id))
+            continue
+        except IdempotencyKeyConflict:
+            validation_cache.release_check_in(session.id, student.id)
+            results[index] = _batch_result(key, 422, error=KEY_CONFLICT)
+            continue
+        except Exception:
+            validation_cache.release_check_in(session.id, student.id)
+            results[index] = _batch_result(key, 500, error='Check-in could not be recorded')
+            continue
+        attendance = _attendance_dict(attendance_id, session, student, now, status, write.change_seq)
+        results[index] = _batch_result(key, 201, attendance=attendance)
+        if captured is not None:
+            results[index]['captured_at'] = captured.isoformat()
+        broadcaster.publish(attendance, session.course_code)
+
+    if duplicates:
+        # One query for every record that was already there
+        rows = Attendance.listing(
+            Attendance.student_id.in_({student_pk for _, student_pk, _ in duplicates}),
+            Attendance.session_id.in_({session_id for _, _, session_id in duplicates})
+        ).add_columns(Attendance.idempotency_key).all()
+        existing = {(row.student_id, row.session_id): row for row in rows}
+        for index, student_pk, session_id in duplicates:
+            key = records[index]['idempotency_key']
+            row = existing.get((student_pk, session_id))
+            attendance = Attendance.listing_row_to_dict(row) if row else None
+            if row is not None and row.idempotency_key == key:
+                results[index] = _batch_result(key, 200, attendance=attendance)
+            else:
+                results[index] = _batch_result(
+                    key, 409, attendance=attendance, error='Already checked in for this session'
+                )
+
+    return results
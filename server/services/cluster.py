@@ -0,0 +1,266 @@
+"""
+Multi-process support for production mode (see serve.py).
+
+Each worker process binds a Unix datagram socket in a shared directory
+(IPC_DIR). Messages are fanned out to every other socket there, so nothing
+beyond the Pi's own kernel is involved:
+
+- LocalPubSubManager carries Socket.IO emits and room changes, so a
+  broadcast from any worker reaches clients connected to all of them.
+- `cluster` carries changes to process-local state (validation cache
+  entries, the active sessions) to the other workers.
+
+Messages are sent by a background sender per socket, so a peer that has
+stopped reading (a send waits up to SEND_TIMEOUT for it) never holds up
+the request that published. A send that fails is retried. If a peer
+still cannot be reached, the message is not just dropped: the peer is
+marked stale (a marker file next to its socket). Within
+CLUSTER_RESYNC_INTERVAL seconds a worker that finds itself marked throws
+away all of its process-local state, to be reloaded from the database on
+next use, or, for missed Socket.IO broadcasts, sends its own clients
+`resync` so they fetch what they missed.
+
+Long-polling needs every request of a client to reach the same process,
+which SO_REUSEPORT does not promise, so with several workers Socket.IO
+only accepts WebSocket connections (transports()).
+
+With no IPC_DIR configured there is a single process and all of this is
+a no-op.
+"""
+import glob
+import os
+import pickle
+import queue
+import socket
+import threading
+import time
+
+import socketio
+
+from config import Config
+
+
+class UnixFanout:
+    """Datagram fan-out between the worker processes on this machine."""
+
+    # Largest datagram a worker accepts; a QR image update is well under this
+    MAX_MESSAGE = 1 << 20
+    # A peer that stops reading for this long is skipped rather than waited on
+    SEND_TIMEOUT = 5
+    # Further attempts after a failed send, and the pause before each
+    SEND_RETRIES = 2
+    RETRY_DELAY = 0.05
+
+    def __init__(self, directory, channel, name=None):
+        self.directory = directory
+        self.channel = channel
+        self.path = os.path.join(directory, f"{channel}-{name or os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.MAX_MESSAGE)
+        self.sock.bind(self.path)
+        # Sends wait while a busy peer's queue is full; one sender at a time
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.settimeout(self.SEND_TIMEOUT)
+        self._send_lock = threading.Lock()
+        self._outbox = queue.Queue()
+        self._outbox_thread = None
+        self._start_lock = threading.Lock()
+
+    def peers(self):
+        pattern = os.path.join(self.directory, f"{self.channel}-*.sock")
+        return [path for path in glob.glob(pattern) if path != self.path]
+
+    def post(self, payload):
+        """
+        Queue a message for every peer and return at once. The background
+        sender marks any peer it cannot reach as stale.
+        """
+        if self._outbox_thread is None:
+            with self._start_lock:
+                if self._outbox_thread is None:
+                    self._outbox_thread = threading.Thread(
+                        target=self._send_queued, name=f"{self.channel}-sender", daemon=True
+                    )
+                    self._outbox_thread.start()
+        self._outbox.put(payload)
+
+    def flush(self):
+        """Block until every posted message has been sent."""
+        self._outbox.join()
+
+    def _send_queued(self):
+        while True:
+            payload = self._outbox.get()
+            try:
+                for peer in self.send(payload):
+                    # Picked up by the peer's Cluster.check_stale()
+                    open(stale_marker(peer), 'w').close()
+            except Exception as e:
+                print(f"[IPC] Send failed: {e}")
+            finally:
+                self._outbox.task_done()
+
+    def send(self, payload):
+        """Send to every peer now. Returns the peers that could not be reached."""
+        with self._send_lock:
+            return [peer for peer in self.peers() if not self._send_to(payload, peer)]
+
+    def _send_to(self, payload, peer):
+        for attempt in range(self.SEND_RETRIES + 1):
+            try:
+                self._sender.sendto(payload, peer)
+                return True
+            except (ConnectionRefusedError, FileNotFoundError):
+                # A worker that exited without cleaning up
+                for path in (peer, stale_marker(peer)):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                return True
+            except socket.timeout as e:
+                # Already waited SEND_TIMEOUT; the peer is not reading
+                error = e
+                break
+            except OSError as e:
+                error = e
+                time.sleep(self.RETRY_DELAY * (attempt + 1))
+        print(f"[IPC] Could not reach {os.path.basename(peer)}: {error}")
+        return False
+
+    def recv(self):
+        return self.sock.recv(self.MAX_MESSAGE)
+
+    def close(self):
+        self.sock.close()
+        self._sender.close()
+        for path in (self.path, stale_marker(self.path)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def stale_marker(path):
+    """Marks the worker listening at `path` as having missed a change."""
+    return path + '.stale'
+
+
+def take_marker(path):
+    """Remove the stale marker for `path`. Returns True if there was one."""
+    try:
+        os.unlink(stale_marker(path))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """Socket.IO client manager whose message queue is a UnixFanout."""
+
+    name = 'unix'
+
+    def __init__(self, directory, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.fanout = UnixFanout(directory, channel)
+
+    def _publish(self, data):
+        self.fanout.post(pickle.dumps(data))
+
+    def _listen(self):
+        while True:
+            yield self.fanout.recv()
+
+
+class Cluster:
+    """Keeps process-local state in step across workers."""
+
+    def __init__(self, directory, worker_index):
+        self.directory = directory
+        self.worker_index = worker_index
+        self.fanout = None
+        self.manager = None
+        self._handlers = {}
+        self._resyncs = []
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    @property
+    def is_primary(self):
+        """The worker that runs the singleton background services."""
+        return self.worker_index == 0
+
+    def client_manager(self):
+        """The Socket.IO client manager for this process (None: in-memory default)."""
+        if self.enabled:
+            self.manager = LocalPubSubManager(self.directory)
+        return self.manager
+
+    def transports(self):
+        """Engine.IO transports to accept (None: the default, polling too)."""
+        return ['websocket'] if self.enabled else None
+
+    def start(self, socketio_server):
+        if not self.enabled:
+            return
+        self.fanout = UnixFanout(self.directory, 'cluster')
+        socketio_server.start_background_task(self._listen)
+        socketio_server.start_background_task(self._watch_stale, socketio_server)
+
+    def subscribe(self, topic, handler, resync):
+        """
+        Run handler(*args) for topic's messages from other workers, and
+        resync() if this worker may have missed some of them.
+        """
+        self._handlers[topic] = handler
+        self._resyncs.append(resync)
+
+    def publish(self, topic, *args):
+        """Run topic's handler in every other worker. Callers apply the change locally."""
+        if self.fanout is not None:
+            self.fanout.post(pickle.dumps((topic, args)))
+
+    def resync(self):
+        """Drop every piece of process-local state kept in step by the cluster."""
+        for resync in self._resyncs:
+            try:
+                resync()
+            except Exception as e:
+                print(f"[IPC] Resync failed: {e}")
+
+    def check_stale(self):
+        """Resync if another worker marked this one stale. Returns True if it did."""
+        resynced = False
+        if take_marker(self.fanout.path):
+            print("[IPC] Missed a change from another worker; reloading local state")
+            self.resync()
+            resynced = True
+        if self.manager is not None and take_marker(self.manager.fanout.path):
+            # The broadcasts are gone; this worker's clients fetch what they missed
+            print("[IPC] Missed Socket.IO broadcasts from another worker; telling clients to resync")
+            self.manager.emit('resync', {}, ignore_queue=True)
+            resynced = True
+        return resynced
+
+    def _watch_stale(self, socketio_server):
+        while True:
+            socketio_server.sleep(Config.CLUSTER_RESYNC_INTERVAL)
+            self.check_stale()
+
+    def _listen(self):
+        while True:
+            topic, args = pickle.loads(self.fanout.recv())
+            handler = self._handlers.get(topic)
+            if handler is None:
+                continue
+            try:
+                handler(*args)
+            except Exception as e:
+                print(f"[IPC] {topic} handler failed: {e}")
+
+
+cluster = Cluster(Config.IPC_DIR, Config.WORKER_INDEX)
@@ -0,0 +1,133 @@
+"""
+Streaming CSV export of attendance records.
+
+    session_id,course_code,session_start,student_id,name,timestamp,status
+
+One query joins Attendance to its Student and Session and is read with a
+server-side cursor, ROWS_PER_CHUNK rows at a time; each chunk is written
+out as CSV text before the next is fetched. Nothing else is held, so a
+whole semester of a course costs the same memory as one session, and the
+header and first rows go out as soon as the query starts returning them.
+
+Text a student typed in (names, matric numbers) or a lecturer chose
+(course codes) is written with a leading ' if it starts like a
+spreadsheet formula, so opening the export in Excel cannot run it.
+
+Used by GET /api/attendance/export and `python manage.py export-attendance`.
+"""
+import csv
+import io
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from database import db
+from models import Attendance, Session, Student
+
+COLUMNS = ('session_id', 'course_code', 'session_start', 'student_id', 'name', 'timestamp', 'status')
+ROWS_PER_CHUNK = 1000
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class ExportError(Exception):
+    """An export request with filters that cannot be applied."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def parse_session_id(value):
+    """Parse the session filter: a session id, or None if not given."""
+    if not value:
+        return None
+    if not re.fullmatch(r'[0-9]+', value):
+        raise ExportError(f"Invalid session_id '{value}'")
+    return int(value)
+
+
+def parse_date(value, end=False):
+    """
+    Parse a filter bound: an ISO 8601 date or date-time. A bare date as the
+    end of a range covers that whole day.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ExportError(f"Invalid date '{value}'; use YYYY-MM-DD or ISO 8601")
+    if parsed.tzinfo is not None:
+        # Stored times are naive UTC
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def attendance_query(session_id=None, course_code=None, since=None, until=None):
+    """
+    The export query: attendance joined to student and session, filtered by
+    session, course and session start time [since, until), in session order.
+    """
+    query = select(
+        Session.id,
+        Session.course_code,
+        Session.start_time,
+        Student.student_id,
+        Student.name,
+        Attendance.timestamp,
+        Attendance.status,
+    ).select_from(Session)\
+        .join(Attendance, Attendance.session_id == Session.id)\
+        .join(Student, Attendance.student_id == Student.id)
+
+    if session_id is not None:
+        query = query.where(Session.id == session_id)
+    if course_code:
+        query = query.where(Session.course_code == course_code)
+    if since is not None:
+        query = query.where(Session.start_time >= since)
+    if until is not None:
+        query = query.where(Session.start_time < until)
+
+    return query.order_by(Session.start_time, Session.id, Attendance.id)
+
+
+def iter_csv(query):
+    """Yield the query's rows as CSV text, the header first, one chunk at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+
+    result = db.session.execute(query.execution_options(yield_per=ROWS_PER_CHUNK))
+    for rows in result.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (session_id, _text(course_code), _iso(start_time), _text(matric), _text(name),
+             _iso(timestamp), status)
+            for session_id, course_code, start_time, matric, name, timestamp, status in rows
+        )
+        yield buffer.getvalue()
+
+
+def export_filename(session_id=None, course_code=None):
+    parts = ['attendance']
+    if course_code:
+        parts.append(re.sub(r'[^A-Za-z0-9_-]', '', course_code))
+    if session_id is not None:
+        parts.append(f"session-{session_id}")
+    return '-'.join(parts) + '.csv'
+
+
+def _iso(value):
+    return value.isoformat() if value else ''
+
+
+def _text(value):
+    """A text cell, defused if a spreadsheet would read it as a formula."""
+    if value and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
@@ -0,0 +1,294 @@
+"""
+In-process metrics, exposed at /api/metrics in the Prometheus text format.
+
+Recorded as they happen (a perf_counter pair, a bisect and a locked add,
+a few microseconds each):
+- HTTP request latency per method, route rule and status
+- Socket.IO event latency and errors per event
+- SQL statements per request and per event (from the query profiler)
+- check-in writer commit durations, batch sizes and lock waits
+- requests admitted and turned away by admission control, by reason
+
+Read only when scraped:
+- connected Socket.IO clients and members of each named room
+- check-in writer queue depth
+- admission control's in-flight requests and rate-limited clients tracked
+- SyncQueue backlog (pending entries, via the partial pending index)
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from flask import g, request
+from services.query_profiler import current_stats
+
+# Upper bounds in seconds, from a cached lookup to a stuck write
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+
+        lines = []
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic count keyed by label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # An unlabelled counter reads 0 until its first increment
+        self._values = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in sorted(values.items())]
+
+
+class Gauge:
+    """A value computed when scraped: collect() returns {label values: value}."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in sorted(self.collect().items())]
+
+
+class MetricsRegistry:
+    """All metrics of this process, plus the Flask and Socket.IO hooks that feed them."""
+
+    def __init__(self):
+        self._metrics = []
+        self.socketio = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                # One failing collector must not take the endpoint down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    # ─── Hooks ──────────────────────────────────────────
+
+    def init_app(self, app, socketio=None):
+        self.socketio = socketio
+        app.before_request(_start_timer)
+        app.after_request(_record_request)
+
+    def track_event(self, event):
+        """Decorator timing a Socket.IO event handler and counting its errors."""
+        def decorator(handler):
+            @functools.wraps(handler)
+            def wrapper(*args):
+                started = time.perf_counter()
+                try:
+                    return handler(*args)
+                except Exception:
+                    socket_event_errors.inc(event)
+                    raise
+                finally:
+                    socket_event_seconds.observe(time.perf_counter() - started, event)
+                    stats = current_stats()
+                    socket_event_queries.observe(stats.count if stats else 0, event)
+            return wrapper
+        return decorator
+
+
+metrics = MetricsRegistry()
+
+
+def _start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        # The route rule, not the path, keeps the number of series bounded
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_seconds.observe(
+            time.perf_counter() - started, request.method, rule, response.status_code
+        )
+        stats = current_stats()
+        http_request_queries.observe(stats.count if stats else 0, request.method, rule)
+    return response
+
+
+# ─── Collectors ─────────────────────────────────────────
+
+def _connected_clients():
+    if metrics.socketio is None:
+        return {}
+    rooms = metrics.socketio.server.manager.rooms.get('/', {})
+    # Every client sits in the None room
+    return {(): len(rooms.get(None, {}))}
+
+
+def _room_members():
+    if metrics.socketio is None:
+        return {}
+    rooms = metrics.socketio.server.manager.rooms.get('/', {})
+    # Skip the None room and each client's private room (named after its sid)
+    return {(room,): len(members) for room, members in rooms.items()
+            if room is not None and room not in members}
+
+
+def _writer_queue_depth():
+    from services.writer import checkin_writer
+    return {(): checkin_writer.queue_depth()}
+
+
+def _admission_in_flight():
+    from services.admission import admission
+    return {(): admission.in_flight}
+
+
+def _admission_clients():
+    from services.admission import admission
+    return {('device',): len(admission.devices), ('address',): len(admission.addresses)}
+
+
+def _sync_backlog():
+    from database import db
+    from models import SyncQueue
+
+    count = db.session.query(db.func.count(SyncQueue.id))\
+        .filter(SyncQueue.status == 'pending').scalar()
+    return {(): count}
+
+
+http_request_seconds = metrics.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency.',
+    ['method', 'route', 'status']
+))
+http_request_queries = metrics.register(Histogram(
+    'http_request_db_queries', 'SQL statements per HTTP request.',
+    ['method', 'route'], buckets=QUERY_COUNT_BUCKETS
+))
+socket_event_seconds = metrics.register(Histogram(
+    'socketio_event_duration_seconds', 'Socket.IO event handler latency.', ['event']
+))
+socket_event_queries = metrics.register(Histogram(
+    'socketio_event_db_queries', 'SQL statements per Socket.IO event.',
+    ['event'], buckets=QUERY_COUNT_BUCKETS
+))
+socket_event_errors = metrics.register(Counter(
+    'socketio_event_errors_total', 'Socket.IO event handlers that raised.', ['event']
+))
+metrics.register(Gauge(
+    'socketio_connected_clients', 'Connected Socket.IO clients.', _connected_clients
+))
+metrics.register(Gauge(
+    'socketio_room_members', 'Clients in each named Socket.IO room.', _room_members, ['room']
+))
+checkin_commit_seconds = metrics.register(Histogram(
+    'checkin_commit_duration_seconds', 'Check-in writer transaction time, lock waits included.'
+))
+checkin_batch_size = metrics.register(Histogram(
+    'checkin_batch_size', 'Check-ins committed per writer transaction.',
+    buckets=BATCH_SIZE_BUCKETS
+))
+metrics.register(Gauge(
+    'checkin_writer_queue_depth', 'Check-ins waiting for the writer.', _writer_queue_depth
+))
+checkin_lock_wait_seconds = metrics.register(Counter(
+    'checkin_lock_wait_seconds_total', "Writer time spent waiting for SQLite's write lock."
+))
+checkin_lock_errors = metrics.register(Counter(
+    'checkin_lock_errors_total', 'Writer transactions that failed on a locked database.'
+))
+admission_admitted = metrics.register(Counter(
+    'admission_admitted_total', 'Check-in and enrollment requests let in.', ['endpoint']
+))
+admission_rejected = metrics.register(Counter(
+    'admission_rejected_total', 'Check-in and enrollment requests turned away (429/503).',
+    ['endpoint', 'reason']
+))
+metrics.register(Gauge(
+    'admission_in_flight', 'Check-in and enrollment requests being handled.', _admission_in_flight
+))
+metrics.register(Gauge(
+    'admission_tracked_clients', 'Clients with a rate-limit bucket.', _admission_clients, ['kind']
+))
+metrics.register(Gauge(
+    'sync_queue_pending', 'SyncQueue entries waiting for upload.', _sync_backlog
+))
@@ -0,0 +1,100 @@
+"""
+Background QR rotation for the lecturer dashboard.
+
+Shortly before each QR_REFRESH_INTERVAL window begins, the next window's
+token is rendered for every active session (render_qr caches it). When the
+window starts, the image is pushed as `qr_update` to the lecturer rooms
+(all courses, and the session's own course), so the projector never waits
+on rendering and never has to poll. The sessions come from the registry,
+so a rotation costs no query.
+"""
+import time
+from database import db
+from services.broadcaster import LECTURER_ROOM
+from services.checkin import qr_link, qr_token_for
+from services.cluster import cluster
+from services.registry import active_sessions, lecturer_room
+from services.wire import with_compact_rooms
+from utils.qr import render_qr
+from utils.security import current_window
+
+# How far ahead of a window boundary the next QR is rendered (seconds)
+PRERENDER_LEAD = 2
+
+
+def qr_payload(session, window, interval, image_format):
+    """The qr_update / /api/session/qr body for a session in a window."""
+    qr_token = qr_token_for(session, window)
+    qr_url = qr_link(qr_token)
+    return {
+        'session_id': session.id,
+        'course_code': session.course_code,
+        'qr_token': qr_token,
+        'qr_url': qr_url,
+        'qr_code': render_qr(qr_url, image_format),
+        'expires_in': (window + 1) * interval - time.time()
+    }
+
+
+class QRRotator:
+    """Pre-renders and pushes each active session's rotating QR."""
+
+    def __init__(self):
+        self.socketio = None
+        self.app = None
+
+    def start(self, socketio, app):
+        self.socketio = socketio
+        self.app = app
+        # In production mode one worker rotates for all; any worker can push()
+        if cluster.is_primary:
+            socketio.start_background_task(self._run)
+
+    def push(self, session):
+        """Render and push the current window's QR for a session right away."""
+        if self.socketio is None:
+            return
+        config = self.app.config
+        interval = config['QR_REFRESH_INTERVAL']
+        payload = qr_payload(
+            session, current_window(interval), interval, config['QR_IMAGE_FORMAT']
+        )
+        rooms = with_compact_rooms([LECTURER_ROOM, lecturer_room(session.course_code)])
+        self.socketio.emit('qr_update', payload, room=rooms)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    self._rotate_once()
+                except Exception as e:
+                    print(f"[QR] Rotation failed: {e}")
+                    self.socketio.sleep(1)
+
+    def _rotate_once(self):
+        """Sleep until just before the next window, pre-render it, then push it."""
+        config = self.app.config
+        interval = config['QR_REFRESH_INTERVAL']
+        image_format = config['QR_IMAGE_FORMAT']
+        next_window = current_window(interval) + 1
+        next_start = next_window * interval
+
+        self.socketio.sleep(max(0, next_start - PRERENDER_LEAD - time.time()))
+        try:
+            sessions = active_sessions.all()
+            for session in sessions:
+                render_qr(qr_link(qr_token_for(session, next_window)), image_format)
+        finally:
+            # The registry queries only when it has been invalidated
+            db.session.remove()
+
+        self.socketio.sleep(max(0, next_start - time.time()))
+        for session in sessions:
+            self.socketio.emit(
+                'qr_update',
+                qr_payload(session, next_window, interval, image_format),
+                room=with_compact_rooms([LECTURER_ROOM, lecturer_room(session.course_code)])
+            )
+
+
+qr_rotator = QRRotator()
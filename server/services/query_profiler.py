@@ -0,0 +1,174 @@
+"""
+SQL query profiler for the engine created in database.init_db.
+
+Every statement executed while handling an HTTP request or a Socket.IO
+event is counted and timed against that request (the totals live on
+flask.g). HTTP responses carry them in a Server-Timing header, so they
+show up in the browser's network panel, and /api/metrics records them per
+route and per event.
+
+Statements slower than SLOW_QUERY_MS are logged with the line of
+application code that issued them.
+
+Endpoints can declare a query budget with @query_budget(n). Going over it
+is logged; with QUERY_BUDGET_STRICT set (as tests do) the request fails
+with QueryBudgetExceeded instead, so an N+1 regression breaks the build
+rather than a lecture. The query_limit(n) context manager does the same
+for any block of code. Its count is kept in a context variable, so only
+statements run by the same thread or greenlet are counted against it,
+never those of other requests or of the check-in writer thread.
+"""
+import os
+import sys
+import time
+from contextvars import ContextVar
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_FILES = (os.path.abspath(__file__),)
+
+
+class QueryBudgetExceeded(Exception):
+    """More SQL statements ran than the code declared it needs."""
+
+    def __init__(self, where, budget, statements):
+        self.where = where
+        self.budget = budget
+        self.statements = statements
+        listing = '\n  '.join(statements)
+        super().__init__(
+            f"{where} ran {len(statements)} queries (budget {budget}):\n  {listing}"
+        )
+
+
+class QueryStats:
+    """Statements run on behalf of one request or socket event."""
+
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+
+def query_budget(limit):
+    """Declare the most queries a view may run per request."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class query_limit:
+    """Fail a block of code that runs more than `limit` statements."""
+
+    def __init__(self, limit, where='block'):
+        self.limit = limit
+        self.where = where
+        self.statements = []
+        self._token = None
+
+    def __enter__(self):
+        self._token = _limits.set(_limits.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _limits.reset(self._token)
+        if exc_type is None and len(self.statements) > self.limit:
+            raise QueryBudgetExceeded(self.where, self.limit, self.statements)
+
+
+# The query_limit blocks open in the current thread or greenlet
+_limits = ContextVar('query_limits', default=())
+
+
+def current_stats():
+    """The QueryStats of the request or socket event being handled, if any."""
+    if not has_request_context():
+        return None
+    return g.get('query_stats')
+
+
+def _call_site():
+    """file:line in function of the innermost application frame."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(SERVER_DIR) and filename not in _SKIP_FILES \
+                and 'site-packages' not in filename:
+            relative = os.path.relpath(filename, SERVER_DIR)
+            return f"{relative}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _one_line(statement, limit=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+
+class QueryProfiler:
+    """Engine event listeners plus the per-request hooks that report them."""
+
+    def __init__(self):
+        self.slow_seconds = 0.05
+        self.strict = False
+
+    def init_app(self, app, engine):
+        self.slow_seconds = app.config.get('SLOW_QUERY_MS', 50) / 1000
+        self.strict = app.config.get('QUERY_BUDGET_STRICT', False)
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(_start_request)
+        app.after_request(self._finish_request)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+
+        if has_request_context():
+            stats = g.get('query_stats')
+            if stats is None:
+                # Socket events get a fresh request context per event
+                stats = g.query_stats = QueryStats()
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.statements.append(statement)
+
+        for limit in _limits.get():
+            limit.statements.append(_one_line(statement))
+
+        if elapsed >= self.slow_seconds:
+            print(f"[SQL] Slow query ({elapsed * 1000:.1f} ms) at {_call_site()}: "
+                  f"{_one_line(statement)}")
+
+    def _finish_request(self, response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        response.headers.add(
+            'Server-Timing', f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries"'
+        )
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and stats.count > budget:
+            where = f"{request.method} {request.path}"
+            if self.strict:
+                raise QueryBudgetExceeded(
+                    where, budget, [_one_line(s) for s in stats.statements]
+                )
+            print(f"[SQL] {where} ran {stats.count} queries (budget {budget})")
+        return response
+
+
+def _start_request():
+    g.query_stats = QueryStats()
+
+
+query_profiler = QueryProfiler()
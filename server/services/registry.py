@@ -0,0 +1,164 @@
+"""
+In-memory registry of the active sessions, by course code and by token.
+
+One Pi can run several sessions at once (adjacent rooms, overlapping
+classes), so "the active session" only means something for a course.
+The registry answers /api/session/active, /api/session/qr, the QR
+rotator and the socket rooms without a query: it is filled with one query
+when first used and then kept in step by start_session/end_session. It is
+a read cache only; start_session checks the database for a conflict.
+
+The /api/session/active ETag is a hash of the active sessions' ids and
+tokens, so it changes whenever a session starts or ends, and two workers
+that agree on the active sessions give the same ETag, whichever answered
+first. In production mode the worker that made a change tells the others,
+which reload on their next use.
+"""
+import hashlib
+import threading
+from collections import namedtuple
+
+from services.cluster import cluster
+
+ActiveSession = namedtuple(
+    'ActiveSession', 'id course_code session_token start_time'
+)
+
+
+def session_room(session_id):
+    """Students checking in to one session."""
+    return f"session_{session_id}"
+
+
+def lecturer_room(course_code):
+    """Dashboards following one course's check-ins and QR."""
+    return f"lecturer_{course_code}"
+
+
+class ActiveSessionRegistry:
+    """The active sessions, indexed by course code, token and id."""
+
+    def __init__(self):
+        self._by_course = {}
+        self._by_token = {}
+        self._by_id = {}
+        self._counts = {}    # session id -> attendance count as last broadcast
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._etag = None
+
+    # ─── Lookups ───
+
+    def for_course(self, course_code):
+        self._ensure_loaded()
+        return self._by_course.get(course_code)
+
+    def for_token(self, session_token):
+        self._ensure_loaded()
+        return self._by_token.get(session_token)
+
+    def for_id(self, session_id):
+        self._ensure_loaded()
+        return self._by_id.get(session_id)
+
+    def all(self):
+        """Every active session, oldest first."""
+        self._ensure_loaded()
+        return [self._by_id[session_id] for session_id in sorted(self._by_id)]
+
+    def latest(self):
+        """The most recently started active session, or None."""
+        sessions = self.all()
+        return sessions[-1] if sessions else None
+
+    def to_dict(self, session):
+        """
+        Same shape as Session.to_dict(include_token=False), with the last
+        broadcast count. This goes to students, so no static token.
+        """
+        return {
+            'id': session.id,
+            'course_code': session.course_code,
+            'start_time': session.start_time.isoformat() if session.start_time else None,
+            'end_time': None,
+            'is_active': True,
+            'attendance_count': self._counts.get(session.id, 0)
+        }
+
+    def etag(self):
+        """A hash of the active sessions, computed once per change."""
+        self._ensure_loaded()
+        with self._lock:
+            if self._etag is None:
+                content = ','.join(
+                    f"{session_id}:{self._by_id[session_id].session_token}"
+                    for session_id in sorted(self._by_id)
+                )
+                self._etag = hashlib.sha1(content.encode()).hexdigest()[:16]
+            return self._etag
+
+    # ─── Changes ───
+
+    def add(self, session):
+        """Register a session that has just started (a Session row)."""
+        self._ensure_loaded()
+        with self._lock:
+            self._index(session)
+            self._counts[session.id] = session.attendance_count or 0
+            self._etag = None
+        cluster.publish('active_sessions')
+
+    def remove(self, session):
+        """Drop a session that has just ended."""
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._by_id.pop(session.id, None)
+            if entry is not None:
+                self._by_course.pop(entry.course_code, None)
+                self._by_token.pop(entry.session_token, None)
+            self._counts.pop(session.id, None)
+            self._etag = None
+        cluster.publish('active_sessions')
+
+    def set_count(self, session_id, count):
+        """Record a session's attendance count (from the broadcaster)."""
+        if session_id in self._by_id:
+            self._counts[session_id] = count
+
+    def invalidate(self):
+        """Another worker started or ended a session: reload on next use."""
+        with self._lock:
+            self._loaded = False
+            self._etag = None
+
+    # ─── Internals ───
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        from models import Session
+
+        rows = Session.query.filter_by(is_active=True).all()
+        with self._lock:
+            self._by_course, self._by_token, self._by_id = {}, {}, {}
+            self._counts = {}
+            for session in rows:
+                self._index(session)
+                self._counts[session.id] = session.attendance_count or 0
+            self._etag = None
+            self._loaded = True
+
+    def _index(self, session):
+        entry = ActiveSession(
+            id=session.id,
+            course_code=session.course_code,
+            session_token=session.session_token,
+            start_time=session.start_time,
+        )
+        self._by_course[entry.course_code] = entry
+        self._by_token[entry.session_token] = entry
+        self._by_id[entry.id] = entry
+
+
+active_sessions = ActiveSessionRegistry()
+cluster.subscribe('active_sessions', active_sessions.invalidate, active_sessions.invalidate)
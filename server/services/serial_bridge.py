@@ -0,0 +1,213 @@
+"""
+Serial bridge to the session-controller microcontroller.
+
+The controller sends one JSON object per line and gets one JSON line back
+for each:
+
+    {"action": "start_session", "course_code": "CSC301"}
+        -> {"status": "ok", "session_id": 12, "latency_ms": 8.4}
+    {"action": "end_session"}   (optionally with session_id or course_code)
+        -> {"status": "ok", "session_id": 12, "records": 42}
+    anything else
+        -> {"status": "error", "error": "..."}
+
+Start and end go through services.sessions, the same code the HTTP routes
+use. latency_ms is the time from the command's last byte arriving to the
+new session's QR being pushed to the lecturer dashboard.
+
+The port is opened non-blocking and polled from a background task that
+yields to the event loop between polls, so a silent, slow or noisy line
+never holds up socket handling. Lines longer than SERIAL_MAX_LINE are
+dropped; if the port cannot be opened (or is unplugged) the bridge keeps
+retrying every SERIAL_RETRY_INTERVAL seconds. A command that fails for any
+other reason (a locked database, say) is logged, rolled back and answered
+with an error; the bridge keeps reading.
+"""
+import json
+import time
+import serial
+from flask import current_app
+from database import db
+from services import sessions as session_control
+from services.registry import active_sessions
+from services.sessions import SessionError
+
+
+class SerialBridge:
+    """Reads controller commands from a serial port and answers them."""
+
+    def __init__(self):
+        self.socketio = None
+        self.app = None
+        self.port = None
+        self.last_start_latency_ms = None
+        self._buffer = bytearray()
+        self._outbox = bytearray()
+        self._discarding = False  # inside an over-long line, until its newline
+
+    def start(self, socketio, app):
+        if not app.config.get('SERIAL_PORT'):
+            print("[SERIAL] No SERIAL_PORT configured; serial bridge disabled")
+            return
+        self.socketio = socketio
+        self.app = app
+        socketio.start_background_task(self._run)
+
+    def open(self, port_name, baud_rate):
+        """Open the port in non-blocking mode (reads and writes return at once)."""
+        self.port = serial.Serial(port_name, baud_rate, timeout=0, write_timeout=0)
+        self._buffer.clear()
+        self._outbox.clear()
+        self._discarding = False
+
+    def close(self):
+        if self.port is not None:
+            try:
+                self.port.close()
+            except serial.SerialException:
+                pass
+        self.port = None
+
+    def _run(self):
+        config = self.app.config
+        port_name = config['SERIAL_PORT']
+        poll_interval = config['SERIAL_POLL_MS'] / 1000
+        reported = False
+
+        with self.app.app_context():
+            while True:
+                if self.port is None:
+                    try:
+                        self.open(port_name, config['SERIAL_BAUD_RATE'])
+                    except serial.SerialException as e:
+                        if not reported:
+                            print(f"[SERIAL] Cannot open {port_name} ({e}); "
+                                  f"retrying every {config['SERIAL_RETRY_INTERVAL']}s")
+                            reported = True
+                        self.socketio.sleep(config['SERIAL_RETRY_INTERVAL'])
+                        continue
+                    print(f"[SERIAL] Listening on {port_name} at {config['SERIAL_BAUD_RATE']} baud")
+                    reported = False
+
+                try:
+                    self.poll()
+                except serial.SerialException as e:
+                    print(f"[SERIAL] Lost {port_name} ({e})")
+                    self.close()
+                    continue
+                except Exception as e:
+                    print(f"[SERIAL] Poll failed: {e!r}")
+                    db.session.remove()
+                self.socketio.sleep(poll_interval)
+
+    # ─── Framing ────────────────────────────────────────
+
+    def poll(self):
+        """
+        Handle every complete line that has arrived and write pending replies.
+        Never waits for the port. Returns the number of lines handled.
+        """
+        handled = 0
+        data = self.port.read(self.port.in_waiting or 1)
+        if data:
+            for line in self._frames(data):
+                received = time.perf_counter()
+                self.send(self.handle_line(line, received))
+                handled += 1
+        self._flush()
+        return handled
+
+    def _frames(self, data):
+        """Split buffered bytes into complete lines; None marks an over-long one."""
+        max_line = current_app.config['SERIAL_MAX_LINE']
+        self._buffer.extend(data)
+        lines = []
+        while True:
+            end = self._buffer.find(b'\n')
+            if end < 0:
+                break
+            line = bytes(self._buffer[:end]).strip()
+            del self._buffer[:end + 1]
+            if self._discarding:
+                # The rest of a line already reported as too long
+                self._discarding = False
+            elif len(line) > max_line:
+                lines.append(None)
+            elif line:
+                lines.append(line)
+
+        if len(self._buffer) > max_line:
+            self._buffer.clear()
+            self._discarding = True
+            lines.append(None)
+        return lines
+
+    def send(self, reply):
+        self._outbox.extend(json.dumps(reply, separators=(',', ':')).encode('utf-8') + b'\n')
+
+    def _flush(self):
+        if self._outbox:
+            written = self.port.write(bytes(self._outbox))
+            del self._outbox[:written or 0]
+
+    # ─── Commands ───────────────────────────────────────
+
+    def handle_line(self, line, received=None):
+        """Run one framed command and return the reply for it."""
+        if line is None:
+            return {'status': 'error', 'error': 'Line too long'}
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return {'status': 'error', 'error': 'Invalid JSON'}
+        if not isinstance(message, dict):
+            return {'status': 'error', 'error': 'Expected a JSON object'}
+
+        action = message.get('action')
+        try:
+            if action == 'start_session':
+                return self._start_session(message, received or time.perf_counter())
+            if action == 'end_session':
+                return self._end_session(message)
+            return {'status': 'error', 'error': f"Unknown action: {action}"}
+        except SessionError as e:
+            return {'status': 'error', 'error': e.message}
+        except Exception as e:
+            print(f"[SERIAL] {action} failed: {e!r}")
+            db.session.rollback()
+            return {'status': 'error', 'error': 'Server error'}
+        finally:
+            db.session.remove()
+
+    def _start_session(self, message, received):
+        course_code = str(message.get('course_code') or '').strip()
+        session = session_control.start_session(course_code)
+
+        latency_ms = (time.perf_counter() - received) * 1000
+        self.last_start_latency_ms = latency_ms
+        print(f"[SERIAL] Started {course_code} (session {session.id}); "
+              f"QR pushed in {latency_ms:.1f} ms")
+        return {'status': 'ok', 'session_id': session.id, 'latency_ms': round(latency_ms, 1)}
+
+    def _end_session(self, message):
+        session_id = message.get('session_id')
+        course_code = str(message.get('course_code') or '').strip()
+
+        if session_id is not None:
+            try:
+                session_id = int(session_id)
+            except (TypeError, ValueError):
+                return {'status': 'error', 'error': 'Invalid session_id'}
+        elif not course_code:
+            # A bare end_session ends the most recently started session
+            latest = active_sessions.latest()
+            if latest is None:
+                return {'status': 'error', 'error': 'No active session'}
+            session_id = latest.id
+
+        session = session_control.end_session(session_id=session_id, course_code=course_code)
+        print(f"[SERIAL] Ended {session.course_code} (session {session.id})")
+        return {'status': 'ok', 'session_id': session.id, 'records': session.attendance_count}
+
+
+serial_bridge = SerialBridge()
@@ -0,0 +1,104 @@
+"""
+Session start/end shared by the HTTP routes and the serial bridge.
+
+Starting or ending a session is the same operation whichever controller
+asks for it: the row is written, the active-session registry (and with it
+the /api/session/active ETag) is updated, the change is announced to every
+client, and a new session's QR is pushed to the course's dashboards
+straight away. Any number of courses can have a session running at once;
+each course has at most one.
+
+Which session is active for a course is decided by the database, not by
+the registry: in production mode another worker's registry may not have
+caught up yet. A partial unique index on sessions(course_code) WHERE
+is_active settles two workers starting the same course at once.
+"""
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import Session
+from services.broadcaster import broadcaster
+from services.cache import validation_cache
+from services.qr_rotator import qr_rotator
+from services.registry import active_sessions
+from utils.security import generate_session_token
+
+
+class SessionError(Exception):
+    """A start/end request that cannot be carried out."""
+
+    def __init__(self, message, status_code, session=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.session = session
+
+
+def start_session(course_code):
+    """Start a session for a course. Returns the new Session."""
+    if not course_code:
+        raise SessionError('course_code is required', 400)
+
+    # Check if there's already an active session for this course
+    active_session = _active_for_course(course_code)
+
+    if active_session:
+        raise _already_active(active_session)
+
+    session = Session(
+        course_code=course_code,
+        session_token=generate_session_token(),
+        is_active=True
+    )
+
+    db.session.add(session)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker started one since the check (uq_sessions_course_active)
+        db.session.rollback()
+        raise _already_active(_active_for_course(course_code))
+    active_sessions.add(session)
+
+    broadcaster.announce('session_started', {'session': session.to_dict(include_token=False)})
+    qr_rotator.push(session)
+    return session
+
+
+def end_session(session_id=None, course_code=None):
+    """
+    End a session, chosen by id or by the course's active session.
+    Returns the ended Session.
+    """
+    if session_id:
+        session = db.session.get(Session, session_id)
+    elif course_code:
+        session = _active_for_course(course_code)
+    else:
+        raise SessionError('session_id or course_code is required', 400)
+
+    if not session:
+        raise SessionError('Session not found', 404)
+
+    if not session.is_active:
+        raise SessionError('Session is already ended', 400)
+
+    session.is_active = False
+    session.end_time = datetime.utcnow()
+    db.session.commit()
+    validation_cache.invalidate_session(session.session_token, session.id)
+    active_sessions.remove(session)
+
+    broadcaster.announce('session_ended', {'session': session.to_dict(include_token=False)})
+    return session
+
+
+def _active_for_course(course_code):
+    return Session.query.filter_by(course_code=course_code, is_active=True).first()
+
+
+def _already_active(session):
+    # This worker's registry missed the start; reload it on next use
+    if session is not None and active_sessions.for_id(session.id) is None:
+        active_sessions.invalidate()
+    return SessionError('An active session already exists for this course', 409, session)
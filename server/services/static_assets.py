@@ -0,0 +1,139 @@
+"""
+Precompressed, fingerprinted serving of the PWA client (client/).
+
+There is no build step: when the server starts, every file under client/
+is read once, gzipped at the highest level and hashed. Then:
+
+- css/ and js/ files are also served under a content-hashed name
+  (/css/style.<hash>.css) with `Cache-Control: immutable` for a year, so
+  a phone that has them never asks again.
+- The HTML pages are rewritten to link those hashed names, and are served
+  with `no-cache`, so a revisit costs one conditional request and a 304.
+- sw.js is served with its asset manifest (ASSET_VERSION and ASSETS, the
+  hashed app shell) prepended, so the service worker's cache follows the
+  files' contents and a new deploy installs a new cache.
+
+Every response carries a strong ETag for its encoding and the gzip body is
+sent to any client that accepts it. Edits under client/ need a restart.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import Response, abort, request
+
+# Files linked under a content-hashed name
+FINGERPRINTED_DIRS = ('css', 'js')
+# The student page, whose assets the service worker caches for offline use
+SHELL_PAGE = 'index.html'
+SERVICE_WORKER = 'sw.js'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+def _fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+class Asset:
+    """One file's bytes, its gzip encoding and the headers that go with them."""
+
+    __slots__ = ('body', 'gzipped', 'etag', 'mimetype', 'cache_control')
+
+    def __init__(self, body, mimetype, cache_control):
+        self.body = body
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.etag = _fingerprint(body)
+        # mtime=0 keeps the bytes (and so the ETag) identical across workers
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.gzipped = gzipped if len(gzipped) < len(body) else None
+
+
+class StaticAssets:
+    """In-memory table of the client's files by URL path."""
+
+    def __init__(self):
+        self.assets = {}   # URL path without the leading slash -> Asset
+        self.urls = {}     # original path -> fingerprinted path
+        self.version = None
+
+    def load(self, client_dir):
+        sources = {}
+        for root, _, files in os.walk(client_dir):
+            for name in files:
+                path = os.path.relpath(os.path.join(root, name), client_dir).replace(os.sep, '/')
+                with open(os.path.join(root, name), 'rb') as f:
+                    sources[path] = f.read()
+
+        self.assets = {}
+        self.urls = {}
+        for path, data in sources.items():
+            if path.split('/')[0] in FINGERPRINTED_DIRS:
+                stem, ext = os.path.splitext(path)
+                hashed = f"{stem}.{_fingerprint(data)}{ext}"
+                self.urls[path] = hashed
+                self.assets[hashed] = Asset(data, _mimetype(path), IMMUTABLE)
+                # The plain name keeps working for old pages and caches
+                self.assets[path] = Asset(data, _mimetype(path), REVALIDATE)
+
+        for path, data in sources.items():
+            if path.endswith('.html'):
+                data = self._link_fingerprinted(data)
+            if path not in self.assets and path != SERVICE_WORKER:
+                self.assets[path] = Asset(data, _mimetype(path), REVALIDATE)
+
+        # The app shell: the student page and everything it links to
+        page = sources.get(SHELL_PAGE, b'')
+        shell = ['/'] + [f"/{hashed}" for original, hashed in sorted(self.urls.items())
+                         if f'"/{original}"'.encode() in page]
+        if 'manifest.json' in sources:
+            shell.append('/manifest.json')
+        # Hashed names change with their files; the page and manifest do not
+        self.version = _fingerprint(
+            json.dumps(shell).encode() + page + sources.get('manifest.json', b'')
+        )
+
+        if SERVICE_WORKER in sources:
+            manifest = (f"const ASSET_VERSION = {json.dumps(self.version)};\n"
+                        f"const ASSETS = {json.dumps(shell)};\n")
+            self.assets[SERVICE_WORKER] = Asset(
+                manifest.encode('utf-8') + sources[SERVICE_WORKER],
+                _mimetype(SERVICE_WORKER), REVALIDATE
+            )
+        print(f"[STATIC] {len(sources)} client files loaded, "
+              f"{len(self.urls)} fingerprinted (version {self.version})")
+
+    def _link_fingerprinted(self, html):
+        """Point src="/..." and href="/..." links at the fingerprinted names."""
+        def replace(match):
+            hashed = self.urls.get(match.group(2).decode())
+            return match.group(1) + hashed.encode() + b'"' if hashed else match.group(0)
+        return re.sub(rb'((?:src|href)="/)([^"]+)"', replace, html)
+
+    def response(self, path):
+        """Serve a client file, honouring If-None-Match and Accept-Encoding."""
+        asset = self.assets.get(path)
+        if asset is None:
+            abort(404)
+
+        use_gzip = asset.gzipped is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+        response = Response(asset.gzipped if use_gzip else asset.body, mimetype=asset.mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        if asset.gzipped is not None:
+            response.vary.add('Accept-Encoding')
+        # Strong ETags name one representation, so the gzip body gets its own
+        response.set_etag(asset.etag + ('.gz' if use_gzip else ''))
+        response.headers['Cache-Control'] = asset.cache_control
+        return response.make_conditional(request)
+
+
+def _mimetype(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+static_assets = StaticAssets()
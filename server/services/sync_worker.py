@@ -0,0 +1,222 @@
+"""
+Cloud sync worker: drains the SyncQueue to the cloud.
+
+Pending entries are read in batches of SYNC_BATCH_SIZE and joined to their
+source records with one query per table. Each batch is uploaded as a
+single gzip-compressed JSON payload to SYNC_ENDPOINT, and its entries are
+marked synced in one transaction. Failed uploads back off exponentially,
+up to SYNC_BACKOFF_MAX seconds.
+
+The worker stays idle while any session is live, so it never competes
+with check-ins for SQLite's write lock during class. After a successful
+drain, synced entries older than SYNC_RETENTION_DAYS are deleted so the
+queue table stays small.
+"""
+import gzip
+import json
+import random
+import urllib.request
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_
+from database import db
+
+
+class SyncError(Exception):
+    """An upload the sync endpoint did not accept."""
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def load_attendance(ids):
+    """Attendance records with their student and session, in one joined query."""
+    from models import Attendance, Session, Student
+
+    rows = db.session.query(
+        Attendance.id,
+        Student.student_id,
+        Student.name,
+        Session.course_code,
+        Session.session_token,
+        Session.start_time,
+        Attendance.timestamp,
+        Attendance.status
+    ).join(Student, Attendance.student_id == Student.id)\
+        .join(Session, Attendance.session_id == Session.id)\
+        .filter(Attendance.id.in_(ids)).all()
+
+    return [{
+        'id': r.id,
+        'student_id': r.student_id,
+        'student_name': r.name,
+        'course_code': r.course_code,
+        'session_token': r.session_token,
+        'session_start': _iso(r.start_time),
+        'check_in_time': _iso(r.timestamp),
+        'status': r.status
+    } for r in rows]
+
+
+def load_students(ids):
+    from models import Student
+
+    rows = Student.query.filter(Student.id.in_(ids)).all()
+    return [{
+        'id': s.id,
+        'student_id': s.student_id,
+        'name': s.name,
+        'device_uuid': s.device_uuid,
+        'enrolled_at': _iso(s.enrolled_at),
+        'is_active': s.is_active
+    } for s in rows]
+
+
+LOADERS = {
+    'attendance': load_attendance,
+    'students': load_students,
+}
+
+
+class SyncWorker:
+    """Background service that uploads pending SyncQueue entries."""
+
+    def __init__(self):
+        self.socketio = None
+        self.app = None
+        self.failures = 0
+
+    def start(self, socketio, app):
+        if not app.config.get('SYNC_ENDPOINT'):
+            print("[SYNC] No SYNC_ENDPOINT configured; cloud sync disabled")
+            return
+        self.socketio = socketio
+        self.app = app
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                self.socketio.sleep(self.run_once())
+
+    def run_once(self):
+        """Drain what can be drained now. Returns seconds to wait before the next run."""
+        config = self.app.config
+        try:
+            synced = self.sync_pending(stop_if_live=True)
+        except Exception as e:
+            self.failures += 1
+            delay = min(
+                config['SYNC_BACKOFF_MAX'],
+                config['SYNC_BACKOFF_BASE'] * 2 ** (self.failures - 1)
+            )
+            delay *= random.uniform(0.5, 1.0)
+            print(f"[SYNC] Upload failed ({e}); retrying in {delay:.0f}s")
+            return delay
+        finally:
+            db.session.remove()
+
+        self.failures = 0
+        if synced:
+            print(f"[SYNC] Uploaded {synced} records")
+            compacted = self.compact(config['SYNC_RETENTION_DAYS'])
+            if compacted:
+                print(f"[SYNC] Compacted {compacted} synced entries")
+            db.session.remove()
+        return config['SYNC_CHECK_INTERVAL']
+
+    def sync_pending(self, stop_if_live=False):
+        """
+        Upload pending entries batch by batch until the queue is empty.
+        With stop_if_live, stop as soon as a session is active.
+        Returns the number of queue entries marked synced.
+        """
+        from flask import current_app
+        from models import Session
+
+        batch_size = current_app.config['SYNC_BATCH_SIZE']
+        total = 0
+        while True:
+            if stop_if_live and db.session.query(Session.id).filter_by(is_active=True).first():
+                return total
+
+            synced = self.sync_batch(batch_size)
+            total += synced
+            if synced < batch_size:
+                return total
+
+            # Let other greenthreads run between batches
+            if self.socketio is not None:
+                self.socketio.sleep(0)
+
+    def sync_batch(self, batch_size):
+        """Upload one batch of pending entries. Returns how many were marked synced."""
+        from models import SyncQueue
+
+        entries = db.session.query(SyncQueue.id, SyncQueue.table_name, SyncQueue.record_id,
+                                   SyncQueue.created_at)\
+            .filter(SyncQueue.status == 'pending')\
+            .order_by(SyncQueue.id).limit(batch_size).all()
+        if not entries:
+            return 0
+
+        record_ids = {}
+        for entry in entries:
+            record_ids.setdefault(entry.table_name, set()).add(entry.record_id)
+
+        payload = {'generated_at': datetime.utcnow().isoformat()}
+        for table_name, ids in record_ids.items():
+            loader = LOADERS.get(table_name)
+            records = loader(ids) if loader else []
+            payload[table_name] = records
+            # Records deleted since they were queued (e.g. attendance overridden to absent)
+            missing = ids - {r['id'] for r in records}
+            if missing:
+                payload[f'{table_name}_deleted'] = sorted(missing)
+
+        self.upload(payload)
+
+        # An entry re-queued while we were uploading has had its created_at
+        # changed and stays pending, so that change is uploaded next time
+        synced = db.session.query(SyncQueue).filter(
+            tuple_(SyncQueue.id, SyncQueue.created_at).in_(
+                [(entry.id, entry.created_at) for entry in entries]
+            )
+        ).update(
+            {'status': 'synced', 'synced_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return synced
+
+    def compact(self, retention_days):
+        """Delete synced entries older than the retention window. Returns how many."""
+        from models import SyncQueue
+
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        deleted = db.session.query(SyncQueue).filter(
+            SyncQueue.status == 'synced',
+            SyncQueue.synced_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def upload(self, payload):
+        """POST a payload to SYNC_ENDPOINT as gzip-compressed JSON."""
+        from flask import current_app
+
+        config = current_app.config
+        body = gzip.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        request = urllib.request.Request(config['SYNC_ENDPOINT'], data=body, method='POST')
+        request.add_header('Content-Type', 'application/json')
+        request.add_header('Content-Encoding', 'gzip')
+        if config.get('SUPABASE_KEY'):
+            request.add_header('apikey', config['SUPABASE_KEY'])
+            request.add_header('Authorization', f"Bearer {config['SUPABASE_KEY']}")
+
+        with urllib.request.urlopen(request, timeout=config['SYNC_TIMEOUT']) as response:
+            if response.status >= 300:
+                raise SyncError(f"HTTP {response.status}")
+
+
+sync_worker = SyncWorker()
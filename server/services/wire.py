@@ -0,0 +1,277 @@
+"""
+Compact wire format for Socket.IO check-in traffic.
+
+A client that connects with `?wire=compact` in its Socket.IO URL (the
+student app and dashboard do, via client/js/wire.js) receives the
+check-in events in a compact form; every other client keeps plain JSON:
+
+- Field names become short codes (FIELD_CODES), statuses small integers
+  and timestamps integer epoch seconds (UTC).
+- attendance_batch, which carries many records, is then sent as a
+  MessagePack binary attachment.
+- check_in_response stays JSON text. A binary attachment costs an extra
+  WebSocket frame with a placeholder header, which on one short reply
+  outweighs the bytes MessagePack saves, and the extra frame per check-in
+  cost throughput on the Pi.
+- session_attendance_count is sent as [session_id, count].
+
+Everything else (session_started, qr_update, ...) is rare and stays JSON
+for everyone. Broadcasts reach compact clients through a parallel set of
+rooms (compact_room()), so each client gets one copy in its own format;
+JSON-only events go to both (with_compact_rooms()).
+
+Only the MessagePack types these payloads use are implemented here:
+nil, booleans, integers, floats, strings, arrays and maps. unpackb() and
+expand() mirror client/js/wire.js, for the benchmark and tests.
+"""
+import calendar
+import struct
+import threading
+from datetime import datetime, timezone
+
+COMPACT = 'compact'
+COMPACT_SUFFIX = '#compact'
+
+FIELD_CODES = {
+    'id': 'i',
+    'session_id': 's',
+    'removed': 'd',
+    'count': 'c',
+    'records': 'r',
+    'student_id': 'u',
+    'student_matric': 'm',
+    'student_name': 'n',
+    'timestamp': 't',
+    'status': 'x',
+    'attendance': 'a',
+    'success': 'ok',
+    'message': 'g',
+    'error': 'e',
+    'retry_after': 'w',
+    'seq': 'q',
+}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+STATUS_CODES = ('present', 'late', 'flagged', 'absent')
+TIMESTAMP_FIELDS = ('timestamp',)
+
+# Sent as a MessagePack attachment, or as compacted JSON
+BINARY_EVENTS = ('attendance_batch',)
+COMPACT_EVENTS = ('check_in_response',)
+
+
+class WireFormats:
+    """Which connected clients asked for the compact format."""
+
+    def __init__(self):
+        self._compact = set()
+        self._lock = threading.Lock()
+
+    def connect(self, sid, wire):
+        with self._lock:
+            if wire == COMPACT:
+                self._compact.add(sid)
+            else:
+                self._compact.discard(sid)
+
+    def disconnect(self, sid):
+        with self._lock:
+            self._compact.discard(sid)
+
+    def is_compact(self, sid):
+        return sid in self._compact
+
+    def room_for(self, sid, room):
+        """The room a client should join to receive `room`'s broadcasts."""
+        return compact_room(room) if self.is_compact(sid) else room
+
+    def payload_for(self, sid, event, payload):
+        """An event's payload as this client wants it."""
+        return encode(event, payload) if self.is_compact(sid) else payload
+
+
+wire_formats = WireFormats()
+
+
+def compact_room(room):
+    return room + COMPACT_SUFFIX
+
+
+def with_compact_rooms(rooms):
+    """Rooms plus their compact variants, for events sent as JSON to everyone."""
+    return list(rooms) + [compact_room(room) for room in rooms]
+
+
+def emit_to_rooms(socketio, event, payload, rooms):
+    """Broadcast to rooms: JSON to their JSON members, compact to the rest."""
+    socketio.emit(event, payload, room=rooms)
+    socketio.emit(event, encode(event, payload), room=[compact_room(room) for room in rooms])
+
+
+# ─── Encoding ───
+
+def encode(event, payload):
+    """The compact form of an event's payload."""
+    if event in BINARY_EVENTS:
+        return packb(compact(payload))
+    if event in COMPACT_EVENTS:
+        return compact(payload)
+    if event == 'session_attendance_count':
+        return [payload['session_id'], payload['count']]
+    return payload
+
+
+def compact(value, key=None):
+    """Shorten field names, statuses and timestamps, recursively."""
+    if isinstance(value, dict):
+        return {FIELD_CODES.get(k, k): compact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [compact(item) for item in value]
+    if key == 'status' and value in STATUS_CODES:
+        return STATUS_CODES.index(value)
+    if key in TIMESTAMP_FIELDS and isinstance(value, str):
+        # Stored times are naive UTC
+        return calendar.timegm(datetime.fromisoformat(value).utctimetuple())
+    return value
+
+
+def packb(value):
+    """Serialize to MessagePack."""
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def _pack(value, out):
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif isinstance(value, int):
+        _pack_int(value, out)
+    elif isinstance(value, float):
+        out += b'\xcb' + struct.pack('>d', value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        _pack_header(len(data), out, 0xa0, 31, (0xd9, 0xda, 0xdb))
+        out += data
+    elif isinstance(value, (list, tuple)):
+        _pack_header(len(value), out, 0x90, 15, (None, 0xdc, 0xdd))
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        _pack_header(len(value), out, 0x80, 15, (None, 0xde, 0xdf))
+        for k, v in value.items():
+            _pack(k, out)
+            _pack(v, out)
+    else:
+        raise TypeError(f"Cannot pack {type(value).__name__}")
+
+
+def _pack_int(value, out):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    elif value >= 0:
+        for marker, fmt, limit in ((0xcc, '>B', 1 << 8), (0xcd, '>H', 1 << 16),
+                                   (0xce, '>I', 1 << 32), (0xcf, '>Q', 1 << 64)):
+            if value < limit:
+                out += bytes([marker]) + struct.pack(fmt, value)
+                return
+        raise OverflowError(value)
+    else:
+        for marker, fmt, limit in ((0xd0, '>b', 1 << 7), (0xd1, '>h', 1 << 15),
+                                   (0xd2, '>i', 1 << 31), (0xd3, '>q', 1 << 63)):
+            if value >= -limit:
+                out += bytes([marker]) + struct.pack(fmt, value)
+                return
+        raise OverflowError(value)
+
+
+def _pack_header(length, out, fix, fix_max, markers):
+    """A str/array/map header: fix form, then 8-, 16- or 32-bit length."""
+    if length <= fix_max:
+        out.append(fix | length)
+    elif length < 1 << 8 and markers[0] is not None:
+        out += bytes([markers[0], length])
+    elif length < 1 << 16:
+        out += bytes([markers[1]]) + struct.pack('>H', length)
+    else:
+        out += bytes([markers[2]]) + struct.pack('>I', length)
+
+
+# ─── Decoding (mirrors client/js/wire.js) ───
+
+def expand(value, key=None):
+    """Undo compact(): full field names, status names, ISO timestamps."""
+    if isinstance(value, dict):
+        return {FIELD_NAMES.get(k, k): expand(v, FIELD_NAMES.get(k, k)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    if key == 'status' and isinstance(value, int) and not isinstance(value, bool):
+        return STATUS_CODES[value]
+    if key in TIMESTAMP_FIELDS and isinstance(value, int):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None).isoformat()
+    return value
+
+
+def unpackb(data):
+    """Deserialize MessagePack produced by packb()."""
+    value, offset = _unpack(memoryview(data), 0)
+    return value
+
+
+def _unpack(data, offset):
+    byte = data[offset]
+    offset += 1
+    if byte < 0x80:
+        return byte, offset
+    if byte >= 0xe0:
+        return byte - 0x100, offset
+    if 0xa0 <= byte <= 0xbf:
+        return _unpack_str(data, offset, byte & 0x1f)
+    if 0x90 <= byte <= 0x9f:
+        return _unpack_array(data, offset, byte & 0x0f)
+    if 0x80 <= byte <= 0x8f:
+        return _unpack_map(data, offset, byte & 0x0f)
+    if byte == 0xc0:
+        return None, offset
+    if byte in (0xc2, 0xc3):
+        return byte == 0xc3, offset
+
+    fixed = {0xcb: '>d', 0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+             0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q'}
+    if byte in fixed:
+        size = struct.calcsize(fixed[byte])
+        return struct.unpack_from(fixed[byte], data, offset)[0], offset + size
+
+    lengths = {0xd9: ('>B', _unpack_str), 0xda: ('>H', _unpack_str), 0xdb: ('>I', _unpack_str),
+               0xdc: ('>H', _unpack_array), 0xdd: ('>I', _unpack_array),
+               0xde: ('>H', _unpack_map), 0xdf: ('>I', _unpack_map)}
+    if byte in lengths:
+        fmt, read = lengths[byte]
+        length = struct.unpack_from(fmt, data, offset)[0]
+        return read(data, offset + struct.calcsize(fmt), length)
+    raise ValueError(f"Unsupported MessagePack type 0x{byte:02x}")
+
+
+def _unpack_str(data, offset, length):
+    return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+
+def _unpack_array(data, offset, length):
+    items = []
+    for _ in range(length):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_map(data, offset, length):
+    result = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset)
+        result[key], offset = _unpack(data, offset)
+    return result, offset
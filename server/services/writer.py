@@ -0,0 +1,231 @@
+"""
+Group-commit writer for check-in bursts.
+
+Accepted check-ins are queued and written by a single background writer,
+which commits everything it has gathered in one transaction — every
+CHECKIN_BATCH_INTERVAL_MS, or as soon as CHECKIN_BATCH_SIZE records are
+waiting. Callers block until their record has been committed, so a
+check-in is only acknowledged once it is durable.
+
+The writer keeps running totals in `stats` (batches, records, commit time,
+and time spent waiting for SQLite's write lock) for /api/health and the
+benchmark harness, and feeds the same figures to /api/metrics.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from flask import current_app
+from sqlalchemy.exc import IntegrityError, OperationalError
+from database import db
+from services.metrics import (
+    checkin_batch_size, checkin_commit_seconds, checkin_lock_errors, checkin_lock_wait_seconds
+)
+
+
+class WriteTimeout(Exception):
+    """The writer did not confirm a record within CHECKIN_WRITE_TIMEOUT."""
+
+
+class DuplicateCheckIn(Exception):
+    """The student already has an attendance record for this session."""
+
+
+class IdempotencyKeyConflict(Exception):
+    """The idempotency key is already on another student's or session's record."""
+
+
+class PendingCheckIn:
+    """A check-in waiting for the writer to commit it."""
+
+    def __init__(self, student_pk, session_id, course_code, status, timestamp, idempotency_key=None):
+        self.student_pk = student_pk
+        self.session_id = session_id
+        self.course_code = course_code
+        self.status = status
+        self.timestamp = timestamp
+        self.idempotency_key = idempotency_key
+        self.change_seq = None   # set by the writer (Session.next_changes)
+        self.attendance_id = None
+        self.error = None
+        self._done = threading.Event()
+
+    def resolve(self, attendance_id=None, error=None):
+        self.attendance_id = attendance_id
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Block until committed. Returns the new attendance id."""
+        if not self._done.wait(timeout):
+            raise WriteTimeout('Check-in was not confirmed in time')
+        if self.error:
+            raise self.error
+        return self.attendance_id
+
+
+class CheckInWriter:
+    """Background writer that commits queued check-ins in batches."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.app = None
+        self.batch_size = 100
+        self.batch_interval = 0.005
+        self.stats = {
+            'batches': 0,
+            'records': 0,
+            'commit_seconds': 0.0,      # whole transactions, lock waits included
+            'lock_wait_seconds': 0.0,   # until the first insert got the write lock
+            'lock_errors': 0,           # transactions that gave up on a locked database
+        }
+
+    def submit(self, student_pk, session_id, course_code, status, timestamp, idempotency_key=None):
+        """Queue a check-in for the next batch. Returns a PendingCheckIn."""
+        self._ensure_started()
+        pending = PendingCheckIn(student_pk, session_id, course_code, status, timestamp, idempotency_key)
+        self._queue.put(pending)
+        return pending
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def snapshot(self):
+        """Current stats plus queue depth, safe to serialise."""
+        return dict(self.stats, queue_depth=self.queue_depth())
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.app = current_app._get_current_object()
+            self.batch_size = self.app.config.get('CHECKIN_BATCH_SIZE', 100)
+            self.batch_interval = self.app.config.get('CHECKIN_BATCH_INTERVAL_MS', 5) / 1000
+            self._thread = threading.Thread(
+                target=self._run, name='checkin-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._collect()
+                self._write(batch)
+
+    def _collect(self):
+        """Wait for the first record, then gather more until the batch fills or the interval ends."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            ids = self._commit(batch)
+        except Exception as e:
+            db.session.rollback()
+            if isinstance(e, OperationalError) and 'locked' in str(e):
+                self.stats['lock_errors'] += 1
+                checkin_lock_errors.inc()
+            if len(batch) == 1:
+                if isinstance(e, IntegrityError) and 'idempotency_key' in str(e.orig):
+                    e = IdempotencyKeyConflict()
+                batch[0].resolve(error=e)
+                return
+            # Retry one by one so a single bad record cannot fail the others
+            for pending in batch:
+                self._write([pending])
+            return
+
+        for pending, attendance_id in zip(batch, ids):
+            if attendance_id is None:
+                pending.resolve(error=DuplicateCheckIn())
+            else:
+                pending.resolve(attendance_id)
+
+    def _commit(self, batch):
+        """
+        Write a batch of check-ins, their course summaries and sync entries
+        in one transaction. Each insert resolves a conflict on (student_id,
+        session_id) itself, so a duplicate comes back as None instead of
+        aborting the batch; that includes a resend under the same key. A key
+        already used for another student or session is not a duplicate: it
+        aborts the batch, and the one-by-one retry reports it.
+        """
+        from sqlalchemy import update
+        from sqlalchemy.dialects.sqlite import insert
+        from models import Attendance, CourseSummary, Session, SyncQueue
+
+        started = time.perf_counter()
+        # One change number per record, reserved per session up front; a
+        # duplicate leaves a gap, which dashboards do not mind
+        lock_acquired = None
+        for session_id, count in Counter(p.session_id for p in batch).items():
+            change_seq = Session.next_changes(session_id, count)
+            if lock_acquired is None:
+                # The first write of a transaction waits for SQLite's write lock
+                lock_acquired = time.perf_counter()
+            for p in batch:
+                if p.session_id == session_id:
+                    p.change_seq = change_seq
+                    change_seq += 1
+
+        ids = []
+        for p in batch:
+            stmt = insert(Attendance).values(
+                student_id=p.student_pk,
+                session_id=p.session_id,
+                status=p.status,
+                timestamp=p.timestamp,
+                idempotency_key=p.idempotency_key,
+                change_seq=p.change_seq
+            ).on_conflict_do_nothing(
+                index_elements=['student_id', 'session_id']
+            ).returning(Attendance.id)
+            ids.append(db.session.execute(stmt).scalar())
+
+        # Keep each session's attendance counter in step with its rows
+        added = Counter(p.session_id for p, record_id in zip(batch, ids) if record_id is not None)
+        for session_id, count in added.items():
+            db.session.execute(
+                update(Session)
+                .where(Session.id == session_id)
+                .values(attendance_count=Session.attendance_count + count)
+            )
+
+        # ...and each student's course totals
+        CourseSummary.record([
+            (p.course_code, p.student_pk, p.status, p.timestamp)
+            for p, record_id in zip(batch, ids) if record_id is not None
+        ])
+
+        # Queue for cloud sync
+        SyncQueue.enqueue('attendance', [record_id for record_id in ids if record_id is not None])
+        db.session.commit()
+
+        elapsed = time.perf_counter() - started
+        lock_wait = lock_acquired - started
+        stats = self.stats
+        stats['batches'] += 1
+        stats['records'] += len(batch)
+        stats['commit_seconds'] += elapsed
+        stats['lock_wait_seconds'] += lock_wait
+        checkin_commit_seconds.observe(elapsed)
+        checkin_batch_size.observe(len(batch))
+        checkin_lock_wait_seconds.inc(amount=lock_wait)
+        return ids
+
+
+checkin_writer = CheckInWriter()
@@ -1,160 +1,161 @@
 """
 WebSocket event handlers for real-time communication.
+
+Clients that connect with ?wire=compact get check-in traffic in the compact
+format of services/wire.py; rooms are joined through wire_formats.room_for()
+so broadcasts reach each client in the format it asked for.
 """
-from flask_socketio import emit, join_room, leave_room
+from flask_socketio import emit, join_room, leave_room, rooms
 from flask import request
 
 
 def register_socket_events(socketio):
     """Register all WebSocket event handlers with the SocketIO instance."""
+    from services.broadcaster import broadcaster, LECTURER_ROOM
+    from services.metrics import metrics
+    from services.registry import lecturer_room, session_room
+    from services.wire import COMPACT, wire_formats
+    broadcaster.init_socketio(socketio)
+
+    def reply(event, payload):
+        """Answer the current client in its wire format."""
+        emit(event, wire_formats.payload_for(request.sid, event, payload))
 
     @socketio.on('connect')
     def handle_connect():
-        """Handle client connection."""
+        """Handle client connection; ?wire=compact selects the compact format."""
         client_id = request.sid
-        print(f"[WS] Client connected: {client_id}")
-        emit('connected', {'message': 'Connected to attendance server', 'sid': client_id})
+        wire_formats.connect(client_id, request.args.get('wire'))
+        wire = COMPACT if wire_formats.is_compact(client_id) else 'json'
+        print(f"[WS] Client connected: {client_id} ({wire})")
+        emit('connected', {
+            'message': 'Connected to attendance server', 'sid': client_id, 'wire': wire
+        })
 
     @socketio.on('disconnect')
     def handle_disconnect():
         """Handle client disconnection."""
         client_id = request.sid
+        wire_formats.disconnect(client_id)
         print(f"[WS] Client disconnected: {client_id}")
 
     @socketio.on('join_session')
+    @metrics.track_event('join_session')
     def handle_join_session(data):
         """
         Client joins a session room for real-time updates.
-        Data: { "session_token": "abc123" }
+        Data: { "session_id": 12 }
         """
-        session_token = data.get('session_token', '')
-        if session_token:
-            join_room(f"session_{session_token}")
+        session_id = data.get('session_id')
+        if isinstance(session_id, int):
+            join_room(wire_formats.room_for(request.sid, session_room(session_id)))
             emit('joined_session', {
                 'message': f'Joined session room',
-                'session_token': session_token
+                'session_id': session_id
             })
-            print(f"[WS] Client {request.sid} joined session_{session_token}")
+            print(f"[WS] Client {request.sid} joined {session_room(session_id)}")
 
     @socketio.on('leave_session')
+    @metrics.track_event('leave_session')
     def handle_leave_session(data):
         """Client leaves a session room."""
-        session_token = data.get('session_token', '')
-        if session_token:
-            leave_room(f"session_{session_token}")
-            print(f"[WS] Client {request.sid} left session_{session_token}")
+        session_id = data.get('session_id')
+        if isinstance(session_id, int):
+            leave_room(wire_formats.room_for(request.sid, session_room(session_id)))
+            print(f"[WS] Client {request.sid} left {session_room(session_id)}")
 
     @socketio.on('join_lecturer')
+    @metrics.track_event('join_lecturer')
     def handle_join_lecturer(data):
-        """Lecturer joins the lecturer room for dashboard updates."""
-        join_room('lecturer_dashboard')
-        emit('joined_lecturer', {'message': 'Connected to lecturer dashboard'})
-        print(f"[WS] Lecturer dashboard connected: {request.sid}")
+        """
+        Lecturer joins a room for dashboard updates.
+        Data: { "course_code": "CSC301" } for one course's check-ins and QR,
+        or nothing for every course. Joining again switches rooms.
+        """
+        course_code = str((data or {}).get('course_code') or '').strip()
+        room = wire_formats.room_for(
+            request.sid, lecturer_room(course_code) if course_code else LECTURER_ROOM
+        )
+        for joined in rooms():
+            # Covers LECTURER_ROOM and the compact variants too
+            if joined != room and joined.startswith('lecturer_'):
+                leave_room(joined)
+        join_room(room)
+        emit('joined_lecturer', {
+            'message': 'Connected to lecturer dashboard',
+            'course_code': course_code or None
+        })
+        print(f"[WS] Lecturer dashboard connected: {request.sid} ({room})")
 
     @socketio.on('check_in')
+    @metrics.track_event('check_in')
     def handle_check_in(data):
         """
         Real-time check-in via WebSocket.
-        Data: { "student_id": "...", "device_uuid": "...", "session_token": "..." }
+        Data: { "student_id": "...", "device_uuid": "...", "session_token": "...",
+                "idempotency_key": "..." (optional) }
         """
-        from models import Student, Session as AttSession, Attendance, SyncQueue
-        from database import db
-        from datetime import datetime
-        from flask import current_app
+        from services.admission import AdmissionRejected, admission
+        from services.checkin import CheckInError, check_in
 
         student_id = data.get('student_id', '').strip()
         device_uuid = data.get('device_uuid', '').strip()
         session_token = data.get('session_token', '').strip()
+        idempotency_key = (data.get('idempotency_key') or '').strip() or None
 
         if not student_id or not device_uuid or not session_token:
-            emit('check_in_response', {
+            reply('check_in_response', {
                 'success': False,
                 'error': 'Missing required fields'
             })
             return
 
-        # Validation pipeline
-        session = AttSession.query.filter_by(session_token=session_token).first()
-        if not session or not session.is_active:
-            emit('check_in_response', {
+        try:
+            with admission.admit('check_in_socket', device_uuid, request.remote_addr):
+                attendance = check_in(student_id, device_uuid, session_token, idempotency_key)
+        except AdmissionRejected as e:
+            reply('check_in_response', {
                 'success': False,
-                'error': 'No active session with this token'
+                'error': e.message,
+                'retry_after': e.retry_after_seconds()
             })
             return
-
-        student = Student.query.filter_by(student_id=student_id).first()
-        if not student:
-            emit('check_in_response', {
-                'success': False,
-                'error': 'Student not enrolled'
-            })
+        except CheckInError as e:
+            response = {'success': False, 'error': e.message}
+            if e.attendance:
+                response['attendance'] = e.attendance.to_dict()
+            reply('check_in_response', response)
             return
 
-        if student.device_uuid != device_uuid:
-            emit('check_in_response', {
-                'success': False,
-                'error': 'Device mismatch'
-            })
-            return
-
-        existing = Attendance.query.filter_by(
-            student_id=student.id,
-            session_id=session.id
-        ).first()
-
-        if existing:
-            emit('check_in_response', {
-                'success': False,
-                'error': 'Already checked in',
-                'attendance': existing.to_dict()
-            })
-            return
-
-        # Determine status
-        late_threshold = current_app.config.get('LATE_THRESHOLD_MINUTES', 15)
-        now = datetime.utcnow()
-        status = 'present'
-        if session.start_time:
-            minutes_since_start = (now - session.start_time).total_seconds() / 60
-            if minutes_since_start > late_threshold:
-                status = 'late'
-
-        # Record attendance
-        attendance = Attendance(
-            student_id=student.id,
-            session_id=session.id,
-            status=status
-        )
-        db.session.add(attendance)
-        db.session.commit()
-
-        # Queue for sync
-        sync_entry = SyncQueue(table_name='attendance', record_id=attendance.id)
-        db.session.add(sync_entry)
-        db.session.commit()
-
-        # Notify the student
-        emit('check_in_response', {
+        # Notify the student; the dashboard and session room are updated
+        # by the broadcaster's next batch
+        reply('check_in_response', {
             'success': True,
-            'message': f'Attendance recorded as {status}',
-            'attendance': attendance.to_dict()
+            'message': f"Attendance recorded as {attendance['status']}",
+            'attendance': attendance
         })
 
-        # Broadcast to lecturer dashboard
-        socketio.emit('attendance_update', {
-            'attendance': attendance.to_dict(),
-            'session': session.to_dict()
-        }, room='lecturer_dashboard')
+        print(f"[WS] Check-in: {student_id} → {attendance['status']}")
 
-        # Broadcast to session room
-        socketio.emit('session_attendance_count', {
-            'session_id': session.id,
-            'count': Attendance.query.filter_by(session_id=session.id).count()
-        }, room=f"session_{session_token}")
+    @socketio.on('attendance_catch_up')
+    @metrics.track_event('attendance_catch_up')
+    def handle_attendance_catch_up(data):
+        """
+        Reconnecting dashboard catches up on the changes it missed.
+        Data: { "session_id": 1, "since": 42 } (the highest `seq` it has seen)
+        """
+        session_id = data.get('session_id')
+        since = data.get('since', 0)
+        # SQLite integers are 64-bit; anything else cannot be looked up
+        if not all(isinstance(n, int) and 0 <= n < 2 ** 63 for n in (session_id, since)):
+            return
 
-        print(f"[WS] Check-in: {student_id} → {status}")
+        batch = broadcaster.changes_since(session_id, since)
+        if batch is not None:
+            reply('attendance_batch', batch)
 
     @socketio.on('heartbeat')
+    @metrics.track_event('heartbeat')
     def handle_heartbeat(data):
         """
         Optional heartbeat to verify student presence.
@@ -15,6 +15,7 @@ from database import db, init_db
 app = Flask(__name__)
 app.config.from_object(Config)
 app.config['TESTING'] = True
+app.config['QUERY_BUDGET_STRICT'] = True  # fail any view that exceeds its @query_budget
 CORS(app)
 
 init_db(app)
@@ -23,11 +24,15 @@ from routes.enrollment import enrollment_bp
 from routes.sessions import sessions_bp
 from routes.attendance import attendance_bp
 from routes.lecturer import lecturer_bp
+from routes.metrics import metrics_bp
+from services.metrics import metrics
 
+metrics.init_app(app)
 app.register_blueprint(enrollment_bp)
 app.register_blueprint(sessions_bp)
 app.register_blueprint(attendance_bp)
 app.register_blueprint(lecturer_bp)
+app.register_blueprint(metrics_bp)
 
 @app.route('/api/health')
 def health():
@@ -35,6 +40,12 @@ def health():
 
 client = app.test_client()
 
+
+def scan_qr(course_code):
+    """The rotating token a phone gets by scanning the course's QR."""
+    return client.get(f'/api/session/qr?course_code={course_code}').get_json()['qr_token']
+
+
 # Run tests
 print("Running Phase 1 API tests...")
 print("-" * 40)
@@ -64,9 +75,16 @@ r = client.post('/api/session/start', json={'course_code': 'CSC301'})
 data = r.get_json()
 print(f"4. Start session: {r.status_code} {data.get('message', data.get('error'))}")
 assert r.status_code == 201
-token = data['session']['session_token']
+static_token = data['session']['session_token']
+token = scan_qr('CSC301')
 
-# 5. Check-in
+# 5. Check-in with the scanned QR; the static token is for the lecturer only
+r = client.post('/api/check-in', json={
+    'student_id': 'CSC/2023/001', 'device_uuid': 'test-001', 'session_token': static_token
+})
+assert r.status_code == 404
+assert 'session_token' not in client.get('/api/session/active').get_json()['sessions'][0]
+assert 'session_token' not in client.get('/api/session/qr?course_code=CSC301').get_json()
 r = client.post('/api/check-in', json={
     'student_id': 'CSC/2023/001', 'device_uuid': 'test-001', 'session_token': token
 })
@@ -117,11 +135,656 @@ data = r.get_json()
 print(f"11. Students: {r.status_code} total={data.get('total', 0)}")
 assert r.status_code == 200
 
-# 12. Active session (none)
+# 12. Active session (none), then a conditional re-poll
 r = client.get('/api/session/active')
 data = r.get_json()
 print(f"12. No active session: {r.status_code} active={data.get('active')}")
 assert data['active'] == False
+etag = r.headers['ETag']
+r = client.get('/api/session/active', headers={'If-None-Match': etag})
+assert r.status_code == 304
+
+# 13. Re-enroll to a new device, then check in with it (cache invalidation)
+r = client.post('/api/re-enroll', json={
+    'student_id': 'CSC/2023/001', 'new_device_uuid': 'test-002'
+})
+assert r.status_code == 200
+r = client.post('/api/session/start', json={'course_code': 'CSC301'})
+token = scan_qr('CSC301')
+r = client.get('/api/session/active', headers={'If-None-Match': etag})
+assert r.status_code == 200 and r.get_json()['active']
+# Another worker with the same active sessions issues the same ETag
+from services.registry import ActiveSessionRegistry
+with app.app_context():
+    assert ActiveSessionRegistry().etag() == r.headers['ETag'].strip('"') != etag.strip('"')
+r = client.post('/api/check-in', json={
+    'student_id': 'CSC/2023/001', 'device_uuid': 'test-001', 'session_token': token
+})
+assert r.status_code == 403
+r = client.post('/api/check-in', json={
+    'student_id': 'CSC/2023/001', 'device_uuid': 'test-002', 'session_token': token
+})
+print(f"13. Re-enrolled device check-in: {r.status_code}")
+assert r.status_code == 201
+
+# 14. Override to absent, then the student can check in again
+session_id = r.get_json()['attendance']['session_id']
+r = client.post('/api/attendance/override', json={
+    'student_id': 'CSC/2023/001', 'session_id': session_id, 'status': 'absent'
+})
+assert r.status_code == 200
+r = client.post('/api/check-in', json={
+    'student_id': 'CSC/2023/001', 'device_uuid': 'test-002', 'session_token': token
+})
+print(f"14. Check-in after override: {r.status_code}")
+assert r.status_code == 201
+client.post('/api/session/end', json={'course_code': 'CSC301'})
+
+# 15. A record written behind the cache's back is caught by the unique index
+from models import Attendance
+client.post('/api/enroll', json={
+    'student_id': 'CSC/2023/002', 'name': 'Jane Doe', 'device_uuid': 'test-003'
+})
+r = client.post('/api/session/start', json={'course_code': 'CSC302'})
+session_data = r.get_json()['session']
+token = scan_qr('CSC302')
+r = client.post('/api/check-in', json={
+    'student_id': 'CSC/2023/002', 'device_uuid': 'test-003', 'session_token': token
+})
+assert r.status_code == 201
+with app.app_context():
+    db.session.add(Attendance(student_id=1, session_id=session_data['id']))
+    db.session.commit()
+r = client.post('/api/check-in', json={
+    'student_id': 'CSC/2023/001', 'device_uuid': 'test-002', 'session_token': token
+})
+print(f"15. Duplicate caught by unique index: {r.status_code}")
+assert r.status_code == 409
+client.post('/api/session/end', json={'course_code': 'CSC302'})
+
+# 16. Session counters follow check-ins and overrides
+r = client.get('/api/sessions/history?course_code=CSC301')
+counts = [s['attendance_count'] for s in r.get_json()['sessions']]
+print(f"16. Attendance counters: {counts}")
+assert counts == [1, 1]
+
+# 17. Check in with the rotating QR token; forged and stale ones are rejected
+r = client.post('/api/session/start', json={'course_code': 'CSC303'})
+r = client.get('/api/session/qr?course_code=CSC303')
+qr_token = r.get_json()['qr_token']
+session_id, window, signature = qr_token.split('.')
+forged = f"{session_id}.{window}.{'0' * len(signature)}"
+stale = f"{session_id}.{int(window) - 5}.{signature}"
+unicode_digits = f"{session_id}\u00b2.{window}.{signature}"
+oversized = f"{'9' * 40}.{window}.{signature}"
+non_ascii_signature = f"{session_id}.{window}.\u00e9"
+for bad in (forged, stale, unicode_digits, oversized, non_ascii_signature):
+    r = client.post('/api/check-in', json={
+        'student_id': 'CSC/2023/002', 'device_uuid': 'test-003', 'session_token': bad
+    })
+    assert r.status_code == 404
+r = client.post('/api/check-in', json={
+    'student_id': 'CSC/2023/002', 'device_uuid': 'test-003', 'session_token': qr_token
+})
+print(f"17. Rotating QR token check-in: {r.status_code}")
+assert r.status_code == 201
+# A phone camera opens the student app with the token in the URL
+app.config['QR_CHECKIN_URL'] = 'http://10.0.0.2:5000/'
+body = client.get('/api/session/qr?course_code=CSC303').get_json()
+app.config['QR_CHECKIN_URL'] = ''
+assert body['qr_url'] == f"http://10.0.0.2:5000/?qr={body['qr_token']}"
+client.post('/api/session/end', json={'course_code': 'CSC303'})
+
+# 18. Sync worker drains the queue to a local stub endpoint
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from models import SyncQueue
+from services.sync_worker import sync_worker
+
+uploads = []
+
+
+class StubSyncHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        uploads.append(json.loads(gzip.decompress(body)))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+stub = HTTPServer(('127.0.0.1', 0), StubSyncHandler)
+threading.Thread(target=stub.serve_forever, daemon=True).start()
+app.config['SYNC_ENDPOINT'] = f"http://127.0.0.1:{stub.server_port}/sync"
+app.config['SYNC_BATCH_SIZE'] = 4
+with app.app_context():
+    pending = SyncQueue.query.filter_by(status='pending').count()
+    synced = sync_worker.sync_pending()
+    left = SyncQueue.query.filter_by(status='pending').count()
+stub.shutdown()
+print(f"18. Sync: {synced}/{pending} entries in {len(uploads)} uploads")
+assert synced == pending and left == 0
+assert len(uploads) == (pending + 3) // 4
+assert any(r['course_code'] == 'CSC303' for u in uploads for r in u.get('attendance', []))
+
+# 19. Repeated changes to one record coalesce; old synced entries are compacted
+from datetime import datetime, timedelta
+with app.app_context():
+    SyncQueue.enqueue('students', [1])
+    SyncQueue.enqueue('students', [1])
+    db.session.commit()
+    queued = SyncQueue.query.filter_by(status='pending').count()
+    db.session.query(SyncQueue).filter_by(status='synced').update(
+        {'synced_at': datetime.utcnow() - timedelta(days=60)}
+    )
+    db.session.commit()
+    compacted = sync_worker.compact(retention_days=30)
+    remaining = SyncQueue.query.filter_by(status='synced').count()
+# An edit committed while its entry is being uploaded keeps the entry pending,
+# even though its enqueue timestamp was taken before the batch was read
+from sqlalchemy.orm import Session as OrmSession
+
+
+def upload_while_edited(payload):
+    with OrmSession(db.engine) as other:
+        other.query(SyncQueue).filter_by(status='pending').update(
+            {'created_at': datetime.utcnow() - timedelta(seconds=5)}
+        )
+        other.commit()
+
+
+with app.app_context():
+    sync_worker.upload = upload_while_edited
+    raced = sync_worker.sync_batch(10)
+    del sync_worker.upload
+    still_pending = SyncQueue.query.filter_by(status='pending').count()
+print(f"19. Sync queue: {queued} pending after 2 edits, {compacted} compacted, "
+      f"{raced} marked synced during a concurrent edit")
+assert queued == 1 and compacted == synced and remaining == 0
+assert raced == 0 and still_pending == 1
+
+# 20. A new database is stamped with the latest schema version
+from database import MIGRATIONS, get_schema_version
+with app.app_context():
+    version = get_schema_version()
+print(f"20. Schema version: {version}/{len(MIGRATIONS)}")
+assert version == len(MIGRATIONS)
+
+# 21. Serial bridge drives sessions over a pseudo-terminal
+import os
+import select
+import time
+from services.serial_bridge import SerialBridge
+
+device, port = os.openpty()
+bridge = SerialBridge()
+bridge.open(os.ttyname(port), 9600)
+
+
+def controller(command):
+    """Send bytes as the device; poll the bridge until the replies arrive."""
+    os.write(device, command)
+    expected = command.count(b'\n')
+    deadline = time.time() + (2 if expected else 0.1)
+    replies = b''
+    while time.time() < deadline:
+        with app.app_context():
+            bridge.poll()
+        while select.select([device], [], [], 0.01)[0]:
+            replies += os.read(device, 1024)
+        if expected and replies.count(b'\n') >= expected:
+            break
+    return [json.loads(line) for line in replies.splitlines()]
+
+
+started = time.perf_counter()
+with app.app_context():
+    idle = bridge.poll()
+idle_ms = (time.perf_counter() - started) * 1000
+noise, start = controller(b'\x00garbage\r\n{"action": "start_session", "course_code": "CSC401"}\r\n')
+# A command split across reads is held until its newline
+partial = controller(b'{"action": "end_')
+end, = controller(b'session"}\n')
+# A command that fails unexpectedly is answered, and the next one still runs
+failed, again = controller(b'{"action": "end_session", "session_id": 1e30}\n'
+                           b'{"action": "end_session"}\n')
+bridge.close()
+os.close(device)
+print(f"21. Serial bridge: start={start['status']} end={end['status']} idle poll {idle_ms:.1f} ms")
+assert idle == 0 and idle_ms < 50
+assert noise['status'] == 'error' and start['status'] == 'ok' and partial == []
+assert end == {'status': 'ok', 'session_id': start['session_id'], 'records': 0}
+assert failed == {'status': 'error', 'error': 'Server error'} and again['status'] == 'error'
+
+# 22. Metrics endpoint reports route latency, writer commits and sync backlog
+r = client.get('/api/metrics')
+text = r.get_data(as_text=True)
+print(f"22. Metrics: {r.status_code} {len(text.splitlines())} lines")
+assert r.status_code == 200 and r.mimetype == 'text/plain'
+assert 'http_request_duration_seconds_count{method="POST",route="/api/check-in",status="201"}' in text
+assert 'checkin_commit_duration_seconds_count' in text
+assert 'sync_queue_pending ' in text
+
+# 23. Query profiler: Server-Timing header, and N+1 loops break a query limit
+from services.query_profiler import QueryBudgetExceeded, query_limit
+from models import Attendance
+r = client.get('/api/students')
+timing = r.headers.get('Server-Timing', '')
+with app.app_context():
+    rows = Attendance.query.all()
+    try:
+        with query_limit(1, 'Attendance.to_dict loop'):
+            [a.to_dict() for a in rows]
+        exceeded = False
+    except QueryBudgetExceeded:
+        exceeded = True
+    with query_limit(1, 'Attendance.listing'):
+        listed = Attendance.listing().all()
+
+
+def count_elsewhere():
+    with app.app_context():
+        Attendance.query.count()
+        db.session.remove()
+
+
+# Another thread's queries (the writer's, say) do not count against this block
+with query_limit(0, 'another thread') as quiet:
+    elsewhere = threading.Thread(target=count_elsewhere)
+    elsewhere.start()
+    elsewhere.join()
+print(f"23. Query profiler: {timing!r}, N+1 caught: {exceeded}")
+assert timing.startswith('db;dur=') and '1 queries' in timing
+assert exceeded and len(listed) == len(rows) and quiet.statements == []
+
+# 24. Worker fan-out: messages reach every other worker's socket; dead ones are pruned
+import socket
+import tempfile
+from services.cluster import UnixFanout
+ipc_dir = tempfile.mkdtemp()
+worker_a = UnixFanout(ipc_dir, 'test', name='a')
+worker_b = UnixFanout(ipc_dir, 'test', name='b')
+dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+dead.bind(os.path.join(ipc_dir, 'test-dead.sock'))
+dead.close()
+worker_a.send(b'invalidate')
+received = worker_b.recv()
+peers = [os.path.basename(p) for p in worker_a.peers()]
+worker_b.close()
+# A worker that stops reading is marked stale, and drops its local state when it
+# notices; one that missed Socket.IO broadcasts tells its clients to resync.
+# Publishing returns at once: a background sender waits on the stuck peer.
+from types import SimpleNamespace
+from services.cluster import Cluster, stale_marker
+stuck = UnixFanout(ipc_dir, 'test', name='stuck')
+stuck_socketio = UnixFanout(ipc_dir, 'test', name='stuck-socketio')
+worker_a._sender.settimeout(0.05)
+sender, stuck_node = Cluster(ipc_dir, 1), Cluster(ipc_dir, 2)
+sender.fanout, stuck_node.fanout = worker_a, stuck
+resynced, told = [], []
+stuck_node.manager = SimpleNamespace(
+    fanout=stuck_socketio, emit=lambda event, data, **kwargs: told.append((event, kwargs)))
+stuck_node.subscribe('test', None, lambda: resynced.append(True))
+publish_started = time.perf_counter()
+for _ in range(1000):
+    sender.publish('test', b'x' * 4096)
+publish_ms = (time.perf_counter() - publish_started) * 1000
+worker_a.flush()
+marked = stuck_node.check_stale(), stuck_node.check_stale()
+for fanout in (stuck, stuck_socketio, worker_a):
+    fanout.close()
+print(f"24. Worker fan-out: {received!r}, peers left {peers}, stuck peer resynced: {marked}, "
+      f"1000 publishes took {publish_ms:.0f} ms")
+assert received == b'invalidate' and peers == ['test-b.sock']
+assert marked == (True, False) and resynced == [True]
+assert told == [('resync', {'ignore_queue': True})] and publish_ms < 1000
+
+# 25. Client files: fingerprinted, gzipped, immutable, and revalidated with a 304
+from services.static_assets import StaticAssets
+assets = StaticAssets()
+assets.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+css = '/' + assets.urls['css/style.css']
+with app.test_request_context(css, headers={'Accept-Encoding': 'gzip, br'}):
+    first = assets.response(css[1:])
+with app.test_request_context(css, headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.get_etag()[0]}):
+    again = assets.response(css[1:])
+with app.test_request_context('/'):
+    page = assets.response('index.html').get_data(as_text=True)
+    worker = assets.response('sw.js').get_data(as_text=True)
+print(f"25. Static assets: {css} {first.content_length} bytes gzipped, revisit {again.status_code}")
+assert first.headers['Content-Encoding'] == 'gzip' and 'immutable' in first.headers['Cache-Control']
+assert again.status_code == 304 and f'href="{css}"' in page
+assert worker.startswith(f'const ASSET_VERSION = "{assets.version}";') and css in worker
+
+# 26. Batch check-in: per-record results, and a resent batch is answered from its keys
+from datetime import datetime, timedelta
+r = client.post('/api/session/start', json={'course_code': 'CSC601'})
+token = scan_qr('CSC601')
+started_at = r.get_json()['session']['start_time']
+captured = (datetime.utcnow() - timedelta(minutes=1)).isoformat() + 'Z'
+queued = [
+    {'idempotency_key': 'k-1', 'student_id': 'CSC/2023/001', 'device_uuid': 'test-002',
+     'session_token': token, 'captured_at': captured},
+    {'idempotency_key': 'k-2', 'student_id': 'NOBODY', 'device_uuid': 'x',
+     'session_token': token, 'captured_at': captured},
+]
+first = [res['status'] for res in client.post('/api/check-in/batch', json={'check_ins': queued}).get_json()['results']]
+resent = client.post('/api/check-in/batch', json={'check_ins': queued + [dict(queued[0], idempotency_key='k-3')]})
+results = resent.get_json()['results']
+print(f"26. Batch check-in: {first} then resent {[res['status'] for res in results]}")
+assert first == [201, 404] and [res['status'] for res in results] == [200, 404, 409]
+# The phone's clock is not trusted: recorded when it arrived, captured_at only echoed
+batch_timestamp = results[0]['attendance']['timestamp']
+assert batch_timestamp >= started_at and results[0]['attendance']['status'] == 'present'
+client.post('/api/session/end', json={'course_code': 'CSC601'})
+# Backdating a check-in neither makes it present nor revives an expired QR token
+static_token = client.post('/api/session/start', json={'course_code': 'CSC602'}).get_json()['session']['session_token']
+token = scan_qr('CSC602')
+with app.app_context():
+    from services.cache import validation_cache
+    from services.checkin import qr_token_for
+    from utils.security import current_window
+    stale_qr = qr_token_for(validation_cache.get_session(static_token),
+                            current_window(app.config['QR_REFRESH_INTERVAL']) - 20)
+app.config['LATE_THRESHOLD_MINUTES'] = 0
+late = client.post('/api/check-in/batch', json={'check_ins': [
+    {'idempotency_key': 'k-4', 'student_id': 'CSC/2023/002', 'device_uuid': 'test-003',
+     'session_token': stale_qr, 'captured_at': captured},
+    {'idempotency_key': 'k-5', 'student_id': 'CSC/2023/002', 'device_uuid': 'test-003',
+     'session_token': token, 'captured_at': captured},
+]}).get_json()['results']
+app.config['LATE_THRESHOLD_MINUTES'] = 15
+assert late[0]['status'] == 404 and late[1]['attendance']['status'] == 'late'
+assert late[1]['captured_at'] < late[1]['attendance']['timestamp']
+client.post('/api/session/end', json={'course_code': 'CSC602'})
+
+# 27. Roster import: valid rows enrolled, conflicts skipped and reported by line
+from models import Student
+from utils.security import verify_pin
+roster = (
+    "Student_ID,Name,Device_UUID,PIN\n"
+    "CSC/2024/100,Amaka Eze,roster-dev-1,4321\n"
+    "CSC/2023/001,John Doe,,\n"
+    "CSC/2024/101,Bola Ade,roster-dev-1,\n"
+    "CSC/2024/100,Amaka Again,,\n"
+    "CSC/2024/102,,,\n"
+    "CSC/2024/103,Chidi Okafor,,\n"
+)
+r = client.post('/api/students/import', data=roster.encode(), content_type='text/csv')
+report = r.get_json()
+reasons = {c['line']: c['reason'] for c in report['report']}
+print(f"27. Roster import: {report['imported']} of {report['rows']} enrolled, {report['conflicts']} conflicts")
+assert r.status_code == 200 and (report['imported'], report['conflicts']) == (2, 4)
+assert 'already enrolled' in reasons[3] and 'device_uuid' in reasons[4] and 'required' in reasons[6]
+with app.app_context():
+    imported = Student.query.filter_by(student_id='CSC/2024/100').one()
+    assert imported.device_uuid == 'roster-dev-1' and verify_pin('4321', imported.pin_hash)
+r = client.post('/api/students/import', data=b'matric,name\n', content_type='text/csv')
+assert r.status_code == 400
+# Enrollments that land while the file is being read are reported, not a 500
+from services.roster import import_roster
+
+def racing_roster():
+    yield 'student_id,name,device_uuid\n'
+    yield 'CSC/2024/200,Early Bird,\n'
+    with db.engine.begin() as conn:
+        conn.execute(Student.__table__.insert(), [
+            {'student_id': 'CSC/2024/201', 'name': 'Raced In', 'device_uuid': None},
+            {'student_id': 'CSC/2024/299', 'name': 'Device Taken', 'device_uuid': 'race-dev'},
+        ])
+    yield 'CSC/2024/201,Raced Late,\n'
+    yield 'CSC/2024/202,Device Clash,race-dev\n'
+    yield 'CSC/2024/203,Last One,\n'
+
+with app.app_context():
+    raced = import_roster(racing_roster())
+assert (raced['imported'], raced['conflicts']) == (2, 2)
+assert [(c['line'], c['reason'].split()[0]) for c in raced['report']] == [(3, 'student_id'), (4, 'device_uuid')]
+
+# 28. CSV export: streamed, one row per record, filtered by course and date
+import csv
+import io
+r = client.get('/api/attendance/export?course=CSC601')
+exported = list(csv.DictReader(io.StringIO(r.get_data(as_text=True))))
+print(f"28. CSV export: {len(exported)} CSC601 record(s)")
+assert r.mimetype == 'text/csv' and 'CSC601' in r.headers['Content-Disposition']
+assert [(row['student_id'], row['course_code']) for row in exported] == [('CSC/2023/001', 'CSC601')]
+assert exported[0]['timestamp'] == batch_timestamp
+r = client.get('/api/attendance/export?course=CSC601&to=2000-01-01')
+assert r.get_data(as_text=True).strip() == ','.join(('session_id', 'course_code', 'session_start',
+                                                    'student_id', 'name', 'timestamp', 'status'))
+assert client.get('/api/attendance/export?from=yesterday').status_code == 400
+assert client.get('/api/attendance/export?session_id=abc').status_code == 400
+# A name that a spreadsheet would run as a formula is exported as text
+client.post('/api/enroll', json={'student_id': 'CSC/2024/666', 'name': '=HYPERLINK("x")',
+                                 'device_uuid': 'formula-001'})
+csc603 = client.post('/api/session/start', json={'course_code': 'CSC603'}).get_json()['session']['id']
+client.post('/api/attendance/override', json={'student_id': 'CSC/2024/666', 'session_id': csc603,
+                                              'status': 'present'})
+client.post('/api/session/end', json={'course_code': 'CSC603'})
+r = client.get(f'/api/attendance/export?session_id={csc603}')
+assert [row['name'] for row in csv.DictReader(io.StringIO(r.get_data(as_text=True)))] == ['\'=HYPERLINK("x")']
+
+# 29. Course summary: kept in step by check-ins and overrides; a rebuild agrees
+from models import CourseSummary
+csc601 = int(exported[0]['session_id'])
+summary = client.get('/api/courses/CSC601/summary').get_json()
+john = summary['students'][0]
+assert (john['student_id'], john['present'] + john['late'], john['last_seen']) == ('CSC/2023/001', 1, batch_timestamp)
+client.post('/api/attendance/override', json={'student_id': 'CSC/2023/001', 'session_id': csc601, 'status': 'flagged'})
+flagged = client.get('/api/courses/CSC601/summary').get_json()['students'][0]
+client.post('/api/attendance/override', json={'student_id': 'CSC/2023/001', 'session_id': csc601, 'status': 'absent'})
+emptied = client.get('/api/courses/CSC601/summary').get_json()
+with app.app_context():
+    # Only the record test 15 wrote behind the app's back was missed
+    differences = CourseSummary.rebuild(), CourseSummary.rebuild()
+print(f"29. Course summary: {summary['total']} student(s) over {summary['sessions']} session(s), "
+      f"rebuild found {differences[0]} difference(s), then {differences[1]}")
+assert (flagged['present'], flagged['late'], flagged['flagged']) == (0, 0, 1)
+assert emptied['total'] == 0 and differences == (1, 0)
+assert client.get('/api/courses/NOPE/summary').status_code == 404
+
+# 30. Concurrent sessions: the registry answers per course, without queries
+client.get('/api/session/active')  # load the registry
+before = client.get('/api/session/active').headers['ETag']
+for course in ('CSC701', 'MTH701'):
+    client.post('/api/session/start', json={'course_code': course})
+r = client.get('/api/session/active?course_code=MTH701')
+mth = r.get_json()['session']
+timing = r.headers.get('Server-Timing', '')
+listed = client.get('/api/session/active').get_json()
+qr = client.get('/api/session/qr?course_code=CSC701').get_json()
+conflict = client.post('/api/session/start', json={'course_code': 'MTH701'})
+print(f"30. Concurrent sessions: {[s['course_code'] for s in listed['sessions']]}, {timing!r}")
+assert mth['course_code'] == 'MTH701' and '0 queries' in timing
+assert [s['course_code'] for s in listed['sessions']] == ['CSC701', 'MTH701']
+assert listed['session']['course_code'] == 'CSC701'
+assert qr['course_code'] == 'CSC701' and qr['session_id'] == listed['sessions'][0]['id']
+assert conflict.status_code == 409 and conflict.get_json()['session']['id'] == mth['id']
+client.post('/api/session/end', json={'course_code': 'MTH701'})
+r = client.get('/api/session/active?course_code=MTH701', headers={'If-None-Match': before})
+assert r.status_code == 200 and not r.get_json()['active']
+assert client.get('/api/session/active').get_json()['sessions'][0]['course_code'] == 'CSC701'
+client.post('/api/session/end', json={'course_code': 'CSC701'})
+# Another worker's start, not yet in this registry: the database still refuses a second one
+from sqlalchemy.exc import IntegrityError
+from models import Session
+with app.app_context():
+    db.session.add(Session(course_code='CSC801', session_token='from-another-worker'))
+    db.session.commit()
+    try:
+        db.session.add(Session(course_code='CSC801', session_token='racing-worker'))
+        db.session.commit()
+        raced = True
+    except IntegrityError:
+        db.session.rollback()
+        raced = False
+conflict = client.post('/api/session/start', json={'course_code': 'CSC801'})
+assert not raced and conflict.status_code == 409
+assert conflict.get_json()['session']['session_token'] == 'from-another-worker'
+assert client.post('/api/session/end', json={'course_code': 'CSC801'}).status_code == 200
+
+# 31. Admission control: a flooding device gets 429s; overload is shed with 503s
+from services.admission import admission
+flood = {'student_id': 'CSC/2023/001', 'device_uuid': 'flood-001', 'session_token': 'nope'}
+app.config.update(ADMISSION_DEVICE_BURST=3, ADMISSION_DEVICE_RATE=0.01)
+statuses = [client.post('/api/check-in', json=flood).status_code for _ in range(5)]
+limited = client.post('/api/enroll', json={'student_id': 'X/1', 'name': 'X', 'device_uuid': 'flood-001'})
+app.config.update(ADMISSION_DEVICE_BURST=10, ADMISSION_DEVICE_RATE=1.0, ADMISSION_MAX_IN_FLIGHT=0)
+busy = client.post('/api/check-in/batch', json={'check_ins': [dict(flood, device_uuid='calm-001')]})
+app.config.update(ADMISSION_MAX_IN_FLIGHT=800, ADMISSION_MAX_QUEUE_DEPTH=0)
+shed = client.post('/api/check-in', json=dict(flood, device_uuid='calm-002'))
+app.config.update(ADMISSION_MAX_QUEUE_DEPTH=2000)
+text = client.get('/api/metrics').get_data(as_text=True)
+print(f"31. Admission control: {statuses}, then {busy.status_code} busy, {shed.status_code} shed")
+assert statuses == [404, 404, 404, 429, 429] and limited.status_code == 429
+assert 1 <= int(limited.headers['Retry-After']) <= 100 and limited.get_json()['retry_after'] > 0
+assert busy.status_code == 503 and shed.status_code == 503 and 'Retry-After' in shed.headers
+assert admission.in_flight == 0
+# A wait under 50 ms is still a wait: never reported as 0, which means "give up"
+from services.admission import AdmissionRejected
+assert AdmissionRejected('busy', 503, 0.02, 'queue_depth').retry_after_seconds() == 0.1
+assert 'admission_rejected_total{endpoint="check_in",reason="device_rate"} 2' in text
+assert 'admission_rejected_total{endpoint="check_in",reason="queue_depth"} 1' in text
+assert 'admission_rejected_total{endpoint="check_in_batch",reason="concurrency"} 1' in text
+
+# 32. Compact wire format: lossless apart from sub-second times, and smaller
+import json
+from services.wire import compact_room, emit_to_rooms, encode, expand, unpackb, wire_formats
+record = {'id': 70000, 'student_matric': 'CSC/2023/001', 'student_name': 'John Doe',
+          'timestamp': '2026-03-02T09:14:05.120381', 'status': 'late'}
+batch = {'session_id': 3, 'count': 41, 'records': [record] * 20}
+reply = {'success': True, 'message': 'Attendance recorded as late', 'attendance': record}
+packed = encode('attendance_batch', batch)
+decoded = expand(unpackb(packed))
+wire_formats.connect('sid-compact', 'compact')
+wire_formats.connect('sid-json', None)
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.sent = []
+
+    def emit(self, event, payload, room=None):
+        self.sent.append((event, room, payload))
+
+recorder = RecordingSocketIO()
+emit_to_rooms(recorder, 'session_attendance_count', {'session_id': 3, 'count': 41}, ['session_x'])
+plain = len(json.dumps(batch, separators=(',', ':')))
+print(f"32. Compact wire: batch of 20 {plain} -> {len(packed)} bytes, "
+      f"reply {len(json.dumps(reply))} -> {len(json.dumps(encode('check_in_response', reply)))}")
+assert decoded['records'][0] == dict(record, timestamp='2026-03-02T09:14:05')
+assert decoded['count'] == 41 and len(decoded['records']) == 20
+assert expand(encode('check_in_response', reply))['attendance']['status'] == 'late'
+assert len(packed) < plain / 2
+assert wire_formats.room_for('sid-compact', 'session_x') == compact_room('session_x')
+assert wire_formats.room_for('sid-json', 'session_x') == 'session_x'
+assert wire_formats.payload_for('sid-json', 'check_in_response', reply) is reply
+assert recorder.sent == [('session_attendance_count', ['session_x'], {'session_id': 3, 'count': 41}),
+                         ('session_attendance_count', ['session_x#compact'], [3, 41])]
+wire_formats.disconnect('sid-compact')
+assert not wire_formats.is_compact('sid-compact')
+
+# 33. Dashboard updates: every change is numbered; catch-up sends the changes since N
+from services.broadcaster import broadcaster
+
+class RecordingServer(RecordingSocketIO):
+    def start_background_task(self, task, *args):
+        pass
+
+    def sleep(self, seconds):
+        pass
+
+jane = late[1]['attendance']
+listing = client.get(f"/api/attendance/{jane['session_id']}").get_json()
+seen = listing['seq']
+client.post('/api/attendance/override', json={
+    'student_id': 'CSC/2023/002', 'session_id': jane['session_id'], 'status': 'flagged'})
+added = client.post('/api/attendance/override', json={
+    'student_id': 'CSC/2023/001', 'session_id': jane['session_id'], 'status': 'present'})
+client.post('/api/attendance/override', json={
+    'student_id': 'CSC/2023/001', 'session_id': jane['session_id'], 'status': 'absent'})
+removed_id = added.get_json()['attendance']['id']
+with app.app_context():
+    caught_up = broadcaster.changes_since(jane['session_id'], seen)
+    in_step = broadcaster.changes_since(jane['session_id'], caught_up['seq'])
+    broadcaster.socketio = recorder = RecordingServer()
+    broadcaster.publish(jane, 'CSC602')
+    broadcaster.publish(dict(jane, status='flagged', seq=jane['seq'] + 1), 'CSC602')
+    broadcaster.publish_removal(99999, jane['session_id'], 'CSC602', jane['seq'] + 2)
+    broadcaster._flush_later()
+    broadcaster.socketio = None
+sent = [payload for event, room, payload in recorder.sent
+        if event == 'attendance_batch' and 'lecturer_CSC602' in room]
+print(f"33. Dashboard updates: since {seen}, catch-up sent {len(caught_up['records'])} record(s), "
+      f"removed {caught_up.get('removed')}, now at {caught_up['seq']}")
+assert jane['seq'] == seen and [r['seq'] for r in listing['attendance']] == [seen]
+assert [(r['id'], r['status']) for r in caught_up['records']] == [(jane['id'], 'flagged')]
+assert caught_up['removed'] == [removed_id] and caught_up['seq'] == seen + 3
+assert in_step['records'] == [] and 'removed' not in in_step
+assert [(r['id'], r['status']) for r in sent[0]['records']] == [(jane['id'], 'flagged')]
+assert sent[0]['removed'] == [99999] and sent[0]['seq'] == jane['seq'] + 2
+
+# 34. An idempotency key reused for another session is refused, not taken as a duplicate
+client.post('/api/session/start', json={'course_code': 'CSC901'})
+client.post('/api/session/start', json={'course_code': 'CSC902'})
+ada_device = {'student_id': 'CSC/2023/034', 'device_uuid': 'test-034'}
+client.post('/api/enroll', json=dict(ada_device, name='Ada Obi'))
+first = client.post('/api/check-in', json=dict(
+    ada_device, session_token=scan_qr('CSC901'), idempotency_key='reused-key'))
+reused = client.post('/api/check-in', json=dict(
+    ada_device, session_token=scan_qr('CSC902'), idempotency_key='reused-key'))
+fresh = client.post('/api/check-in', json=dict(
+    ada_device, session_token=scan_qr('CSC902'), idempotency_key='fresh-key'))
+print(f"34. Reused idempotency key: {first.status_code}, {reused.status_code}, "
+      f"then {fresh.status_code} with a new key")
+assert (first.status_code, reused.status_code, fresh.status_code) == (201, 422, 201)
+client.post('/api/session/end', json={'course_code': 'CSC901'})
+client.post('/api/session/end', json={'course_code': 'CSC902'})
+
+# 35. Group commit: concurrent check-ins share one transaction; a failing batch
+# is retried one by one, so one bad record does not fail the others
+from services.writer import CheckInWriter, IdempotencyKeyConflict
+group_session = client.post('/api/session/start', json={'course_code': 'CSC950'}).get_json()['session']
+now = datetime.utcnow()
+app.config['CHECKIN_BATCH_INTERVAL_MS'] = 200
+with app.app_context():
+    writer = CheckInWriter()
+    writer.submit(90000, group_session['id'], 'CSC950', 'present', now).wait(10)  # starts the writer
+    before = dict(writer.stats)
+    barrier = threading.Barrier(20)
+    committed = []
+
+    def concurrent_check_in(student_pk):
+        barrier.wait()
+        pending = writer.submit(student_pk, group_session['id'], 'CSC950', 'present', now)
+        committed.append(pending.wait(10))
+
+    threads = [threading.Thread(target=concurrent_check_in, args=(90001 + i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    grouped = writer.stats['batches'] - before['batches'], writer.stats['records'] - before['records']
+
+    mixed = [writer.submit(90100 + i, group_session['id'], 'CSC950', 'present', now,
+                           'reused-key' if i == 2 else f"group-{i}") for i in range(5)]
+    outcomes = []
+    for pending in mixed:
+        try:
+            outcomes.append(pending.wait(10) is not None)
+        except IdempotencyKeyConflict:
+            outcomes.append('key conflict')
+app.config['CHECKIN_BATCH_INTERVAL_MS'] = 5
+count = client.get(f"/api/attendance/{group_session['id']}").get_json()['session']['attendance_count']
+print(f"35. Group commit: {grouped[1]} concurrent check-ins in {grouped[0]} transaction(s); "
+      f"failed batch retried one by one: {outcomes}")
+assert grouped == (1, 20) and len(set(committed)) == 20
+assert outcomes == [True, True, 'key conflict', True, True] and count == 25
+client.post('/api/session/end', json={'course_code': 'CSC950'})
 
 print("-" * 40)
-print("=== ALL 12 TESTS PASSED ===")
+print("=== ALL 35 TESTS PASSED ===")
@@ -1,8 +1,14 @@
 """
 QR code generation utility.
+
+Rendering is CPU work on the Pi, so render_qr() caches finished images by
+their data and render parameters; a rotating token is rendered once per
+window, not once per dashboard request.
 """
 import io
 import base64
+from functools import lru_cache
+from urllib.parse import quote
 import qrcode
 
 
@@ -28,3 +34,49 @@ def generate_qr_base64(data, box_size=10, border=2):
 
     img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
     return f"data:image/png;base64,{img_base64}"
+
+
+def generate_qr_svg(data, border=2):
+    """
+    Generate a QR code as a compact SVG data URI.
+
+    Each run of dark modules in a row becomes one stroked path segment, and
+    nothing is rasterized or PNG-encoded. The image scales to any size, so
+    there is no box_size.
+    """
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    matrix = qr.get_matrix()
+    size = len(matrix)
+    segments = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            segments.append(f"M{start} {y}h{x - start}")
+
+    svg = (
+        f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {size} {size}' "
+        f"shape-rendering='crispEdges'><rect width='{size}' height='{size}' fill='white'/>"
+        f"<path transform='translate(0 .5)' stroke='black' d='{''.join(segments)}'/></svg>"
+    )
+    return "data:image/svg+xml," + quote(svg, safe=" =:/',")
+
+
+@lru_cache(maxsize=64)
+def render_qr(data, image_format='png', box_size=10, border=2):
+    """Cached QR rendering as a data URI, in 'png' or 'svg' format."""
+    if image_format == 'svg':
+        return generate_qr_svg(data, border=border)
+    return generate_qr_base64(data, box_size=box_size, border=border)
@@ -3,6 +3,7 @@ Security utilities: token generation, HMAC signing, password hashing.
 """
 import hashlib
 import hmac
+import re
 import secrets
 import time
 from functools import wraps
@@ -29,6 +30,39 @@ def verify_hmac(payload_str, signature, secret):
     return hmac.compare_digest(expected, signature)
 
 
+def current_window(interval, now=None):
+    """Number of the `interval`-second rotation window containing `now` (epoch seconds)."""
+    if now is None:
+        now = time.time()
+    return int(now // interval)
+
+
+def generate_rotating_token(session_id, session_token, window, secret):
+    """
+    Token for one QR rotation window: "<session_id>.<window>.<signature>".
+    The signature is an HMAC of the session's secret token and the window
+    number, so it can be checked by computation alone and never reveals
+    the session token itself.
+    """
+    signature = generate_hmac(f"{session_token}:{window}", secret)[:32]
+    return f"{session_id}.{window}.{signature}"
+
+
+_ROTATING_TOKEN = re.compile(r'([0-9]{1,18})\.([0-9]{1,18})\.[0-9a-f]{32}')
+
+
+def parse_rotating_token(token):
+    """Split a rotating token into (session_id, window), or None if it is not one."""
+    # ASCII digits only: str.isdigit() also accepts '²', which int() rejects.
+    # At most 18 of them, so both numbers fit a 64-bit SQLite integer. The
+    # signature must look like one too: hmac.compare_digest() raises on
+    # non-ASCII text instead of returning False.
+    match = _ROTATING_TOKEN.fullmatch(token)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
 def hash_pin(pin):
     """Hash a PIN using SHA-256 with a salt."""
     salt = secrets.token_hex(16)